@@ -0,0 +1,148 @@
+"""
+Import time benchmark
+
+Imports each module in a fresh interpreter and reports how long the import
+took and which heavy dependencies it pulled in. Use this to check that widgets
+and applets do not import matplotlib, numpy or pyserial until they are used.
+
+Usage::
+
+    python benchmarks/importtime.py [--repeat N] [--tree] [module ...]
+
+Module names are relative to the labtronyxgui, application or applets
+directories (e.g. `widgets.vw_plots`, `include.ConfigPages`,
+`Type.oscilloscope`). The applets import a `Base_Applet` module that is not
+part of this tree, so they are not in the default list. `--tree` prints every import of the last run in the
+format of `python -X importtime` (self and cumulative time in microseconds,
+nested imports indented), which is not available on Python 2.
+"""
+
+import sys
+import os
+import json
+import subprocess
+import timeit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'labtronyxgui')
+
+PATHS = [ROOT,
+         os.path.join(ROOT, 'application'),
+         os.path.join(ROOT, 'applets')]
+
+DEFAULT_MODULES = ['widgets',
+                   'widgets.vw_plots',
+                   'include.ConfigPages']
+
+HEAVY_MODULES = ['matplotlib', 'pylab', 'numpy', 'serial']
+
+#===============================================================================
+# Child process
+#===============================================================================
+
+def child(moduleName):
+    """
+    Import a module with a timing hook installed and print the results as JSON
+    """
+    import __builtin__
+
+    for path in reversed(PATHS):
+        sys.path.insert(0, os.path.normpath(path))
+
+    real_import = __builtin__.__import__
+    records = [] # (depth, name, self time, cumulative time), innermost first
+    stack = [] # Time spent in timed child imports for each open import
+
+    def timed_import(name, *args, **kwargs):
+        before = len(sys.modules)
+        stack.append(0.0)
+        t_start = timeit.default_timer()
+
+        try:
+            return real_import(name, *args, **kwargs)
+
+        finally:
+            elapsed = timeit.default_timer() - t_start
+            children = stack.pop()
+
+            # Imports of modules that are already loaded are not reported
+            if len(sys.modules) != before:
+                records.append((len(stack), name, elapsed - children, elapsed))
+                if stack:
+                    stack[-1] += elapsed
+
+    result = {'module': moduleName, 'error': None}
+
+    __builtin__.__import__ = timed_import
+    t_start = timeit.default_timer()
+    try:
+        __import__(moduleName)
+    except Exception as e:
+        result['error'] = '%s: %s' % (e.__class__.__name__, e)
+    finally:
+        result['total'] = timeit.default_timer() - t_start
+        __builtin__.__import__ = real_import
+
+    result['heavy'] = [name for name in HEAVY_MODULES if sys.modules.get(name) is not None]
+    result['tree'] = records
+
+    sys.stdout.write(json.dumps(result))
+
+#===============================================================================
+# Parent process
+#===============================================================================
+
+def measure(moduleName):
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--child', moduleName],
+                            stdout=subprocess.PIPE)
+    out, _ = proc.communicate()
+
+    return json.loads(out)
+
+def printTree(result):
+    print 'import time: self [us] | cumulative | imported package'
+
+    for depth, name, t_self, t_cumulative in result['tree']:
+        print 'import time: %9d | %10d | %s%s' % (t_self * 1e6, t_cumulative * 1e6, '  ' * depth, name)
+
+def main(argv):
+    repeat = 5
+    tree = False
+    modules = []
+
+    args = list(argv)
+    while args:
+        arg = args.pop(0)
+
+        if arg == '--child':
+            return child(args.pop(0))
+        elif arg == '--repeat':
+            repeat = int(args.pop(0))
+        elif arg == '--tree':
+            tree = True
+        else:
+            modules.append(arg)
+
+    modules = modules or DEFAULT_MODULES
+
+    print 'Python %s, %d runs per module, fresh interpreter per run' % (sys.version.split()[0], repeat)
+    print
+    print '%-24s %10s %10s  %s' % ('module', 'min [ms]', 'median [ms]', 'heavy dependencies')
+
+    for moduleName in modules:
+        results = [measure(moduleName) for i in range(repeat)]
+        times = sorted(result['total'] * 1000.0 for result in results)
+        last = results[-1]
+
+        if last['error'] is not None:
+            print '%-24s %10s %10s  FAILED: %s' % (moduleName, '-', '-', last['error'])
+        else:
+            print '%-24s %10.1f %10.1f  %s' % (moduleName, times[0], times[len(times) // 2],
+                                              ', '.join(last['heavy']) or '-')
+
+        if tree:
+            print
+            printTree(last)
+            print
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
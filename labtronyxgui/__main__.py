@@ -1,6 +1,10 @@
 __author__ = 'kkennedy'
 
 import sys
+import time
+
+# Startup profiling starts here, not when a_Main is imported
+T_START = time.time()
 
 def main(args=None):
 
@@ -9,7 +13,7 @@ def main(args=None):
 
     try:
         from application.a_Main import a_Main
-        main_gui = a_Main()
+        main_gui = a_Main(t_start=T_START)
         main_gui.mainloop()
 
     except Exception as e:
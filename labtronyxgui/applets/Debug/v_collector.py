@@ -2,13 +2,13 @@ from Base_Applet import Base_Applet
 
 import Tkinter as Tk
 
+from common.lazyimport import lazy_import
+
 #debug
-import numpy as np
+np = lazy_import('numpy')
 
-import matplotlib
-matplotlib.use('TkAgg')
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2TkAgg
-from matplotlib.backend_bases import key_press_handler
+matplotlib = lazy_import('matplotlib', on_import=lambda mpl: mpl.use('TkAgg'))
+backend_tkagg = lazy_import('matplotlib.backends.backend_tkagg')
 
 class v_collector(Base_Applet):
     
@@ -47,7 +47,7 @@ class v_collector(Base_Applet):
         self.subplot_1 = self.fig.add_subplot(111)
         self.dataset_1 = self.subplot_1.plot(self.time_axis, self.data)
         self.subplot_1.grid(True)
-        self.canvas = FigureCanvasTkAgg(self.fig, master=self)
+        self.canvas = backend_tkagg.FigureCanvasTkAgg(self.fig, master=self)
         self.canvas.show()
         self.canvas.get_tk_widget().grid(row=0,column=0,columnspan=2)
 
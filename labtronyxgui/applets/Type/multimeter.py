@@ -26,6 +26,9 @@ class multimeter(Base_Applet):
         self.instr = self.getInstrument()
         prop = self.instr.getProperties()
         
+        # The measurement display and the plot share one read
+        self.hub = self.getSampleHub()
+        
         # Driver info
         self.w_info = vw_info.vw_DriverInfo(self, self.instr)
         self.w_info.grid(row=0, column=0, columnspan=2)
@@ -72,7 +75,7 @@ class multimeter(Base_Applet):
         
         # Current Value
         self.w_data = vw_entry.vw_LCD(self.f_data, 
-                                      get_cb=self.instr.getMeasurement,
+                                      get_cb=self.hub.subscribe('getMeasurement', 1.0),
                                       label="Measurement",
                                       update_interval=1000)
         self.w_data.grid(row=0, column=0)
@@ -83,7 +86,9 @@ class multimeter(Base_Applet):
         # Plot
         #=======================================================================
         self.w_graph = vw_plots.vw_Plot(self, title="Measurement")
-        self.w_graph.addPlot('Measurement', self.instr.getMeasurement)
+        self.w_graph.addPlot('Measurement', 
+                             self.hub.subscribe('getMeasurement', self.w_graph.sample_time,
+                                                depth=self.w_graph.max_samples))
         self.w_graph.grid(row=1, column=1, rowspan=2)
         
         
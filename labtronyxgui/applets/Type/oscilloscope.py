@@ -5,11 +5,11 @@ import csv
 import Tkinter as Tk
 import tkFileDialog
 
-import matplotlib
-import pylab
+from common.lazyimport import lazy_import
 
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2TkAgg
-from matplotlib.figure import Figure
+# matplotlib is imported when the applet window is opened
+matplotlib = lazy_import('matplotlib', on_import=lambda mpl: mpl.use('TkAgg'))
+backend_tkagg = lazy_import('matplotlib.backends.backend_tkagg')
 
 from widgets import *
 
@@ -31,8 +31,6 @@ class oscilloscope(Base_Applet):
         except:
             self.logger.exception("Unable to set timeout")
         
-        matplotlib.use('TkAgg')
-        
         # Driver info
         self.w_info = vw_info.vw_DriverInfo(self, self.instr)
         self.w_info.grid(row=0, sticky=Tk.W)
@@ -50,8 +48,8 @@ class oscilloscope(Base_Applet):
         # MatPlot Figure
         self.f_figure = Tk.Frame(self)
         Tk.Label(self.f_figure, text="Waveform Data").pack(side=Tk.TOP)
-        self.figure = Figure(frameon=False)#(figsize=(5,4), dpi=100)
-        self.canvas = FigureCanvasTkAgg(self.figure, self.f_figure)
+        self.figure = matplotlib.figure.Figure(frameon=False)#(figsize=(5,4), dpi=100)
+        self.canvas = backend_tkagg.FigureCanvasTkAgg(self.figure, self.f_figure)
         self.canvas.show()
         self.canvas.get_tk_widget().pack(side=Tk.TOP, fill=Tk.BOTH, expand=1)
         self.f_figure.grid(row=2)
@@ -255,15 +255,14 @@ class BDPC_Sensor(vw.vw_Base):
         self.update_interval = kwargs.get('update_interval', None)
         self._schedule_update()
 
-    def cb_update(self):
-        try:
-            val = self.instr.getSensorValue(self.sensor)
-            val = "{:.2f}".format(val)
-            
-            self.val.set(val)
-            
-        except:
-            self.l_data.config(bg="red")
+    def fetch(self):
+        return self.instr.getSensorValue(self.sensor)
+    
+    def apply(self, val):
+        self.val.set("{:.2f}".format(val))
+        
+    def apply_error(self, error):
+        self.l_data.config(bg="red")
             
     def get(self):
         return self.val.get()
@@ -1,16 +1,124 @@
 import sys
 import os
-import importlib
+import ast
+import json
 import copy
+import hashlib
+import importlib
+import logging
+
+"""
+Applet discovery
+
+Applets are found without importing them. The `info` dictionary of each
+applet class is read from the source with an AST scan, so heavy dependencies
+(matplotlib, numpy, serial, ...) are only imported when an applet is opened.
+Scan results are kept in a manifest keyed by file modification time and size,
+so unchanged applets are not parsed again on the next start.
+
+Imported applet modules are kept in an :class:`AppletCache`, which only
+reloads a module when its source file has changed. :class:`AppletIndex` maps
+drivers and resource types to compatible applets.
+"""
+
+MANIFEST_VERSION = 1
+
+def getAppletRoot():
+    return os.path.dirname(os.path.realpath(os.path.join(__file__, os.curdir))) # Resolves symbolic links
+
+def getAppletPath(moduleName):
+    """
+    Get the source file of an applet module
+
+    :param moduleName: Applet module name relative to the applets package (e.g. 'Type.multimeter')
+    :type moduleName: str
+    :returns: str
+    """
+    return os.path.join(getAppletRoot(), *moduleName.split('.')) + '.py'
+
+def scanApplet(filepath, className):
+    """
+    Read the `info` attribute of an applet class without importing the module
+
+    :param filepath: Applet source file
+    :type filepath: str
+    :param className: Name of the applet class
+    :type className: str
+    :returns: dict
+    :raises: SyntaxError if the file cannot be parsed, ValueError if the class
+             or a literal `info` dictionary is not found
+    """
+    with open(filepath, 'rb') as f:
+        tree = ast.parse(f.read(), filepath)
+
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and node.name == className:
+            for stmt in node.body:
+                if isinstance(stmt, ast.Assign):
+                    if any(getattr(target, 'id', None) == 'info' for target in stmt.targets):
+                        info = ast.literal_eval(stmt.value)
+
+                        if not isinstance(info, dict):
+                            raise ValueError('info is not a dictionary')
+
+                        return info
+
+            raise ValueError('Class %s has no literal info dictionary' % className)
+
+    raise ValueError('Class %s not found' % className)
+
+def _loadManifest(manifest):
+    try:
+        with open(manifest, 'rb') as f:
+            data = json.load(f)
+
+        if data.get('version') == MANIFEST_VERSION:
+            return data.get('applets', {})
+
+    except (IOError, ValueError):
+        pass
+
+    return {}
 
-def getAllApplets():
+def _saveManifest(manifest, entries):
+    try:
+        dirname = os.path.dirname(manifest)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        # Write to a temporary file first so a crash cannot leave a broken manifest
+        temp = manifest + '.tmp'
+        with open(temp, 'wb') as f:
+            json.dump({'version': MANIFEST_VERSION, 'applets': entries}, f)
+
+        if os.path.exists(manifest):
+            os.remove(manifest)
+        os.rename(temp, manifest)
+
+    except (IOError, OSError):
+        pass
+
+def getAllApplets(manifest=None, logger=logging):
+    """
+    Find all applets and read their `info` without importing them. Applets that
+    cannot be read are logged and skipped.
+
+    :param manifest: Manifest file used to cache scan results, None to disable
+    :type manifest: str
+    :param logger: Logger instance if you wish to override the internal instance
+    :type logger: Logging.logger
+    :returns: dict - Applet module name -> info
+    """
     applets = {}
-    
-    canpath = os.path.dirname(os.path.realpath(os.path.join(__file__, os.curdir))) # Resolves symbolic links
-    
+
+    canpath = getAppletRoot()
+
     if not canpath in sys.path:
         sys.path.append(canpath)
-        
+
+    cached = _loadManifest(manifest) if manifest is not None else {}
+    entries = {}
+
     for dir in os.walk(canpath):
         dirpath, dirnames, filenames = dir
 
@@ -18,38 +126,220 @@ def getAllApplets():
         if len(dir[2]) == 0:
             # Directory is empty, move on
             continue
-        
+
         elif '__init__.py' not in filenames:
             # Directory must be a python module
-            try:
-                with file.open(os.path.join(dirpath, "__init__.py"), "w"):
-                    pass
-            except:
-                continue
-        
+            continue
+
         for file in filenames:
             # Iterate through each file
             filepath = os.path.join(dirpath, file)
             modulepath, fileExtension = os.path.splitext(filepath)
             if fileExtension in ['.py'] and '__init__' not in file:
                 # Get module name from relative path
-                
+
                 com_pre = os.path.commonprefix([canpath, filepath])
                 r_path = modulepath.replace(com_pre + os.path.sep, '')
                 moduleName = r_path.replace(os.path.sep, '.')
                 fileName, _ = os.path.splitext(file)
 
-                # Attempt to load the view
                 try:
-                    testModule = importlib.import_module('applets.' + moduleName)
-                
-                    # Check to make sure the correct class exists
-                    testClass = getattr(testModule, fileName) # Will raise exception if doesn't exist
-                    
-                    info = copy.deepcopy(testClass.info)
-                    applets[moduleName] = info
-                
+                    stat = os.stat(filepath)
+                    entry = cached.get(moduleName)
+
+                    if (entry is None or entry.get('mtime') != stat.st_mtime or
+                            entry.get('size') != stat.st_size):
+                        # Check to make sure the correct class exists
+                        info = scanApplet(filepath, fileName)
+                        entry = {'mtime': stat.st_mtime, 'size': stat.st_size, 'info': info}
+
+                    entries[moduleName] = entry
+                    applets[moduleName] = copy.deepcopy(entry['info'])
+
                 except Exception as e:
-                    raise
-            
+                    logger.warning("Skipping applet %s: %s", moduleName, e)
+
+    if manifest is not None and entries != cached:
+        _saveManifest(manifest, entries)
+
     return applets
+
+class AppletCache(object):
+    """
+    Imports applet modules once and keeps them. A module is reloaded only when
+    the modification time or size of its source file changed and the content
+    hash differs, so touching a file does not reload it.
+
+    :param logger: Logger instance if you wish to override the internal instance
+    :type logger: Logging.logger
+    """
+
+    def __init__(self, logger=logging):
+        self.logger = logger
+
+        # Module name -> (module, mtime, size, digest)
+        self._modules = {}
+
+    @staticmethod
+    def _digest(filepath):
+        with open(filepath, 'rb') as f:
+            return hashlib.md5(f.read()).hexdigest()
+
+    def getModule(self, moduleName):
+        """
+        Get an applet module, importing it on first use and reloading it if
+        the source file has changed
+
+        :param moduleName: Applet module name (e.g. 'Type.multimeter')
+        :type moduleName: str
+        :returns: module
+        """
+        filepath = getAppletPath(moduleName)
+        entry = self._modules.get(moduleName)
+
+        if entry is None:
+            stat = os.stat(filepath)
+            module = importlib.import_module(moduleName)
+            self._modules[moduleName] = (module, stat.st_mtime, stat.st_size,
+                                         self._digest(filepath))
+            return module
+
+        module = entry[0]
+        if self.isChanged(moduleName):
+            self.reload(moduleName)
+            module = self._modules[moduleName][0]
+
+        return module
+
+    def getClass(self, moduleName):
+        """
+        Get the applet class of an applet module
+
+        :returns: class
+        """
+        module = self.getModule(moduleName)
+
+        return getattr(module, moduleName.split('.')[-1])
+
+    def isChanged(self, moduleName):
+        """
+        Check if the source file of a loaded module has changed. Files with a
+        new modification time but the same content are not reported, their
+        stamp is updated instead.
+
+        :returns: bool
+        """
+        entry = self._modules.get(moduleName)
+        if entry is None:
+            return False
+
+        module, mtime, size, digest = entry
+        filepath = getAppletPath(moduleName)
+
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            # Deleted, keep using the loaded module
+            return False
+
+        if stat.st_mtime == mtime and stat.st_size == size:
+            return False
+
+        new_digest = self._digest(filepath)
+        if new_digest == digest:
+            self._modules[moduleName] = (module, stat.st_mtime, stat.st_size, digest)
+            return False
+
+        return True
+
+    def reload(self, moduleName):
+        """
+        Reload a module. Windows opened before the reload keep using the old
+        classes. If the new source raises, the old module stays in use.
+        """
+        module = self._modules[moduleName][0]
+        filepath = getAppletPath(moduleName)
+        stat = os.stat(filepath)
+        digest = self._digest(filepath)
+
+        try:
+            module = reload(module)
+
+        finally:
+            # A broken file is not retried until it changes again
+            self._modules[moduleName] = (module, stat.st_mtime, stat.st_size, digest)
+
+        self.logger.info("Reloaded applet: %s", moduleName)
+
+    def getChanged(self):
+        """
+        Get all loaded modules whose source files have changed
+
+        :returns: list of module names
+        """
+        return [moduleName for moduleName in self._modules.keys()
+                if self.isChanged(moduleName)]
+
+class AppletIndex(object):
+    """
+    Inverted index from drivers and resource types to compatible applets,
+    built from the `validDrivers` and `validResourceTypes` of the applet info.
+
+    :param applets: Applet module name -> info, as returned by getAllApplets
+    :type applets: dict
+    """
+
+    def __init__(self, applets=None):
+        self.byDriver = {}
+        self.byResourceType = {}
+
+        self._info = {}
+
+        for moduleName, info in (applets or {}).items():
+            self.update(moduleName, info)
+
+    def update(self, moduleName, info):
+        """
+        Add an applet or replace the info of an applet that was reloaded
+        """
+        self.remove(moduleName)
+        self._info[moduleName] = info
+
+        for driver in info.get('validDrivers', []):
+            self.byDriver.setdefault(driver, set()).add(moduleName)
+
+        for resType in info.get('validResourceTypes', []):
+            self.byResourceType.setdefault(resType, set()).add(moduleName)
+
+    def remove(self, moduleName):
+        info = self._info.pop(moduleName, None)
+        if info is None:
+            return
+
+        for key, index in [('validDrivers', self.byDriver),
+                           ('validResourceTypes', self.byResourceType)]:
+            for value in info.get(key, []):
+                modules = index.get(value)
+                if modules is not None:
+                    modules.discard(moduleName)
+                    if len(modules) == 0:
+                        del index[value]
+
+    def getCompatible(self, driver=None, resourceType=None):
+        """
+        Get the applets that can control a resource. Applets written for the
+        driver come first, followed by generic applets for the resource type.
+
+        :param driver: Driver module name
+        :type driver: str
+        :param resourceType: Resource type
+        :type resourceType: str
+        :returns: list of applet module names
+        """
+        compatible = sorted(self.byDriver.get(driver, []))
+
+        for moduleName in sorted(self.byResourceType.get(resourceType, [])):
+            if moduleName not in compatible:
+                compatible.append(moduleName)
+
+        return compatible
@@ -1,8 +1,13 @@
+import time
+
+# Taken before any other import so startup profiling includes the imports
+T_START = time.time()
+
 import sys
 import os
 import logging
-import importlib
 import copy
+import threading
 
 import Tkinter as Tk
 import ttk
@@ -14,25 +19,62 @@ import tkMessageBox
 sys.path.append("..")
 from InstrumentManager import InstrumentManager
 from LabManager import LabManager
+from common.index import ResourceIndex
+from common.loghandlers import ConsoleHandler, JsonFileHandler
+from common.profiler import StartupProfiler
+from common.rpc.discovery import HostDiscovery
 
 from include import *
 
+T_IMPORTED = time.time()
+
 class a_Main(Tk.Tk):
     """
     Main application for 
     TODO:
-    - Splash screen on load (http://code.activestate.com/recipes/534124-elegant-tkinter-splash-screen/)
     - Toolbar (http://zetcode.com/gui/tkinter/menustoolbars/)
     - Instrument Nicknames
-    - Persistant settings
     - Nanny thread to periodically check if connected hosts and resources are still active
     """
     applets = {}  # Module name -> View info
     openApplets = {}
     
-    def __init__(self, master=None):
+    # Background refresh interval and the age at which the displayed resources
+    # are marked as stale (seconds)
+    REFRESH_INTERVAL = 30.0
+    REFRESH_STALE_AGE = 60.0
+    
+    # Time between checks for changed applet files in developer mode (ms)
+    APPLET_WATCH_INTERVAL = 1000
+    
+    # Time between handling notifications decoded by the notification pump (ms)
+    NOTIFICATION_INTERVAL = 50
+    
+    # Time between checks of applets running in their own process (ms)
+    APPLET_HOST_INTERVAL = 500
+    
+    # Time between saves of the session while running (seconds)
+    SESSION_SAVE_INTERVAL = 300.0
+    
+    def __init__(self, master=None, **kwargs):
+        t_tk = time.time()
         Tk.Tk.__init__(self, master)
         
+        # Time every startup phase from process start, the report is saved
+        # when the tree is first populated. Entry scripts that import this
+        # module pass the time they started as t_start.
+        t_start = kwargs.get('t_start', T_START)
+        self.profiler = StartupProfiler(t_start)
+        self.profiler.addPhase('imports', t_start, T_IMPORTED)
+        self.profiler.addPhase('tk_init', t_tk, time.time())
+        self.startupReport = os.path.join(os.path.expanduser('~'), '.labtronyx', 'startup.jsonl')
+        
+        # Developer mode reloads applets as soon as their files change
+        self.developer = kwargs.get('developer', False)
+        
+        # Run each applet in its own process
+        self.appletProcesses = kwargs.get('applet_processes', False)
+        
         # Get root directory
         # Get the root path
         can_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.path.pardir)  # Resolves symbolic links
@@ -45,38 +87,207 @@ class a_Main(Tk.Tk):
         # TODO: Log to console?
         #console = logging.StreamHandler(stream=sys.stdout)
         #self.logger.addHandler(console)
-        # TODO: Log to file?
         
-        # Load applets
-        import applets
-        self.applets = applets.getAllApplets()
+        # Persistent log, written by a background thread
+        self.logFile = os.path.join(os.path.expanduser('~'), '.labtronyx', 'logs', 'labtronyx-gui.jsonl')
+        try:
+            self.h_fileHandler = JsonFileHandler(self.logFile)
+            self.logger.addHandler(self.h_fileHandler)
+        except (IOError, OSError):
+            self.h_fileHandler = None
         
-        for applet in self.applets.keys():
-            self.logger.debug("Found Applet: %s", applet)
+        # Hosts, resources, open applets and geometry from the last session
+        self.session = Session.Session(os.path.join(os.path.expanduser('~'), '.labtronyx', 'session.json'),
+                                       logger=self.logger)
+        self.session.load()
+        cachedSnapshot = self.session.getSnapshot()
         
-        # Instantiate a LabManager
-        import socket
-        localhost = socket.gethostname()
+        # Show a splash screen until the main window is ready
+        self.withdraw()
+        self.splash = Splash(self)
+        self.splash.setProgress('Loading applets and connecting to instrument managers...', 10)
         
+        import socket
+        self.localhost = socket.gethostname()
         self.lab = LabManager()
-        if not self.lab.addManager(localhost):
-            # Instantiate a local InstrumentManager object
-            self.local_manager = InstrumentManager()
-            self.local_manager.start()
-            self.lab.addManager(localhost)
+        self.managersReady = False
+        
+        # Applet discovery and the manager connection are independent
+        self.startupErrors = []
+        self.startupApplets = threading.Thread(target=self._startup_applets, name='StartupApplets')
+        self.startupManagers = threading.Thread(target=self._startup_managers, name='StartupManagers',
+                                                args=(self.session.getHosts(),))
+        startup = [self.startupApplets, self.startupManagers]
+        for thread in startup:
+            thread.daemon = True
+            thread.start()
             
-        # Register new resource callback on local manager
-        man = self.lab.getManager(localhost)
-        if man is not None:
-            man._registerCallback('event_new_resource', lambda: self.cb_event_new_resource())
+        # With a cached snapshot, the window is shown without waiting for the
+        # managers
+        if cachedSnapshot is not None:
+            wait = [self.startupApplets]
+        else:
+            wait = startup
+            
+        while any(thread.is_alive() for thread in wait):
+            done = len([thread for thread in startup if not thread.is_alive()])
+            self.splash.setProgress(None, 10 + 35 * done)
+            self.update()
+            time.sleep(0.02)
+            
+        if len(self.startupErrors) > 0:
+            self.splash.destroy()
+            exc_type, exc_value, exc_tb = self.startupErrors[0]
+            raise exc_type, exc_value, exc_tb
+            
+        self.splash.setProgress('Building main window...', 80)
+            
+        with self.profiler.phase('build'):
+            # Cached resource properties and search index, filled by the refresh
+            # worker. Invalidated properties are served until it brings new ones.
+            self.properties = PropertyStore.PropertyStore(refresh=lambda: self.refreshWorker.request())
+            self.index = ResourceIndex()
+            
+            # GUI Startup
+            self.rebuild()
+            self.rebind()
+            
+            geometry = self.session.getGeometry()
+            if geometry is not None:
+                self.geometry(geometry)
+        
+        # Refresh the LabManager in the background, the tree is populated when
+        # the first snapshot arrives
+        self.lastSnapshot = None
+        self.liveSnapshot = False
+        self.lastSessionSave = time.time()
+        self.refreshWorker = LabWorkers.RefreshWorker(self.lab, 
+                                                      interval=self.REFRESH_INTERVAL,
+                                                      logger=self.logger)
+        self.refreshWorker.start()
         
-        # GUI Startup
-        self.rebuild()
-        self.rebind()
+        # Notifications are received and decoded in the background
+        self.notificationPump = LabWorkers.NotificationPump(self.lab, logger=self.logger)
         
-        # TODO: Persistent Settings
+        # Changed resources are fetched one by one, without a full refresh
+        self.propertyFetcher = LabWorkers.PropertyFetcher(self.lab, logger=self.logger)
+        self.propertyFetcher.start()
         
+        # Find InstrumentManagers on the network in the background
+        self.discovery = HostDiscovery(logger=self.logger)
+        self.discovery.start()
+        
+        if cachedSnapshot is not None:
+            # Show the lab as it was left until the managers answer
+            self.apply_snapshot(cachedSnapshot)
+            self.profiler.mark('cached_snapshot')
+        
+        self.process_startup()
         self.process_notifications()
+        self.process_snapshots()
+        
+        if self.developer:
+            self.process_applet_changes()
+            
+        if self.appletProcesses:
+            self.process_applet_hosts()
+            
+        self.splash.destroy()
+        self.deiconify()
+        self.update_idletasks()
+        self.profiler.mark('first_frame')
+        
+    def _startup_applets(self):
+        """
+        Find applets, modules are imported when an applet is opened. Runs in a
+        startup thread.
+        """
+        try:
+            with self.profiler.phase('applet_discovery'):
+                import applets
+                manifest = os.path.join(os.path.expanduser('~'), '.labtronyx', 'applets.manifest.json')
+                self.applets = applets.getAllApplets(manifest, logger=self.logger)
+                self.appletCache = applets.AppletCache(logger=self.logger)
+                self.appletIndex = applets.AppletIndex(self.applets)
+                
+                for applet in self.applets.keys():
+                    self.logger.debug("Found Applet: %s", applet)
+                    
+        except:
+            self.startupErrors.append(sys.exc_info())
+            
+    def _startup_managers(self, hosts=[]):
+        """
+        Connect to the local InstrumentManager, starting one if there is none,
+        and reconnect to the hosts from the last session. Runs in a startup
+        thread.
+        
+        :param hosts: Remote hosts to reconnect to
+        :type hosts: list
+        """
+        try:
+            with self.profiler.phase('manager_connect'):
+                if not self.lab.addManager(self.localhost):
+                    # Instantiate a local InstrumentManager object
+                    with self.profiler.phase('local_manager_start'):
+                        self.local_manager = InstrumentManager()
+                        self.local_manager.start()
+                        self.lab.addManager(self.localhost)
+                        
+                        self._enableLocalDiscovery()
+                        
+        except:
+            self.startupErrors.append(sys.exc_info())
+            return
+        
+        with self.profiler.phase('session_hosts'):
+            for host in hosts:
+                if host == self.localhost:
+                    continue
+                
+                try:
+                    if not self.lab.addManager(host):
+                        self.logger.warning("Unable to reconnect to host: %s", host)
+                except Exception:
+                    self.logger.exception("Unable to reconnect to host: %s", host)
+                    
+    def _enableLocalDiscovery(self):
+        """
+        Let other computers find the InstrumentManager started by this window.
+        Only possible if the manager exposes its RpcServer as `rpc_server`,
+        managers without it must enable discovery themselves.
+        """
+        server = getattr(self.local_manager, 'rpc_server', None)
+        
+        if server is not None and hasattr(server, 'enableDiscovery'):
+            server.enableDiscovery()
+        else:
+            self.logger.info("Local InstrumentManager does not support host discovery")
+            
+    def process_startup(self):
+        """
+        Wait for the startup thread to connect to the managers, then start
+        refreshing and receiving notifications. Runs in the Tk thread.
+        """
+        if self.startupManagers.is_alive():
+            self.after(100, self.process_startup)
+            return
+        
+        if len(self.startupErrors) > 0:
+            exc_type, exc_value, exc_tb = self.startupErrors[0]
+            self.logger.error("Unable to connect to InstrumentManager", 
+                              exc_info=(exc_type, exc_value, exc_tb))
+            tkMessageBox.showerror(exc_type.__name__, 
+                                   'Unable to connect to InstrumentManager: %s' % exc_value)
+        
+        # Register notification callbacks on all managers
+        for address, man in self.lab.getManager().items():
+            self.register_callbacks(man)
+        
+        self.managersReady = True
+        self.notificationPump.start()
+        self.refreshWorker.request()
+        self.update_status()
     
     def rebuild(self):
         """
@@ -111,6 +322,7 @@ class a_Main(Tk.Tk):
         self.m_File.add_command(label='Connect to host...', command=lambda: self.cb_managerConnect())
         self.m_File.add_command(label='Refresh all hosts...', command=lambda: self.cb_refreshTree())
         self.m_File.add_separator()
+        self.m_File.add_command(label='View log...', command=lambda: self.cb_viewLog())
         # File - LogLevel
         self.m_File_LogLevel = Tk.Menu(self.m_File)
         self.m_File.add_cascade(menu=self.m_File_LogLevel, label='Log Level')
@@ -150,7 +362,7 @@ class a_Main(Tk.Tk):
         #     Treeview Frame
         #     Min size: 400px
         #=======================================================================
-        self.treeFrame = ResourceTree(self.HPane, self.lab)  # , highlightcolor='green', highlightthickness=2)
+        self.treeFrame = ResourceTree(self.HPane, self.lab, self.index)  # , highlightcolor='green', highlightthickness=2)
         # self.VPane.add(self.treeFrame, width=800, minsize=400)
         self.HPane.add(self.treeFrame, width=600, minsize=400)
         
@@ -210,8 +422,17 @@ class a_Main(Tk.Tk):
     def cb_exitWindow(self):
         try:
             if tkMessageBox.askokcancel("Quit", "Do you really wish to quit?"):
+                self.save_session()
+                self.refreshWorker.stop()
+                self.notificationPump.stop()
+                self.propertyFetcher.stop()
+                self.discovery.stop()
+                self.close_applet_hosts()
                 if hasattr(self, 'local_manager'):
                     self.local_manager.stop()
+                if self.h_fileHandler is not None:
+                    self.logger.removeHandler(self.h_fileHandler)
+                    self.h_fileHandler.close()
                 self.destroy()
                 
         except:
@@ -222,17 +443,26 @@ class a_Main(Tk.Tk):
         self.logger.setLevel(level)
         self.logger.log(level, 'Log Level Changed')
             
+    def cb_viewLog(self):
+        w_logViewer = LogPages.a_LogViewer(self, self.logFile)
+            
     def cb_managerConnect(self):
         # Spawn a window to get address and port
         
         # Create the child window
-        w_connectToHost = ManagerPages.a_ConnectToHost(self, lambda address, port: self.cb_addManager(address, port))
+        w_connectToHost = ManagerPages.a_ConnectToHost(self, lambda address, port: self.cb_addManager(address, port),
+                                                       discovery=self.discovery)
         
     def cb_addManager(self, address, port=None):
         # Attempt a connection to the manager
         if not self.lab.addManager(address, port):
             tkMessageBox.showwarning('Operation Failed', 
                                      'Unable to connect to InstrumentManager')
+            
+        else:
+            man = self.lab.getManager(address)
+            if man is not None:
+                self.register_callbacks(man)
         
         self.cb_refreshTree()
     
@@ -260,23 +490,27 @@ class a_Main(Tk.Tk):
         w_addResource.grab_set()
             
     def cb_refreshTree(self, address=None):
-        self.lab.refresh()
-        
-        self.treeFrame.refresh()
+        # Refresh in the background, process_snapshots updates the tree
+        if self.managersReady:
+            self.refreshWorker.request()
+        self.update_status()
         
     def cb_loadApplet(self, uuid, applet=None):
         if applet is not None:
+            if self.appletProcesses:
+                return self.cb_loadAppletProcess(uuid, applet)
+            
             try:
-                # Check if the specified model is valid
-                testModule = importlib.import_module(applet)
-                reload(testModule)  # Reload the module in case anything has changed
-                
-                className = applet.split('.')[-1]
-                testClass = getattr(testModule, className)
+                # Check if the specified model is valid. The module is only
+                # reloaded if the file has changed since it was imported
+                testClass = self.appletCache.getClass(applet)
                 
                 instrument = self.lab.getInstrument(uuid)
                 
                 if instrument is not None:
+                    # Serve getProperties from the property cache
+                    instrument = self.properties.wrap(uuid, instrument)
+                    
                     appletInst = testClass(self, instrument)
                     
                     # Store the object in open views
@@ -305,22 +539,11 @@ class a_Main(Tk.Tk):
                     pass
                 
             # Find compatible views
-            res = self.lab.getResource(uuid)
-            properties = res.getProperties()
+            properties = self.properties.get(uuid, lambda: self.lab.getResource(uuid).getProperties())
             
-            driverName = properties.get('driver')
-            validApplets = []
-            
-            # Find a view with a compatible model
-            for appletModule, appletInfo in self.applets.items():
-                if driverName in appletInfo.get('validDrivers', []):
-                    validApplets.append(appletModule)
-                    
-            # Find a generic view for this resource type
-            resType = properties.get('resourceType')
-            for appletModule, appletInfo in self.applets.items():
-                if resType in appletInfo.get('validResourceTypes', []):
-                    validApplets.append(appletModule)
+            # Applets for the driver, then generic applets for the resource type
+            validApplets = self.appletIndex.getCompatible(properties.get('driver'),
+                                                          properties.get('resourceType'))
                 
             # Load the view
             if len(validApplets) > 1:
@@ -336,6 +559,68 @@ class a_Main(Tk.Tk):
             else:
                 tkMessageBox.showwarning('Unable to load applet', 'No suitable applets could be found for this resource')
         
+    def cb_loadAppletProcess(self, uuid, applet):
+        """
+        Open an applet in its own process. The process connects to the
+        InstrumentManager that hosts the resource on its own.
+        """
+        try:
+            properties = self.properties.get(uuid, lambda: self.lab.getResource(uuid).getProperties())
+            
+            host = AppletHost.AppletHost(applet, uuid, properties.get('hostname'),
+                                         logger=self.logger)
+            host.start()
+            
+            self.openApplets[uuid] = host
+            
+        except Exception as e:
+            tkMessageBox.showerror(e.__class__.__name__, e.message)
+            
+    def process_applet_hosts(self):
+        """
+        Supervise applets running in their own process. Reports applets that
+        could not be opened or that exited unexpectedly.
+        """
+        for uuid, host in self.openApplets.items():
+            if not isinstance(host, AppletHost.AppletHost):
+                continue
+            
+            for message in host.getMessages():
+                if message[0] == 'error':
+                    tkMessageBox.showerror(message[1], message[2])
+                    host.closing = True
+                    
+            if not host.isAlive():
+                exitcode = host.getExitCode()
+                
+                if exitcode != 0 and not host.closing:
+                    self.logger.error("Applet %s for %s exited with code %s",
+                                      host.moduleName, uuid, exitcode)
+                    tkMessageBox.showwarning('Applet stopped', 
+                                             'Applet %s stopped unexpectedly' % host.moduleName)
+                    
+                del self.openApplets[uuid]
+                
+        self.after(self.APPLET_HOST_INTERVAL, self.process_applet_hosts)
+        
+    def close_applet_hosts(self, timeout=2.0):
+        """
+        Close all applets running in their own process. Processes that have not
+        exited after `timeout` seconds are killed.
+        """
+        hosts = [host for host in self.openApplets.values() 
+                 if isinstance(host, AppletHost.AppletHost)]
+        
+        for host in hosts:
+            host.close()
+            
+        deadline = time.time() + timeout
+        while any(host.isAlive() for host in hosts) and time.time() < deadline:
+            time.sleep(0.05)
+            
+        for host in hosts:
+            host.terminate()
+        
     def cb_loadDriver(self, uuid):
         try:
             dev = self.lab.getResource(uuid)
@@ -344,31 +629,33 @@ class a_Main(Tk.Tk):
             w_DriverSelector = ResourcePages.a_LoadDriver(self, self.lab, uuid, self.cb_refreshTree)
             
             self.lab.refreshResource(uuid)
+            self.properties.invalidate(uuid)
             
         except Exception as e:
             tkMessageBox.showerror(e.__class__.__name__, e.message)
         
-        self.treeFrame.refresh()
+        self.cb_refreshTree()
             
     def cb_unloadDriver(self, uuid):
         try:
             dev = self.lab.getResource(uuid)
             dev.unloadDriver()
             self.lab.refreshResource(uuid)
+            self.properties.invalidate(uuid)
             
         except Exception as e:
             tkMessageBox.showerror(e.__class__.__name__, e.message)
             
-        self.treeFrame.refresh()
+        self.cb_refreshTree()
         
     def cb_configResource(self, uuid):
         try:
-            dev = self.lab.getResource(uuid)
-            
-            prop = dev.getProperties()
+            prop = self.properties.get(uuid, lambda: self.lab.getResource(uuid).getProperties())
             type = prop.get('resourceType')
             
             if hasattr(ConfigPages, 'config_%s' % type):
+                dev = self.properties.wrap(uuid, self.lab.getResource(uuid))
+                
                 config_class = getattr(ConfigPages, 'config_%s' % type)
                 w_ConfigWindow = config_class(self, dev)
                 
@@ -380,7 +667,7 @@ class a_Main(Tk.Tk):
         
     def cb_ResourceProperties(self, uuid):
         try:
-            dev = self.lab.getResource(uuid)
+            dev = self.properties.wrap(uuid, self.lab.getResource(uuid))
             w_ResourceProperties = ResourcePages.a_PropertyWindow(self, dev)
             
         except Exception as e:
@@ -390,16 +677,205 @@ class a_Main(Tk.Tk):
     # Notification Event Handlers
     #===========================================================================
     
+    def register_callbacks(self, man):
+        man._registerCallback('event_new_resource', lambda: self.cb_event_new_resource())
+        man._registerCallback('event_resource_changed', 
+                              lambda uuid=None: self.cb_event_resource_changed(uuid))
+        
     def process_notifications(self):
-        managers = self.lab.getManager()
+        """
+        Run the callbacks of notifications decoded by the notification pump.
+        Runs in the Tk thread.
+        """
+        self.notificationPump.dispatch()
+        
+        self.apply_properties(self.propertyFetcher.getResults())
+            
+        self.after(self.NOTIFICATION_INTERVAL, self.process_notifications)
+        
+    def apply_properties(self, results):
+        """
+        Update the property cache and the search index with the properties of
+        single resources fetched after a notification. The tree is updated by
+        the refresh that the notification also requested.
+        
+        :param results: (uuid, properties) tuples from the PropertyFetcher
+        :type results: list
+        """
+        for uuid, props in results:
+            if props is None:
+                self.properties.remove(uuid)
+                self.index.remove(uuid)
+            else:
+                self.properties.set(uuid, props)
+                self.index.set(uuid, props)
+                
+        if len(results) > 0 and self.treeFrame.filterText != '':
+            # Matches of the filter may have changed
+            self.treeFrame.refresh()
+    
+    def process_snapshots(self):
+        """
+        Apply the newest snapshot from the refresh worker to the tree. Runs in
+        the Tk thread.
+        """
+        snapshot = self.refreshWorker.getSnapshot()
+        
+        if snapshot is not None:
+            self.apply_snapshot(snapshot)
+            
+            if not self.liveSnapshot:
+                self.liveSnapshot = True
+                self.cb_startupComplete()
+                self.restore_applets()
+                
+            if time.time() - self.lastSessionSave > self.SESSION_SAVE_INTERVAL:
+                self.save_session()
+            
+        self.update_status()
+            
+        self.after(200, self.process_snapshots)
+        
+    def apply_snapshot(self, snapshot):
+        """
+        Display a snapshot from the refresh worker or the last session. A live
+        snapshot replaces a cached one, the tree only changes where they
+        differ.
+        """
+        self.lastSnapshot = snapshot
+        self.properties.update(snapshot.resources)
+        self.index.update(snapshot.resources)
+        self.treeFrame.updateSnapshot(snapshot)
+        
+    def restore_applets(self):
+        """
+        Reopen the applets that were open when the last session ended, if
+        their resources are still available
+        """
+        for uuid, applet in self.session.getApplets():
+            if uuid in self.openApplets:
+                continue
+            
+            if uuid in self.lastSnapshot.resources and applet in self.applets:
+                self.logger.info("Reopening applet %s for %s", applet, uuid)
+                self.cb_loadApplet(uuid, applet)
+                
+    def getOpenApplets(self):
+        """
+        Get the applets that are still open
+        
+        :returns: list of (resource UUID, applet module name) tuples
+        """
+        applets = []
+        
+        for uuid, appletInst in self.openApplets.items():
+            try:
+                if isinstance(appletInst, AppletHost.AppletHost):
+                    if appletInst.isAlive():
+                        applets.append((uuid, appletInst.moduleName))
+                        
+                elif appletInst.winfo_exists():
+                    applets.append((uuid, appletInst.__class__.__module__))
+                    
+            except Tk.TclError:
+                pass
+            
+        return applets
         
-        for addresss, man in managers.items():
-            man._checkNotifications()
+    def save_session(self):
+        """
+        Save the connected hosts, the last live snapshot, open applets and the
+        window geometry
+        """
+        if self.managersReady:
+            self.session.setHosts(self.lab.getManager().keys())
+            
+        if self.liveSnapshot:
+            self.session.setSnapshot(self.lastSnapshot)
             
-        self.after(1000, self.process_notifications)
+        self.session.setApplets(self.getOpenApplets())
+        self.session.setGeometry(self.wm_geometry())
+        
+        self.session.save()
+        self.lastSessionSave = time.time()
+        
+    def cb_startupComplete(self):
+        """
+        Called when the first snapshot arrives. Records the startup timing
+        report.
+        """
+        self.profiler.mark('first_refresh')
+        self.logger.info(self.profiler.report())
+        
+        try:
+            self.profiler.save(self.startupReport, developer=self.developer)
+        except (IOError, OSError):
+            self.logger.exception("Unable to save startup report")
+        
+    def update_status(self):
+        if not self.managersReady:
+            if self.lastSnapshot is not None:
+                # Cached snapshot from the last session
+                updated = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.lastSnapshot.timestamp))
+                self.statusbar.set(0, 'Connecting... (showing resources from %s)', updated)
+            else:
+                self.statusbar.set(0, 'Connecting...')
+            
+        elif self.refreshWorker.isRefreshing():
+            self.statusbar.set(0, 'Refreshing...')
+            
+        elif self.lastSnapshot is not None:
+            age = time.time() - self.lastSnapshot.timestamp
+            updated = time.strftime('%H:%M:%S', time.localtime(self.lastSnapshot.timestamp))
+            
+            if age > self.REFRESH_STALE_AGE:
+                self.statusbar.set(0, 'Stale: last updated %s (%d seconds ago)', updated, age)
+                self.statusbar.setColor(0, 'red')
+                return
+            
+            elif len(self.lastSnapshot.errors) > 0:
+                self.statusbar.set(0, 'Last updated %s, %d host(s) degraded: %s', 
+                                   updated, len(self.lastSnapshot.errors),
+                                   ', '.join(sorted(self.lastSnapshot.errors)))
+                self.statusbar.setColor(0, 'yellow')
+                return
+            
+            else:
+                self.statusbar.set(0, 'Last updated %s', updated)
+                
+        self.statusbar.setColor(0, None)
+    
+    def process_applet_changes(self):
+        """
+        Developer mode file watcher. Reloads applets whose files have changed
+        and updates their info.
+        """
+        import applets
+        
+        for moduleName in self.appletCache.getChanged():
+            try:
+                self.appletCache.reload(moduleName)
+                
+                className = moduleName.split('.')[-1]
+                self.applets[moduleName] = applets.scanApplet(applets.getAppletPath(moduleName), className)
+                self.appletIndex.update(moduleName, self.applets[moduleName])
+                
+            except Exception:
+                self.logger.exception("Unable to reload applet: %s", moduleName)
+                
+        self.after(self.APPLET_WATCH_INTERVAL, self.process_applet_changes)
     
     def cb_event_new_resource(self):
         return self.cb_refreshTree()
+    
+    def cb_event_resource_changed(self, uuid=None):
+        # Serve the cached properties as stale until the new ones arrive
+        self.properties.invalidate(uuid)
+        
+        if uuid is not None:
+            self.propertyFetcher.request(uuid)
+        
+        return self.cb_refreshTree()
 
     #===========================================================================
     # Event Handlers
@@ -416,8 +892,9 @@ class a_Main(Tk.Tk):
         # Create a context menu
         menu = Tk.Menu(self)
         
-        resources = self.lab.getProperties()
-        hosts = self.lab.getConnectedHosts()
+        # Use cached data, the context menu must not wait on the network
+        resources = self.properties.getAll()
+        hosts = self.treeFrame.hosts
         
         # Populate menu based on context
         if elem in hosts:
@@ -444,7 +921,19 @@ class a_Main(Tk.Tk):
             # -Control Instrument (Launch View/GUI)
             res_props = resources.get(elem)
             
-            menu.add_command(label='Control Device...', command=lambda: self.cb_loadApplet(elem))
+            validApplets = self.appletIndex.getCompatible(res_props.get('driver'),
+                                                          res_props.get('resourceType'))
+            
+            if elem in self.openApplets or len(validApplets) == 1:
+                menu.add_command(label='Control Device...', command=lambda: self.cb_loadApplet(elem))
+                
+            elif len(validApplets) > 1:
+                # Let the user pick the applet from the menu
+                m_applets = Tk.Menu(menu)
+                for appletModule in validApplets:
+                    m_applets.add_command(label=appletModule, 
+                                          command=lambda appletModule=appletModule: self.cb_loadApplet(elem, appletModule))
+                menu.add_cascade(menu=m_applets, label='Control Device')
             
             if res_props.get('driver', None) == None:
                 menu.add_command(label='Load Driver...', command=lambda: self.cb_loadDriver(elem))
@@ -467,6 +956,36 @@ class a_Main(Tk.Tk):
     def e_TreeDoubleClick(self, event):
         pass
 
+class Splash(Tk.Toplevel):
+    """
+    Startup splash screen with a progress bar
+    """
+    def __init__(self, master):
+        Tk.Toplevel.__init__(self, master, padx=20, pady=20, bd=2, relief=Tk.RAISED)
+        self.overrideredirect(True)
+        
+        Tk.Label(self, text="Labtronyx Instrument Control and Automation",
+                 font=("Helvetica", 14)).pack(side=Tk.TOP, pady=10)
+        self.l_status = Tk.Label(self, text='Starting...', width=60, anchor=Tk.W)
+        self.l_status.pack(side=Tk.TOP, fill=Tk.X)
+        self.progress = ttk.Progressbar(self, orient=Tk.HORIZONTAL, 
+                                        mode='determinate', maximum=100)
+        self.progress.pack(side=Tk.TOP, fill=Tk.X, pady=5)
+        
+        # Center on the screen
+        self.update_idletasks()
+        x = (self.winfo_screenwidth() - self.winfo_reqwidth()) / 2
+        y = (self.winfo_screenheight() - self.winfo_reqheight()) / 2
+        self.geometry('+%d+%d' % (x, y))
+        self.update()
+        
+    def setProgress(self, text=None, value=None):
+        if text is not None:
+            self.l_status.config(text=text)
+        if value is not None:
+            self.progress['value'] = value
+        self.update_idletasks()
+        
 class Statusbar(Tk.Frame):
     """
     TODO:
@@ -487,12 +1006,15 @@ class Statusbar(Tk.Frame):
         pass
 
     def set(self, section, format, *args):
-        self.label.config(text=format % args)
-        self.label.update_idletasks()
+        self.sections[section].config(text=format % args)
+
+    def setColor(self, section, color=None):
+        if color is None:
+            color = self.cget('bg')
+        self.sections[section].config(bg=color)
 
     def clear(self, section):
-        self.label.config(text="")
-        self.label.update_idletasks()
+        self.sections[section].config(text="")
         
 class Toolbar(Tk.Frame):
     def __init__(self, master, **kwargs):
@@ -506,12 +1028,31 @@ class ResourceTree(Tk.Frame):
     treeGroup = 'hostname'
     treeSort = 'deviceModel'
     
-    def __init__(self, master, labManager):
+    # Above this many resources, groups start collapsed and only expanded
+    # groups are materialized, PAGE_SIZE rows at a time
+    LAZY_THRESHOLD = 500
+    PAGE_SIZE = 200
+    
+    def __init__(self, master, labManager, index=None):
         Tk.Frame.__init__(self, master)
         
         self.labManager = labManager
+        self.index = index
         
         Tk.Label(self, text='Instruments').pack(side=Tk.TOP)
+        
+        # Live filter
+        self.filterText = ''
+        self.filterJob = None
+        self.f_filter = Tk.Frame(self)
+        Tk.Label(self.f_filter, text='Filter').pack(side=Tk.LEFT)
+        self.filterVar = Tk.StringVar(self)
+        self.filterVar.trace('w', lambda *args: self.e_FilterChanged())
+        self.filterEntry = Tk.Entry(self.f_filter, textvariable=self.filterVar)
+        self.filterEntry.pack(side=Tk.LEFT, fill=Tk.X, expand=Tk.YES, padx=5)
+        if self.index is not None:
+            self.f_filter.pack(side=Tk.TOP, fill=Tk.X, pady=2)
+        
         self.tree = ttk.Treeview(self, height=20)
         
         self.tree['columns'] = ('Type', 'Vendor', 'Model', 'Serial')
@@ -526,8 +1067,25 @@ class ResourceTree(Tk.Frame):
         self.tree.heading('Serial', text='Serial Number')
         self.tree.pack(fill=Tk.BOTH)
         
-        self.nodes = []
+        # Full model: resource uuid -> (group, text, values)
+        self.model = {}
+        self.groupChildren = {} # group -> list of uuids
+        # Materialized rows: resource uuid -> (group, text, values)
+        self.nodes = {}
+        self.materialized = {} # group -> set of uuids
+        self.groups = set()
+        self.expanded = set()
+        self.pages = {} # group -> number of rows shown
         self.resources = {}
+        self.hosts = ()
+        self.degraded = {}
+        
+        self.tree.tag_configure('degraded', foreground='gray')
+        self.tree.tag_configure('more', foreground='blue')
+        
+        self.tree.bind('<<TreeviewOpen>>', self.e_TreeOpen, '+')
+        self.tree.bind('<<TreeviewClose>>', self.e_TreeClose, '+')
+        self.tree.bind('<<TreeviewSelect>>', self.e_TreeSelect, '+')
         
         self.changeGrouping()
         
@@ -543,14 +1101,14 @@ class ResourceTree(Tk.Frame):
         self.treeGroup = group
         
         # Build a list of group values
-        if self.treeGroup is 'hostname':
+        if self.treeGroup == 'hostname':
             # Fixes a bug where hosts were not added if no resources were present
-            for gval in self.labManager.getConnectedHosts():
-                self.tree.insert('', Tk.END, gval, text=gval, open=True)  # , image=img_host)
+            for gval in self.hosts:
+                self._insertGroup(gval)
                 
         elif self.treeGroup in self.validGroups:
             group_vals = []
-            for res in resources:
+            for res in self.resources.values():
                 gv = res.get(self.treeGroup, None)
                 if gv is not None and gv not in group_vals:
                     group_vals.append(gv)
@@ -560,13 +1118,14 @@ class ResourceTree(Tk.Frame):
             # Create group tree nodes
             for gval in group_vals:
                 # TODO: Add images to treeview
-                self.tree.insert('', Tk.END, gval, text=gval, open=True)
+                self._insertGroup(gval)
                 
         self.refresh()
     
     def refresh(self, sort='deviceType', reverseOrder=False):
         """
-        Sorting can be done on any valid key
+        Redraw the tree from the last snapshot. Sorting can be done on any
+        valid key
         """
         # TODO: Get tree view images working
         # Import Image Assets
@@ -575,65 +1134,263 @@ class ResourceTree(Tk.Frame):
         # img_device = Image.open('assets/drive.png')
         # img_device = ImageTk.PhotoImage(img_device)
         
-        self.labManager.refresh()
+        # Redraw from the last snapshot, LabManager is refreshed in the
+        # background by a_Main
+        if self.treeGroup == 'hostname':
+            groups = self.hosts
+        else:
+            groups = None
+        
+        self.updateResources(self.resources, groups, sort, reverseOrder)
+        
+    def updateSnapshot(self, snapshot):
+        """
+        Display a LabSnapshot published by a RefreshWorker
+        
+        :param snapshot: Lab snapshot
+        :type snapshot: LabWorkers.LabSnapshot
+        """
+        self.hosts = snapshot.hosts
+        self.resources = snapshot.resources
+        
+        self.refresh()
+        
+        # Mark hosts that did not respond to the last refresh
+        for host in set(self.degraded) | set(snapshot.errors):
+            if host not in self.groups:
+                continue
+            
+            if host in snapshot.errors:
+                self.tree.item(host, text='%s (degraded)' % host, tags=('degraded',))
+            else:
+                self.tree.item(host, text=host, tags=())
+                
+        self.degraded = snapshot.errors
+        
+    def updateResources(self, resources, groups=None, sort='deviceType', reverseOrder=False):
+        """
+        Apply the difference between the displayed tree and a snapshot of
+        resource properties. Only rows that were added, changed, moved or
+        removed are touched, and only in groups that are expanded.
+        
+        :param resources: Resource properties keyed by uuid
+        :type resources: dict
+        :param groups: Group nodes to display even if they have no resources.
+                       Empty groups not in this list are removed.
+        :type groups: list
+        """
+        self.resources = resources
+        
+        # Hide resources that do not match the filter
+        if self.index is not None and self.filterText != '':
+            matches = self.index.search(self.filterText)
+            resources = dict((res_uuid, props) for res_uuid, props in resources.items()
+                             if res_uuid in matches)
         
-        self.resources = self.labManager.getProperties()
-
         # Get a flat list of resources and sort
-        resources = self.resources
-        resourceProperties = resources.values()
-        resourceProperties.sort(key=lambda res: res.get(sort, ''), reverse=reverseOrder)
+        resourceProperties = sorted(resources.values(), 
+                                    key=lambda res: res.get(sort, ''), 
+                                    reverse=reverseOrder)
+        
+        model = {}
+        children = {} # group -> ordered list of uuids
         
-        # Populate child nodes
         for res in resourceProperties:
             lineID = res.get('uuid')
-            group = res.get(self.treeGroup)
+            if lineID is None:
+                continue
+            
+            group = res.get(self.treeGroup) or ''
             text = res.get('resourceID', '')
+            values = (res.get('deviceType', ''), res.get('deviceVendor', ''),
+                      res.get('deviceModel', ''), res.get('deviceSerial', ''))
+            
+            model[lineID] = (group, text, values)
+            children.setdefault(group, []).append(lineID)
+            
+        self.model = model
+        self.groupChildren = children
+        
+        # Remove empty groups that are no longer valid
+        if groups is not None:
+            for group in self.groups - set(groups) - set(children):
+                self._deleteGroup(group)
+                
+        for group in list(children) + list(groups or []):
+            if group != '' and group not in self.groups:
+                self._insertGroup(group)
+                
+        for group in [''] + sorted(self.groups):
+            self._syncGroup(group)
+            
+    def _syncGroup(self, group):
+        """
+        Materialize the visible rows of a group. Rows of collapsed groups are
+        not created, rows past the current page are replaced by a 'more' item.
+        """
+        uuids = self.groupChildren.get(group, [])
+        materialized = self.materialized.setdefault(group, set())
+        
+        if group == '' or group in self.expanded:
+            shown = uuids[:self.pages.get(group, self.PAGE_SIZE)]
+        else:
+            shown = []
+        shown_set = set(shown)
+        
+        # Delete
+        for lineID in materialized - shown_set:
+            if self.nodes.get(lineID, (None,))[0] == group:
+                self.tree.delete(lineID)
+                del self.nodes[lineID]
+        
+        for lineID in shown:
+            row = self.model[lineID]
+            _, text, values = row
+            
+            old_row = self.nodes.get(lineID)
+            if old_row is None:
+                # Insert
+                self.tree.insert(group, Tk.END, lineID, text=text, values=values)  # , image=img_device)
+                
+            elif old_row != row:
+                # Update
+                if old_row[0] != group:
+                    self.tree.move(lineID, group, Tk.END)
+                    self.materialized.get(old_row[0], set()).discard(lineID)
+                self.tree.item(lineID, text=text, values=values)
+                
+            self.nodes[lineID] = row
+            
+        self.materialized[group] = shown_set
+        
+        if group == '':
+            return
+        
+        # Collapsed groups get a placeholder so they can be expanded, large
+        # groups get an item to show the next page
+        more = self._moreID(group)
+        if len(shown) < len(uuids):
+            if group in self.expanded:
+                text = 'Show more (%d remaining)...' % (len(uuids) - len(shown))
+            else:
+                text = 'Loading...'
+                
+            if not self.tree.exists(more):
+                self.tree.insert(group, Tk.END, more, text=text, tags=('more',))
+            else:
+                self.tree.item(more, text=text)
+            shown = shown + [more]
             
-            if lineID is not None and lineID not in self.nodes:
-                self.tree.insert(group, Tk.END, lineID, text=text)  # , image=img_device)
-                self.nodes.append(lineID)
+        elif self.tree.exists(more):
+            self.tree.delete(more)
+        
+        # Move: reorder group children only if the order has changed
+        if self.tree.get_children(group) != tuple(shown):
+            self.tree.set_children(group, *shown)
             
-            self.tree.set(lineID, 'Vendor', res.get('deviceVendor', ''))
-            self.tree.set(lineID, 'Model', res.get('deviceModel', ''))
-            self.tree.set(lineID, 'Type', res.get('deviceType', ''))
-            self.tree.set(lineID, 'Serial', res.get('deviceSerial', ''))
+    def _moreID(self, group):
+        return '%s::more' % group
+                    
+    def _insertGroup(self, group):
+        # Large labs start with collapsed groups, rows are created on expand
+        expand = len(self.resources) <= self.LAZY_THRESHOLD
+        
+        self.tree.insert('', Tk.END, group, text=group, open=expand)  # , image=img_host)
+        self.groups.add(group)
+        
+        if expand:
+            self.expanded.add(group)
             
-        # Purge old nodes
-        for res_uuid in self.nodes:
-            if res_uuid not in resources:
-                self.nodes.remove(res_uuid)
-                self.tree.delete(res_uuid)
+    def _deleteGroup(self, group):
+        self.tree.delete(group)
+        self.groups.discard(group)
+        self.expanded.discard(group)
+        self.pages.pop(group, None)
+        
+        for lineID in self.materialized.pop(group, set()):
+            self.nodes.pop(lineID, None)
     
     def _clear(self):
         treenodes = self.tree.get_children()
         for n in treenodes:
             self.tree.delete(n)
             
-        self.nodes = []
+        self.nodes = {}
+        self.groups = set()
+        self.degraded = {}
+        self.expanded = set()
+        self.materialized = {}
+        self.pages = {}
+        
+    #===========================================================================
+    # Filtering
+    #===========================================================================
+    
+    def setFilter(self, text):
+        """
+        Only show resources that match a search query. See
+        :class:`common.index.ResourceIndex` for the query syntax.
+        
+        :param text: Search query, empty to show all resources
+        :type text: str
+        """
+        self.filterText = text.strip()
+        self.refresh()
+        
+    def e_FilterChanged(self):
+        # Wait until the user stops typing
+        if self.filterJob is not None:
+            self.after_cancel(self.filterJob)
+        self.filterJob = self.after(150, self._applyFilter)
+        
+    def _applyFilter(self):
+        self.filterJob = None
+        self.setFilter(self.filterVar.get())
+        
+    #===========================================================================
+    # Lazy loading
+    #===========================================================================
+    
+    def e_TreeOpen(self, event):
+        group = self.tree.focus()
+        
+        if group in self.groups and group not in self.expanded:
+            self.expanded.add(group)
+            self._syncGroup(group)
+            
+    def e_TreeClose(self, event):
+        group = self.tree.focus()
         
-class TextHandler(logging.Handler):
+        # Release the rows of collapsed groups in large labs
+        if group in self.expanded and len(self.resources) > self.LAZY_THRESHOLD:
+            self.expanded.discard(group)
+            self.pages.pop(group, None)
+            self._syncGroup(group)
+            
+    def e_TreeSelect(self, event):
+        for item in self.tree.selection():
+            group = self.tree.parent(item)
+            
+            if item == self._moreID(group):
+                # Load the next page
+                self.pages[group] = self.pages.get(group, self.PAGE_SIZE) + self.PAGE_SIZE
+                self._syncGroup(group)
+                
+                self.tree.selection_remove(item)
+                break
+        
+class TextHandler(ConsoleHandler):
     """ 
-    Logging handler to direct logging input to a Tkinter Text widget
+    Logging handler to direct logging input to a Tkinter Text widget. Safe to
+    use from any thread, see :class:`common.loghandlers.ConsoleHandler`
     """
-    def __init__(self, console):
-        logging.Handler.__init__(self)
-
-        self.console = console
-
-    def emit(self, record):
-        message = self.format(record) + '\n'
-        
-        # Disabling states so no user can write in it
-        self.console.configure(state=Tk.NORMAL)
-        self.console.insert(Tk.END, message)
-        self.console.configure(state=Tk.DISABLED)
-        self.console.see(Tk.END)
+    pass
         
 if __name__ == "__main__":
     # Load Application GUI
     try:
-        main_gui = a_Main()
+        main_gui = a_Main(developer='--developer' in sys.argv,
+                          applet_processes='--applet-processes' in sys.argv)
         main_gui.mainloop()
          
     except Exception as e:
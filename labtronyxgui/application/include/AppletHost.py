@@ -0,0 +1,269 @@
+import sys
+import os
+import json
+import logging
+import threading
+import subprocess
+import Queue
+
+import Tkinter as Tk
+
+"""
+Applet Hosting
+--------------
+Runs an applet in its own process with its own Tk root and its own connection
+to the InstrumentManager, so a slow redraw or a blocking call in one applet
+does not freeze the main window or other applets.
+
+The host process is a new Python interpreter started with this file as the
+script. The main window supervises it through the stdin and stdout pipes of the
+process, which carry one JSON message per line. Anything the applet prints is
+sent to stderr instead.
+
+Messages from the main window: `lift`, `close`
+
+Messages from the host process: `ready`, `error`
+"""
+
+class AppletHost(object):
+    """
+    Supervisor side of an applet running in its own process. Has the same
+    `lift` method as an applet window, so it can be kept in the list of open
+    applets.
+
+    :param moduleName: Applet module name (e.g. 'Type.multimeter')
+    :type moduleName: str
+    :param uuid: Resource UUID
+    :type uuid: str
+    :param address: Address of the InstrumentManager that hosts the resource
+    :type address: str
+    :param logger: Logger instance if you wish to override the internal instance
+    :type logger: Logging.logger
+    """
+
+    def __init__(self, moduleName, uuid, address, logger=logging):
+        self.moduleName = moduleName
+        self.uuid = uuid
+        self.address = address
+        self.logger = logger
+
+        self.proc = None
+        self.closing = False
+
+        self.messages = Queue.Queue()
+        self.l_send = threading.Lock()
+
+    def start(self):
+        """
+        Start the host process. Does not wait for the applet to open.
+        """
+        # The host process needs the same import paths as the main window
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(os.path.abspath(path) for path in sys.path if path)
+
+        script = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+        options = {'applet': self.moduleName, 'uuid': self.uuid, 'address': self.address}
+
+        self.proc = subprocess.Popen([sys.executable, script, json.dumps(options)],
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     env=env)
+
+        reader = threading.Thread(target=self._reader, name='AppletHostReader')
+        reader.daemon = True
+        reader.start()
+
+        self.logger.info("Started applet %s for %s in process %d",
+                         self.moduleName, self.uuid, self.proc.pid)
+
+    def _reader(self):
+        # Runs until the process closes stdout
+        for line in iter(self.proc.stdout.readline, ''):
+            try:
+                self.messages.put(json.loads(line))
+            except ValueError:
+                self.logger.debug("Applet %s: %s", self.moduleName, line.rstrip())
+
+    def _send(self, message, *args):
+        with self.l_send:
+            self.proc.stdin.write(json.dumps([message] + list(args)) + '\n')
+            self.proc.stdin.flush()
+
+    def getMessages(self):
+        """
+        Get the messages received from the host process since the last call.
+        Does not block.
+
+        :returns: list of lists, the first element is the message name
+        """
+        messages = []
+
+        try:
+            while True:
+                messages.append(self.messages.get_nowait())
+        except Queue.Empty:
+            pass
+
+        return messages
+
+    def isAlive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def getExitCode(self):
+        if self.proc is not None:
+            return self.proc.poll()
+
+    def lift(self):
+        """
+        Bring the applet window to the front
+
+        :raises: RuntimeError if the host process is no longer running
+        """
+        if not self.isAlive():
+            raise RuntimeError("Applet process has exited")
+
+        try:
+            self._send('lift')
+        except (IOError, OSError):
+            raise RuntimeError("Applet process has exited")
+
+    def close(self):
+        """
+        Ask the host process to close the applet and exit
+        """
+        self.closing = True
+
+        if self.isAlive():
+            try:
+                self._send('close')
+            except (IOError, OSError):
+                pass
+
+    def terminate(self):
+        """
+        Kill the host process
+        """
+        self.closing = True
+
+        if self.isAlive():
+            self.proc.terminate()
+
+#===============================================================================
+# Host process
+#===============================================================================
+
+class _HostChannel(object):
+    """
+    Host process side of the pipes to the main window. Commands are read in a
+    background thread and handled in the Tk thread.
+    """
+
+    POLL_INTERVAL = 100 # ms
+
+    def __init__(self, stdin, stdout):
+        self.root = None
+        self.stdin = stdin
+        self.stdout = stdout
+
+        self.applet = None
+        self.commands = Queue.Queue()
+
+        reader = threading.Thread(target=self._reader, name='AppletHostChannel')
+        reader.daemon = True
+        reader.start()
+
+    def _reader(self):
+        for line in iter(self.stdin.readline, ''):
+            try:
+                self.commands.put(json.loads(line))
+            except ValueError:
+                pass
+
+        # The main window is gone, close with it
+        self.commands.put(['close'])
+
+    def send(self, message, *args):
+        self.stdout.write(json.dumps([message] + list(args)) + '\n')
+        self.stdout.flush()
+
+    def process_commands(self):
+        try:
+            while True:
+                command = self.commands.get_nowait()
+
+                if command[0] == 'lift' and self.applet is not None:
+                    self.applet.deiconify()
+                    self.applet.lift()
+                    self.applet.focus_force()
+
+                elif command[0] == 'close':
+                    self.root.destroy()
+                    return
+
+        except Queue.Empty:
+            pass
+
+        self.root.after(self.POLL_INTERVAL, self.process_commands)
+
+def main(argv):
+    """
+    Host process entry point
+
+    :param argv: Command line arguments, a single JSON object with the applet
+                 module name, resource UUID and manager address
+    :returns: Exit code
+    """
+    options = json.loads(argv[0])
+
+    # Keep stdout for messages to the main window
+    channel_out = sys.stdout
+    sys.stdout = sys.stderr
+
+    logging.basicConfig()
+    logger = logging.getLogger('AppletHost')
+
+    channel = _HostChannel(sys.stdin, channel_out)
+
+    try:
+        root = Tk.Tk()
+        root.withdraw()
+        channel.root = root
+
+        import applets
+        canpath = applets.getAppletRoot()
+        if canpath not in sys.path:
+            sys.path.append(canpath)
+
+        appletClass = applets.AppletCache(logger=logger).getClass(options['applet'])
+
+        # Each host process has its own connection
+        from LabManager import LabManager
+        lab = LabManager()
+        if not lab.addManager(options['address']):
+            raise RuntimeError('Unable to connect to InstrumentManager at %s' % options['address'])
+
+        instrument = lab.getInstrument(options['uuid'])
+        if instrument is None:
+            raise RuntimeError('Unable to get a handle for the resource')
+
+        applet = appletClass(root, instrument)
+        channel.applet = applet
+
+        # Exit when the applet window is closed
+        applet.bind('<Destroy>', lambda event: root.quit() if event.widget is applet else None)
+
+        applet.run()
+
+    except Exception as e:
+        logger.exception("Unable to load applet %s", options['applet'])
+        channel.send('error', e.__class__.__name__, str(e))
+        return 1
+
+    channel.send('ready', os.getpid())
+    channel.process_commands()
+
+    root.mainloop()
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,6 +1,9 @@
 import Tkinter as Tk
 
-import serial
+from common.lazyimport import lazy_import
+
+# pyserial is only needed once a serial configuration window is opened
+serial = lazy_import('serial')
 
 class config_Serial(Tk.Toplevel):
     
@@ -12,17 +15,17 @@ class config_Serial(Tk.Toplevel):
     
     valid_baudrates = ['9600', '19200', '38400', '57600', '115200']
     
-    valid_parity = [serial.PARITY_NONE, serial.PARITY_EVEN, serial.PARITY_ODD,
-                    serial.PARITY_MARK, serial.PARITY_SPACE]
-    
-    valid_bits = [serial.FIVEBITS, serial.SIXBITS, serial.SEVENBITS, 
-                  serial.EIGHTBITS]
-    
-    valid_stop = [serial.STOPBITS_ONE, serial.STOPBITS_TWO]
-    
     def __init__(self, master, resource):
         Tk.Toplevel.__init__(self, master)
         
+        self.valid_parity = [serial.PARITY_NONE, serial.PARITY_EVEN, serial.PARITY_ODD,
+                             serial.PARITY_MARK, serial.PARITY_SPACE]
+        
+        self.valid_bits = [serial.FIVEBITS, serial.SIXBITS, serial.SEVENBITS, 
+                           serial.EIGHTBITS]
+        
+        self.valid_stop = [serial.STOPBITS_ONE, serial.STOPBITS_TWO]
+        
         self.wm_title("Serial Configuration")
         
         self.resource = resource
@@ -0,0 +1,391 @@
+import threading
+import logging
+import select
+import Queue
+import collections
+import copy
+import time
+
+"""
+Background workers that talk to the LabManager so the Tk thread never blocks
+on the network. Workers hand results to the GUI through thread-safe queues that
+are drained from the Tk thread using `after()`.
+"""
+
+# Snapshots are never modified after they are queued, consumers must treat
+# them as read-only
+LabSnapshot = collections.namedtuple('LabSnapshot',
+                                     ['timestamp', 'hosts', 'resources', 'errors'])
+
+class RefreshWorker(threading.Thread):
+    """
+    Refreshes all managers in a LabManager from a background thread and
+    publishes the results as immutable snapshots.
+    
+    Managers are queried in parallel, each with its own deadline. Hosts that
+    fail or do not answer before the deadline are reported in the `errors` of
+    the snapshot and keep the resources from the last successful refresh, so
+    a single unreachable host does not hold up the rest of the lab. A host
+    that is still busy with a previous query is not queried again until that
+    query returns.
+
+    :param labManager: LabManager instance
+    :type labManager: LabManager
+    :param interval: Time in seconds between automatic refreshes. If None, the
+                     worker only refreshes when requested
+    :type interval: float
+    :param host_timeout: Time in seconds to wait for each host
+    :type host_timeout: float
+    :param logger: Logger instance if you wish to override the internal instance
+    :type logger: Logging.logger
+    """
+
+    HOST_TIMEOUT = 3.0
+    
+    def __init__(self, labManager, interval=None, logger=logging, **kwargs):
+        threading.Thread.__init__(self, name='LabRefreshWorker')
+
+        # Worker threads are daemon threads, they die when the main thread dies
+        self.daemon = True
+
+        self.labManager = labManager
+        self.interval = interval
+        self.logger = logger
+        self.host_timeout = kwargs.get('host_timeout', self.HOST_TIMEOUT)
+
+        # Host -> resources from the last successful query
+        self._hostResources = {}
+        # Host -> HostQuery that has not returned yet
+        self._inflight = {}
+
+        self.snapshots = Queue.Queue()
+
+        self.e_alive = threading.Event()
+        self.e_alive.set()
+        self.e_request = threading.Event()
+        self.e_refreshing = threading.Event()
+
+        self.lastRefresh = None
+
+    def run(self):
+        while self.e_alive.is_set():
+            self.e_request.wait(0.5)
+
+            due = (self.interval is not None and self.lastRefresh is not None and
+                   time.time() - self.lastRefresh >= self.interval)
+
+            if self.e_request.is_set() or due:
+                self.e_request.clear()
+
+                self.e_refreshing.set()
+                try:
+                    self.snapshots.put(self.takeSnapshot())
+
+                except:
+                    self.logger.exception('Exception during background refresh')
+
+                finally:
+                    self.lastRefresh = time.time()
+                    self.e_refreshing.clear()
+
+    def takeSnapshot(self):
+        """
+        Refresh all managers in parallel and collect the properties of all
+        resources. Runs in the worker thread.
+
+        :returns: LabSnapshot
+        """
+        managers = self.labManager.getManager()
+        
+        # Start a query for every host that is not still busy
+        queries = {}
+        for address, man in managers.items():
+            query = self._inflight.get(address)
+            if query is None or not query.is_alive():
+                query = HostQuery(man)
+                query.start()
+                self._inflight[address] = query
+            queries[address] = query
+            
+        deadline = time.time() + self.host_timeout
+        
+        resources = {}
+        errors = {}
+        for address, query in queries.items():
+            query.join(max(0.0, deadline - time.time()))
+            
+            if query.is_alive():
+                errors[address] = 'Timed out'
+                
+            else:
+                del self._inflight[address]
+                
+                if query.error is not None:
+                    errors[address] = query.error
+                else:
+                    self._hostResources[address] = query.resources
+            
+            # Degraded hosts keep the resources from their last good query
+            resources.update(self._hostResources.get(address, {}))
+            
+        for address in errors:
+            self.logger.warning('Host %s degraded: %s', address, errors[address])
+            
+        # Forget hosts that have been removed
+        for address in set(self._hostResources) - set(managers):
+            del self._hostResources[address]
+        
+        hosts = tuple(sorted(managers.keys()))
+
+        return LabSnapshot(time.time(), hosts, resources, errors)
+
+    def request(self):
+        """
+        Request a refresh as soon as possible. Requests made while a refresh is
+        in progress are combined into a single refresh.
+        """
+        self.e_request.set()
+
+    def isRefreshing(self):
+        return self.e_refreshing.is_set() or self.e_request.is_set()
+
+    def getSnapshot(self):
+        """
+        Get the newest snapshot published since the last call. Older snapshots
+        are discarded. Does not block.
+
+        :returns: LabSnapshot or None
+        """
+        snapshot = None
+
+        try:
+            while True:
+                snapshot = self.snapshots.get_nowait()
+        except Queue.Empty:
+            pass
+
+        return snapshot
+
+    def stop(self):
+        self.e_alive.clear()
+
+class HostQuery(threading.Thread):
+    """
+    Refresh a single InstrumentManager and get the properties of its
+    resources. The result is only read after the thread has finished.
+    
+    :param manager: InstrumentManager client
+    :type manager: RpcClient
+    """
+    
+    def __init__(self, manager):
+        threading.Thread.__init__(self, name='HostQuery')
+        self.daemon = True
+        
+        self.manager = manager
+        self.resources = None
+        self.error = None
+        
+    def run(self):
+        try:
+            self.manager.refresh()
+            self.resources = copy.deepcopy(self.manager.getProperties())
+            
+        except Exception as e:
+            self.error = '%s: %s' % (e.__class__.__name__, e)
+
+class PropertyFetcher(threading.Thread):
+    """
+    Fetches the properties of single resources, e.g. after a resource changed
+    notification, so the GUI can update one resource without waiting for the
+    next full refresh. Requests for a resource that is still waiting are
+    combined. Results are collected from the Tk thread with
+    :func:`getResults`.
+    
+    :param labManager: LabManager instance
+    :type labManager: LabManager
+    :param logger: Logger instance if you wish to override the internal instance
+    :type logger: Logging.logger
+    """
+    
+    def __init__(self, labManager, logger=logging):
+        threading.Thread.__init__(self, name='PropertyFetcher')
+        self.daemon = True
+        
+        self.labManager = labManager
+        self.logger = logger
+        
+        self._lock = threading.Lock()
+        self._requests = set()
+        
+        # (uuid, properties or None if the resource is gone)
+        self.results = Queue.Queue()
+        
+        self.e_alive = threading.Event()
+        self.e_alive.set()
+        self.e_request = threading.Event()
+        
+    def request(self, res_uuid):
+        """
+        Fetch the properties of a resource as soon as possible
+        """
+        with self._lock:
+            self._requests.add(res_uuid)
+            
+        self.e_request.set()
+        
+    def run(self):
+        while self.e_alive.is_set():
+            self.e_request.wait(0.5)
+            self.e_request.clear()
+            
+            with self._lock:
+                requests, self._requests = self._requests, set()
+                
+            for res_uuid in requests:
+                try:
+                    resource = self.labManager.getResource(res_uuid)
+                    
+                    if resource is None:
+                        self.results.put((res_uuid, None))
+                    else:
+                        self.results.put((res_uuid, copy.deepcopy(resource.getProperties())))
+                        
+                except Exception:
+                    # The next full refresh brings the resource up to date
+                    self.logger.exception('Unable to fetch properties of %s', res_uuid)
+                    
+    def getResults(self):
+        """
+        Get the properties fetched since the last call. Does not block.
+        
+        :returns: list of (uuid, properties) tuples, properties are None for
+                  resources that no longer exist
+        """
+        results = []
+        
+        try:
+            while True:
+                results.append(self.results.get_nowait())
+        except Queue.Empty:
+            pass
+        
+        return results
+        
+    def stop(self):
+        self.e_alive.clear()
+        self.e_request.set()
+
+class NotificationPump(threading.Thread):
+    """
+    Waits for notifications from all managers in a LabManager and decodes them
+    in a background thread. Decoded notifications are queued together with
+    their callbacks, the callbacks are run in the Tk thread by calling
+    :func:`dispatch` from `after()`.
+    
+    The notification sockets are watched with select, so a notification is
+    picked up as soon as it arrives. Managers that are added or removed are
+    noticed within `poll_interval`.
+    
+    :param labManager: LabManager instance
+    :type labManager: LabManager
+    :param poll_interval: Maximum time in seconds to wait for a notification
+                          before the list of managers is checked again
+    :type poll_interval: float
+    :param logger: Logger instance if you wish to override the internal instance
+    :type logger: Logging.logger
+    """
+    
+    POLL_INTERVAL = 0.25
+    
+    def __init__(self, labManager, logger=logging, **kwargs):
+        threading.Thread.__init__(self, name='NotificationPump')
+        self.daemon = True
+        
+        self.labManager = labManager
+        self.logger = logger
+        self.poll_interval = kwargs.get('poll_interval', self.POLL_INTERVAL)
+        
+        # (callback, request) tuples
+        self.notifications = Queue.Queue()
+        
+        self.e_alive = threading.Event()
+        self.e_alive.set()
+        
+    def run(self):
+        while self.e_alive.is_set():
+            try:
+                self.pump(self.poll_interval)
+                
+            except:
+                self.logger.exception('Exception in notification pump')
+                time.sleep(self.poll_interval)
+                
+    def pump(self, timeout=0.0):
+        """
+        Wait up to `timeout` seconds for notifications and queue every
+        notification that has arrived. Runs in the pump thread.
+        
+        :returns: Number of notifications queued
+        """
+        sockets = {}
+        for address, man in self.labManager.getManager().items():
+            sock = man._getNotificationSocket()
+            if sock is not None:
+                sockets[sock] = man
+        
+        if len(sockets) == 0:
+            # select does not accept an empty list on all platforms
+            time.sleep(timeout)
+            return 0
+        
+        try:
+            ready, _, _ = select.select(sockets.keys(), [], [], timeout)
+            
+        except (select.error, ValueError, TypeError):
+            # A manager was removed and its socket closed while waiting
+            return 0
+        
+        count = 0
+        for sock in ready:
+            man = sockets[sock]
+            
+            try:
+                for notification in man._readNotifications():
+                    self.notifications.put(notification)
+                    count += 1
+                    
+            except Exception:
+                self.logger.exception('Invalid notification from %s', man)
+                
+        return count
+        
+    def dispatch(self, limit=None):
+        """
+        Call the callbacks of queued notifications. Does not block. Must be
+        called from the Tk thread.
+        
+        :param limit: Maximum number of notifications to handle, None for all
+        :type limit: int
+        :returns: Number of notifications handled
+        """
+        count = 0
+        
+        while limit is None or count < limit:
+            try:
+                method, req = self.notifications.get_nowait()
+            except Queue.Empty:
+                break
+            
+            count += 1
+            
+            try:
+                # Return from notification is discarded
+                req.call(method)
+            except Exception:
+                self.logger.exception('Exception in notification callback')
+                
+        return count
+                
+    def stop(self):
+        self.e_alive.clear()
@@ -0,0 +1,101 @@
+import Tkinter as Tk
+import tkMessageBox
+import time
+import datetime
+
+from common.logreader import LogReader
+
+class a_LogViewer(Tk.Toplevel):
+    """
+    Viewer for the persistent log. Jumps to a time range using the block
+    indexes of the log files.
+    """
+    
+    TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+    MAX_ENTRIES = 5000
+    
+    def __init__(self, master, filename):
+        Tk.Toplevel.__init__(self, master, padx=2, pady=2)
+        
+        self.reader = LogReader(filename)
+        
+        self.wm_title('Log Viewer')
+        
+        self.f_range = Tk.Frame(self)
+        Tk.Label(self.f_range, text='From').grid(row=0, column=0)
+        self.txt_start = Tk.Entry(self.f_range, width=20)
+        self.txt_start.grid(row=0, column=1, padx=2)
+        Tk.Label(self.f_range, text='To').grid(row=0, column=2)
+        self.txt_end = Tk.Entry(self.f_range, width=20)
+        self.txt_end.grid(row=0, column=3, padx=2)
+        Tk.Label(self.f_range, text='Level').grid(row=0, column=4)
+        self.level = Tk.StringVar(self)
+        self.level.set('DEBUG')
+        Tk.OptionMenu(self.f_range, self.level, 
+                      'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL').grid(row=0, column=5)
+        Tk.Button(self.f_range, text='Show', command=lambda: self.cb_Show()).grid(row=0, column=6, padx=2)
+        self.f_range.pack(side=Tk.TOP, fill=Tk.X)
+        
+        self.f_text = Tk.Frame(self)
+        self.yscrollbar = Tk.Scrollbar(self.f_text)
+        self.yscrollbar.pack(side=Tk.RIGHT, fill=Tk.Y)
+        self.txt_log = Tk.Text(self.f_text, width=120, height=30, 
+                               yscrollcommand=self.yscrollbar.set)
+        self.txt_log.pack(side=Tk.LEFT, fill=Tk.BOTH, expand=Tk.YES)
+        self.yscrollbar.config(command=self.txt_log.yview)
+        self.f_text.pack(side=Tk.TOP, fill=Tk.BOTH, expand=Tk.YES)
+        
+        self.status = Tk.Label(self, anchor=Tk.W)
+        self.status.pack(side=Tk.BOTTOM, fill=Tk.X)
+        
+        # Default to the last hour of the log
+        first, last = self.reader.getRange()
+        if last is not None:
+            self.txt_start.insert(0, self._format(max(first, last - 3600)))
+            self.txt_end.insert(0, self._format(last))
+            self.cb_Show()
+        else:
+            self.status.config(text='Log is empty')
+            
+    def _format(self, timestamp):
+        return time.strftime(self.TIME_FORMAT, time.localtime(timestamp))
+    
+    def _parse(self, text):
+        text = text.strip()
+        if text == '':
+            return None
+        
+        return time.mktime(time.strptime(text, self.TIME_FORMAT))
+        
+    def cb_Show(self):
+        try:
+            start = self._parse(self.txt_start.get())
+            end = self._parse(self.txt_end.get())
+        except ValueError:
+            tkMessageBox.showerror('Invalid Time', 'Times must be in the format YYYY-MM-DD HH:MM:SS')
+            return
+        
+        if end is not None:
+            # Include the whole last second
+            end += 1.0
+        
+        t_start = time.time()
+        lines = []
+        count = 0
+        for entry in self.reader.read(start, end, self.level.get(), self.MAX_ENTRIES):
+            timestamp = datetime.datetime.fromtimestamp(entry.get('t', 0))
+            lines.append('%s %-8s %s' % (timestamp.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+                                         entry.get('level', ''), entry.get('msg', '')))
+            if 'exc' in entry:
+                lines.append(entry['exc'])
+            count += 1
+                
+        self.txt_log.configure(state=Tk.NORMAL)
+        self.txt_log.delete('1.0', Tk.END)
+        self.txt_log.insert(Tk.END, '\n'.join(lines))
+        self.txt_log.configure(state=Tk.DISABLED)
+        
+        status = '%d entries in %.2f seconds' % (count, time.time() - t_start)
+        if count >= self.MAX_ENTRIES:
+            status += ', showing the first %d, narrow the range to see more' % self.MAX_ENTRIES
+        self.status.config(text=status)
@@ -1,13 +1,26 @@
 import Tkinter as Tk
-import tkMessageBox
 
 class a_ConnectToHost(Tk.Toplevel):
+    """
+    :param master: Tkinter master element
+    :type master: object
+    :param cb_func: Called with the address and port to connect to
+    :type cb_func: callable
+    :param discovery: Shows the hosts found on the network if provided
+    :type discovery: common.rpc.discovery.HostDiscovery
+    """
     
-    def __init__(self, master, cb_func):
+    # Time between updates of the discovered hosts (ms)
+    DISCOVERY_INTERVAL = 500
+    
+    def __init__(self, master, cb_func, discovery=None):
         Tk.Toplevel.__init__(self, master)
         
         # Store reference to parent window callback function
         self.cb_func = cb_func
+        self.discovery = discovery
+        self.discovered = []
+        self.discovery_job = None
         
         self.wm_title('Connect to host...')
         Tk.Label(self, text='Connect to remote host').grid(row=0, column=0, columnspan=2)
@@ -23,10 +36,55 @@ class a_ConnectToHost(Tk.Toplevel):
         Tk.Button(self, text='Cancel', command=lambda: self.cb_Cancel()).grid(row=3, column=0)
         Tk.Button(self, text='Connect', command=lambda: self.cb_Add()).grid(row=3, column=1)
         
+        if self.discovery is not None:
+            # Hosts found on the network, selecting one fills in the address
+            Tk.Label(self, text='Hosts found on the network').grid(row=4, column=0, columnspan=2)
+            self.lst_discovered = Tk.Listbox(self, height=6)
+            self.lst_discovered.grid(row=5, column=0, columnspan=2, 
+                                     sticky=Tk.N+Tk.E+Tk.S+Tk.W, padx=5, pady=5)
+            self.lst_discovered.bind('<<ListboxSelect>>', self.e_DiscoveredSelect)
+            self.lst_discovered.bind('<Double-Button-1>', lambda event: self.cb_Add())
+            
+            self.discovery.request()
+            self.update_discovered()
+        
         # Make this dialog modal
         self.focus_set()
         self.grab_set()
         
+    def update_discovered(self):
+        hosts = self.discovery.getHosts()
+        
+        if hosts != self.discovered:
+            self.discovered = hosts
+            
+            self.lst_discovered.delete(0, Tk.END)
+            for host in hosts:
+                self.lst_discovered.insert(Tk.END, '%s (%s:%s)' % (host.get('hostname'), 
+                                                                   host.get('address'), 
+                                                                   host.get('port')))
+        
+        self.discovery_job = self.after(self.DISCOVERY_INTERVAL, self.update_discovered)
+        
+    def destroy(self):
+        # The timer would fire into the deleted callback command
+        if self.discovery_job is not None:
+            self.after_cancel(self.discovery_job)
+            self.discovery_job = None
+            
+        Tk.Toplevel.destroy(self)
+        
+    def e_DiscoveredSelect(self, event):
+        selection = self.lst_discovered.curselection()
+        
+        if len(selection) > 0:
+            host = self.discovered[int(selection[0])]
+            
+            self.txt_address.delete(0, Tk.END)
+            self.txt_address.insert(0, host.get('address'))
+            self.txt_port.delete(0, Tk.END)
+            self.txt_port.insert(0, str(host.get('port')))
+        
     def cb_Add(self):
         address = self.txt_address.get()
         port = self.txt_port.get()
@@ -0,0 +1,178 @@
+import threading
+import copy
+
+"""
+GUI-side cache of resource properties so that menus and dialogs can open from
+local data instead of querying the managers over the network.
+"""
+
+class PropertyStore(object):
+    """
+    Resource properties keyed by uuid. Every entry carries a version stamp that
+    is incremented whenever the properties change or the entry is invalidated.
+
+    Entries are filled from RefreshWorker snapshots. Notifications from the
+    managers invalidate single entries. An invalidated entry is still served
+    by :func:`get` without waiting, and `refresh` is called to bring new
+    properties in the background.
+
+    :param refresh: Called when an invalidated entry is served, e.g. to
+                    request a snapshot from the RefreshWorker. Must not block.
+    :type refresh: callable
+    """
+
+    def __init__(self, refresh=None):
+        self.refresh = refresh
+
+        self._lock = threading.Lock()
+
+        self._properties = {}
+        self._versions = {}
+        self._invalid = set()
+
+    def update(self, resources):
+        """
+        Replace the cache contents with a snapshot of resource properties.
+        Version stamps only change for resources whose properties changed.
+
+        :param resources: Resource properties keyed by uuid
+        :type resources: dict
+        """
+        with self._lock:
+            for res_uuid in set(self._properties) - set(resources):
+                del self._properties[res_uuid]
+                self._invalid.discard(res_uuid)
+
+            for res_uuid, props in resources.items():
+                if self._properties.get(res_uuid) != props:
+                    self._properties[res_uuid] = props
+                    self._versions[res_uuid] = self._versions.get(res_uuid, 0) + 1
+
+                self._invalid.discard(res_uuid)
+
+    def set(self, res_uuid, props):
+        """
+        Replace the properties of a single resource, e.g. after a change
+        notification
+        """
+        with self._lock:
+            if self._properties.get(res_uuid) != props:
+                self._properties[res_uuid] = props
+                self._versions[res_uuid] = self._versions.get(res_uuid, 0) + 1
+
+            self._invalid.discard(res_uuid)
+
+    def remove(self, res_uuid):
+        """
+        Forget a resource that no longer exists
+        """
+        with self._lock:
+            if self._properties.pop(res_uuid, None) is not None:
+                self._versions[res_uuid] = self._versions.get(res_uuid, 0) + 1
+            self._invalid.discard(res_uuid)
+
+    def invalidate(self, res_uuid=None):
+        """
+        Mark the properties of a resource as out of date
+
+        :param res_uuid: Resource UUID, or None to invalidate all resources
+        :type res_uuid: str
+        """
+        with self._lock:
+            if res_uuid is None:
+                targets = list(self._properties)
+            else:
+                targets = [res_uuid]
+
+            for res_uuid in targets:
+                self._invalid.add(res_uuid)
+                self._versions[res_uuid] = self._versions.get(res_uuid, 0) + 1
+
+    def get(self, res_uuid, fetch=None):
+        """
+        Get the properties of a resource. If the entry has been invalidated,
+        the cached properties are returned right away and a background refresh
+        is requested. Only if there is no entry at all and `fetch` is given,
+        the properties are fetched in the calling thread.
+
+        :param res_uuid: Resource UUID
+        :type res_uuid: str
+        :param fetch: Function that returns the current properties
+        :type fetch: callable
+        :returns: dict or None
+        """
+        with self._lock:
+            valid = res_uuid in self._properties and res_uuid not in self._invalid
+            version = self._versions.get(res_uuid, 0)
+            props = self._properties.get(res_uuid)
+
+        if not valid and props is not None:
+            # Serve the stale entry, the next snapshot replaces it
+            if self.refresh is not None:
+                self.refresh()
+            return props
+
+        if valid or fetch is None:
+            return props
+
+        props = fetch()
+
+        with self._lock:
+            # Discard the result if the entry changed while fetching
+            if self._versions.get(res_uuid, 0) == version:
+                self._properties[res_uuid] = props
+                self._versions[res_uuid] = version + 1
+                self._invalid.discard(res_uuid)
+
+        return props
+
+    def getAll(self):
+        """
+        Get the cached properties of all resources, including invalidated
+        entries. Does not block on the network.
+
+        :returns: dict
+        """
+        with self._lock:
+            return dict(self._properties)
+
+    def getVersion(self, res_uuid):
+        """
+        :returns: int - Version stamp of a resource, 0 if never seen
+        """
+        return self._versions.get(res_uuid, 0)
+
+    def isValid(self, res_uuid):
+        return res_uuid in self._properties and res_uuid not in self._invalid
+
+    def wrap(self, res_uuid, resource):
+        """
+        Wrap a resource or instrument client so that `getProperties` is served
+        from the cache. All other attributes are passed to the client.
+
+        :returns: CachedResource
+        """
+        return CachedResource(self, res_uuid, resource)
+
+class CachedResource(object):
+    """
+    Proxy for a resource client that serves `getProperties` from a
+    PropertyStore
+    """
+
+    def __init__(self, store, res_uuid, resource):
+        self._store = store
+        self._uuid = res_uuid
+        self._resource = resource
+
+    def getProperties(self):
+        props = self._store.get(self._uuid, self._resource.getProperties)
+
+        # Callers are free to modify the returned dictionary
+        return copy.deepcopy(props)
+
+    def __getattr__(self, name):
+        return getattr(self._resource, name)
+
+    def __str__(self):
+        return str(self._resource)
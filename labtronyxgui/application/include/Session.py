@@ -0,0 +1,132 @@
+import os
+import json
+import logging
+
+from LabWorkers import LabSnapshot
+
+"""
+Persistent session, saved when the application exits and loaded on the next
+start. The session holds the hosts that were connected, the last resource
+snapshot, the applets that were open and the window geometry, so the main
+window can show the lab as it was left while the managers are contacted in the
+background.
+"""
+
+class Session(object):
+    """
+    Session state stored as a JSON file. Missing or unreadable files give an
+    empty session.
+
+    :param filename: Session file
+    :type filename: str
+    :param logger: Logger instance if you wish to override the internal instance
+    :type logger: Logging.logger
+    """
+
+    VERSION = 1
+
+    def __init__(self, filename, logger=logging):
+        self.filename = filename
+        self.logger = logger
+
+        self.state = {}
+
+    def load(self):
+        """
+        Load the session file
+
+        :returns: True if a session was loaded, False otherwise
+        """
+        try:
+            with open(self.filename, 'rb') as f:
+                state = json.load(f)
+
+            if state.get('version') == self.VERSION:
+                self.state = state
+                return True
+
+        except (IOError, ValueError):
+            pass
+
+        self.state = {}
+        return False
+
+    def save(self):
+        """
+        Save the session file. Errors are logged.
+        """
+        state = dict(self.state)
+        state['version'] = self.VERSION
+
+        try:
+            dirname = os.path.dirname(self.filename)
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+
+            # Write to a temporary file first so a crash cannot leave a broken session
+            temp = self.filename + '.tmp'
+            with open(temp, 'wb') as f:
+                json.dump(state, f, separators=(',', ':'))
+
+            if os.path.exists(self.filename):
+                os.remove(self.filename)
+            os.rename(temp, self.filename)
+
+        except (IOError, OSError, TypeError, ValueError):
+            self.logger.exception("Unable to save session")
+
+    def getHosts(self):
+        """
+        :returns: list of host addresses
+        """
+        return [str(host) for host in self.state.get('hosts', [])]
+
+    def setHosts(self, hosts):
+        self.state['hosts'] = sorted(hosts)
+
+    def getSnapshot(self):
+        """
+        Get the last saved snapshot. Errors are not saved, hosts are not
+        marked as degraded until the live managers say so.
+
+        :returns: LabWorkers.LabSnapshot or None
+        """
+        snapshot = self.state.get('snapshot')
+
+        if snapshot is None:
+            return None
+
+        resources = dict((str(uuid), props) for uuid, props in snapshot.get('resources', {}).items())
+        hosts = tuple(str(host) for host in snapshot.get('hosts', []))
+
+        return LabSnapshot(snapshot.get('timestamp', 0.0), hosts, resources, {})
+
+    def setSnapshot(self, snapshot):
+        """
+        :param snapshot: Lab snapshot
+        :type snapshot: LabWorkers.LabSnapshot
+        """
+        self.state['snapshot'] = {'timestamp': snapshot.timestamp,
+                                  'hosts': list(snapshot.hosts),
+                                  'resources': snapshot.resources}
+
+    def getApplets(self):
+        """
+        :returns: list of (resource UUID, applet module name) tuples
+        """
+        return [(str(uuid), str(applet)) for uuid, applet in self.state.get('applets', [])]
+
+    def setApplets(self, applets):
+        self.state['applets'] = [list(applet) for applet in applets]
+
+    def getGeometry(self):
+        """
+        :returns: Tk geometry string or None
+        """
+        geometry = self.state.get('geometry')
+
+        if geometry is not None:
+            return str(geometry)
+
+    def setGeometry(self, geometry):
+        self.state['geometry'] = geometry
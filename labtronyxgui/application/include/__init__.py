@@ -1,2 +1,2 @@
 
-__all__ = ['ConfigPages', 'ManagerPages', 'ResourcePages']
\ No newline at end of file
+__all__ = ['ConfigPages', 'ManagerPages', 'ResourcePages', 'LabWorkers', 'PropertyStore', 'LogPages', 'AppletHost', 'Session']
\ No newline at end of file
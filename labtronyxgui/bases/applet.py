@@ -2,6 +2,7 @@
 #import multiprocessing
 import Tkinter as Tk
 from common.rpc import RpcClient
+from common.sampling import SampleHub
 
 class Base_Applet(Tk.Toplevel):
     
@@ -9,9 +10,32 @@ class Base_Applet(Tk.Toplevel):
         Tk.Toplevel.__init__(self, master, padx=5, pady=5)
         
         self.__instrument = instrument
+        self.__sampleHub = None
         
     def getInstrument(self):
         return self.__instrument
+    
+    def getSampleHub(self):
+        """
+        Get the sample hub for the instrument of this applet. Widgets that
+        subscribe to the same method through the hub share a single read. The
+        hub is stopped when the applet window is closed.
+        
+        :returns: common.sampling.SampleHub
+        """
+        if self.__sampleHub is None:
+            self.__sampleHub = SampleHub(self.__instrument)
+            self.__sampleHub.start()
+            
+            self.bind('<Destroy>', self._e_destroySampleHub, add='+')
+            
+        return self.__sampleHub
+    
+    def _e_destroySampleHub(self, event):
+        # Children of the window also send a Destroy event
+        if event.widget is self and self.__sampleHub is not None:
+            self.__sampleHub.stop()
+            self.__sampleHub = None
             
     def run(self):
         raise NotImplementedError
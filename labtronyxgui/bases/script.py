@@ -2,12 +2,16 @@ import threading
 import logging
 import inspect
 import Queue
+import time
 
 import Tkinter as Tk
 
 from labtronyx import InstrumentManager
 from labtronyx import RemoteManager
 
+from common.index import ResourceIndex
+from common.loghandlers import ConsoleHandler
+
 class Base_Script(object):
     """
     Base object for scripts
@@ -19,6 +23,10 @@ class Base_Script(object):
     TIMER_UPDATE_TESTS = 250
     TIMER_UPDATE_INSTR = 1000
     
+    # Seconds between full index updates when notifications are used, in case
+    # a notification was lost
+    INDEX_RESYNC_INTERVAL = 30.0
+    
     def __init__(self):
         # Instantiate a logger
         self.logger = logging.getLogger(__name__)
@@ -35,6 +43,13 @@ class Base_Script(object):
     
         self.__g_instruments = []
         self.__g_tests = []
+        
+        # Required instruments are matched against a local index
+        self.__index = ResourceIndex()
+        self.__index_dirty = set()
+        self.__index_resync = True
+        self.__index_updated = 0
+        self.__index_notify = self._enableIndexNotifications()
     
         self.__test_queue = Queue.Queue()
         # Run the script startup routine
@@ -169,7 +184,7 @@ class Base_Script(object):
         # Configure Logger
         self.logFormatter = logging.Formatter('%(message)s')
         self.logger.setLevel(logging.DEBUG)
-        h_textHandler = self.g_ConsoleLoggerHandler(self.logConsole)
+        h_textHandler = self.g_ConsoleLoggerHandler(self.logConsole.console)
         h_textHandler.setFormatter(self.logFormatter)
         self.logger.addHandler(h_textHandler)
         
@@ -195,9 +210,12 @@ class Base_Script(object):
         
     def _Timer_UpdateInstruments(self):
         ready = True
+        
+        self._updateIndex()
+        
         # Update Required Instruments
         for instr in self.__g_instruments:
-            instr.cb_update()
+            instr.cb_update(self.__index)
             status = instr.getStatus()
             if not status:
                 ready = False
@@ -214,6 +232,85 @@ class Base_Script(object):
             
         self.myTk.after(self.TIMER_UPDATE_INSTR, self._Timer_UpdateInstruments)
         
+    #===========================================================================
+    # Instrument Index
+    #===========================================================================
+    
+    def _enableIndexNotifications(self):
+        """
+        Keep the instrument index up to date from resource notifications
+        instead of querying all properties on every update.
+        
+        :returns: True if notifications are used, False to poll
+        """
+        if not hasattr(self.instr, '_registerCallback'):
+            # Local InstrumentManager
+            self.logger.info("Notifications not available, polling instruments")
+            return False
+        
+        self.instr._registerCallback('event_new_resource', 
+                                     lambda: self._cb_resourceNew())
+        self.instr._registerCallback('event_resource_changed', 
+                                     lambda uuid=None: self._cb_resourceChanged(uuid))
+        
+        if not self.instr._enableNotifications():
+            self.logger.info("Unable to enable notifications, polling instruments")
+            return False
+        
+        return True
+    
+    def _cb_resourceNew(self):
+        self.__index_resync = True
+        
+    def _cb_resourceChanged(self, uuid=None):
+        if uuid is None:
+            self.__index_resync = True
+        else:
+            self.__index_dirty.add(uuid)
+    
+    def _updateIndex(self):
+        """
+        Bring the instrument index up to date. Properties are only queried when
+        a notification was received, or every `INDEX_RESYNC_INTERVAL` seconds.
+        Without notifications, properties are queried on every update.
+        """
+        if self.__index_notify:
+            try:
+                self.instr._checkNotifications()
+            except:
+                self.logger.exception("Unable to check notifications")
+                
+            if time.time() - self.__index_updated > self.INDEX_RESYNC_INTERVAL:
+                self.__index_resync = True
+                
+            if not self.__index_resync and len(self.__index_dirty) == 0:
+                return
+            
+        resync, self.__index_resync = self.__index_resync, False
+        dirty, self.__index_dirty = self.__index_dirty, set()
+        
+        # One property query per update instead of one search per instrument
+        try:
+            properties = self.instr.getProperties()
+        except:
+            self.logger.exception("Unable to update instrument index")
+            
+            # Try again on the next update
+            self.__index_resync = resync
+            self.__index_dirty |= dirty
+            return
+        
+        if resync or not self.__index_notify:
+            self.__index.update(properties)
+            self.__index_updated = time.time()
+            
+        else:
+            for uuid in dirty:
+                if uuid in properties:
+                    self.__index.set(uuid, properties[uuid])
+                else:
+                    self.__index.remove(uuid)
+        
     #===========================================================================
     # Helper Functions
     #===========================================================================
@@ -340,23 +437,13 @@ class Base_Script(object):
         def see(self, index):
             return self.console.see(index)
         
-    class g_ConsoleLoggerHandler(logging.Handler):
+    class g_ConsoleLoggerHandler(ConsoleHandler):
         """ 
-        Logging handler to direct logging input to a Tkinter Text widget
+        Logging handler to direct logging input to a Tkinter Text widget. Test
+        threads log through this handler, so records are queued and written
+        by the Tk thread, see :class:`common.loghandlers.ConsoleHandler`
         """
-        def __init__(self, console):
-            logging.Handler.__init__(self)
-    
-            self.console = console
-    
-        def emit(self, record):
-            message = self.format(record) + '\n'
-            
-            # Disabling states so no user can write in it
-            self.console.configure(state=Tk.NORMAL)
-            self.console.insert(Tk.END, message)
-            self.console.configure(state=Tk.DISABLED)
-            self.console.see(Tk.END)
+        pass
             
     class g_InstrElement(Tk.Frame):
         
@@ -381,12 +468,27 @@ class Base_Script(object):
             self.l_status.pack(side=Tk.RIGHT)
             
             self.instr = []
+            self.matches = None
             #self.instr_sel = 0
             
-        def cb_update(self):
+        def cb_update(self, index=None):
             assert type(self.instr_details) == dict
             
-            self.instr = self.labManager.findInstruments(**self.instr_details)
+            if index is None:
+                self.instr = self.labManager.findInstruments(**self.instr_details)
+                
+            else:
+                # Only ask the manager for instrument objects when the set of
+                # matching resources changes
+                matches = index.find(**self.instr_details)
+                
+                if matches != self.matches:
+                    self.matches = matches
+                    
+                    if len(matches) > 0:
+                        self.instr = self.labManager.findInstruments(**self.instr_details)
+                    else:
+                        self.instr = []
                     
             if len(self.instr) == 1:
                 self.status.set("Ready")
@@ -0,0 +1,225 @@
+import threading
+
+"""
+Resource Index
+--------------
+In-memory index over resource properties that answers queries without
+scanning every resource. The index is updated incrementally: only resources
+whose properties changed are re-indexed.
+
+Queries can either match property values exactly (:func:`ResourceIndex.find`,
+with the same keyword arguments as `findInstruments`) or search free text
+(:func:`ResourceIndex.search`), which is used for live filtering in the GUI.
+"""
+
+class ResourceIndex(object):
+    """
+    Index of resource properties keyed by uuid
+    
+    Free text queries are split into terms. Every term must match the start of
+    a word in one of the indexed properties. A term can be restricted to one
+    property using `key:value`, where key is a property name or one of the
+    short names in `ALIASES` (e.g. 'vendor:agilent host:lab-pc-1').
+    """
+    
+    INDEX_KEYS = ['deviceVendor', 'deviceModel', 'deviceSerial', 'deviceType',
+                  'hostname', 'driver', 'resourceType', 'resourceID', 
+                  'interface']
+    
+    ALIASES = {'vendor': 'deviceVendor',
+               'model': 'deviceModel',
+               'serial': 'deviceSerial',
+               'type': 'deviceType',
+               'host': 'hostname',
+               'driver': 'driver',
+               'resource': 'resourceID'}
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        
+        self._properties = {}
+        
+        # key -> value -> set of uuids
+        self._values = dict((key, {}) for key in self.INDEX_KEYS)
+        # word -> set of (key, uuid)
+        self._words = {}
+        
+    #===========================================================================
+    # Updates
+    #===========================================================================
+        
+    def update(self, resources):
+        """
+        Bring the index up to date with a snapshot of resource properties.
+        Only added, changed or removed resources are re-indexed.
+        
+        :param resources: Resource properties keyed by uuid
+        :type resources: dict
+        :returns: int - Number of resources that were re-indexed
+        """
+        with self._lock:
+            changed = 0
+            
+            for res_uuid in set(self._properties) - set(resources):
+                self._remove(res_uuid)
+                changed += 1
+                
+            for res_uuid, props in resources.items():
+                if self._properties.get(res_uuid) != props:
+                    self._remove(res_uuid)
+                    self._add(res_uuid, props)
+                    changed += 1
+                    
+            return changed
+        
+    def set(self, res_uuid, props):
+        """
+        Add or replace the properties of a single resource
+        """
+        with self._lock:
+            self._remove(res_uuid)
+            self._add(res_uuid, props)
+            
+    def remove(self, res_uuid):
+        """
+        Remove a single resource from the index
+        """
+        with self._lock:
+            self._remove(res_uuid)
+        
+    def _add(self, res_uuid, props):
+        self._properties[res_uuid] = props
+        
+        for key in self.INDEX_KEYS:
+            value = props.get(key)
+            if value is None:
+                continue
+            
+            self._values[key].setdefault(value, set()).add(res_uuid)
+            
+            for word in self._split(value):
+                self._words.setdefault(word, set()).add((key, res_uuid))
+        
+    def _remove(self, res_uuid):
+        props = self._properties.pop(res_uuid, None)
+        if props is None:
+            return
+        
+        for key in self.INDEX_KEYS:
+            value = props.get(key)
+            if value is None:
+                continue
+            
+            postings = self._values[key].get(value)
+            if postings is not None:
+                postings.discard(res_uuid)
+                if len(postings) == 0:
+                    del self._values[key][value]
+                    
+            for word in self._split(value):
+                postings = self._words.get(word)
+                if postings is not None:
+                    postings.discard((key, res_uuid))
+                    if len(postings) == 0:
+                        del self._words[word]
+                    
+    @staticmethod
+    def _split(value):
+        text = unicode(value).lower()
+        
+        for sep in '-_.,:;/()':
+            text = text.replace(sep, ' ')
+            
+        # Also index the complete value so that 'tcpip0::1.2.3.4' matches
+        return set(text.split()) | set([unicode(value).lower()])
+    
+    #===========================================================================
+    # Queries
+    #===========================================================================
+    
+    def find(self, **kwargs):
+        """
+        Find resources whose properties equal all of the given values. Matches
+        the same resources as `findInstruments`: every value is compared with
+        `==`, without any normalization of case or whitespace, and a value of
+        None matches resources that do not have the property. Keys that are
+        not indexed, None and unhashable values are compared against each
+        candidate.
+        
+        :returns: set of uuids
+        """
+        with self._lock:
+            result = None
+            scan = []
+            
+            for key, value in kwargs.items():
+                if key in self._values and self._isHashable(value) and value is not None:
+                    matches = self._values[key].get(value, set())
+                    result = set(matches) if result is None else result & matches
+                else:
+                    scan.append((key, value))
+                    
+            if result is None:
+                result = set(self._properties)
+                
+            for key, value in scan:
+                result = set(res_uuid for res_uuid in result
+                             if self._properties[res_uuid].get(key) == value)
+                    
+            return result
+        
+    @staticmethod
+    def _isHashable(value):
+        try:
+            hash(value)
+            return True
+        except TypeError:
+            return False
+        
+    def search(self, query):
+        """
+        Free text search. Terms are combined with AND, see the class
+        documentation for the query syntax. An empty query matches all
+        resources.
+        
+        :param query: Search text
+        :type query: str
+        :returns: set of uuids
+        """
+        with self._lock:
+            result = set(self._properties)
+            
+            for term in query.lower().split():
+                key = None
+                if ':' in term:
+                    prefix, rest = term.split(':', 1)
+                    
+                    for name in self.INDEX_KEYS:
+                        if prefix == name.lower():
+                            key = name
+                    key = self.ALIASES.get(prefix, key)
+                    
+                    if key is not None:
+                        term = rest
+                
+                if term == '':
+                    continue
+                
+                matches = set()
+                for word, postings in self._words.items():
+                    if word.startswith(term):
+                        for post_key, res_uuid in postings:
+                            if key is None or post_key == key:
+                                matches.add(res_uuid)
+                                
+                result &= matches
+                if len(result) == 0:
+                    break
+                
+            return result
+        
+    def getProperties(self, res_uuid):
+        return self._properties.get(res_uuid)
+    
+    def __len__(self):
+        return len(self._properties)
@@ -0,0 +1,106 @@
+import sys
+import types
+import importlib
+import threading
+
+"""
+Lazy Imports
+------------
+Defers importing heavy dependencies (matplotlib, numpy, pyserial, ...) until
+they are first used, so that importing a widget or applet module stays cheap::
+
+    from common.lazyimport import lazy_import
+
+    np = lazy_import('numpy')
+
+    def run(self):
+        data = np.arange(0.0, 1.0, 0.1) # numpy is imported here
+
+Submodules that are not imported by their package can be reached through the
+lazy module, e.g. `matplotlib.figure.Figure`.
+"""
+
+class LazyModule(types.ModuleType):
+    """
+    Module placeholder that imports the real module on first attribute access
+
+    :param name: Full module name
+    :type name: str
+    :param on_import: Function called with the module right after it has been
+                      imported, e.g. to select a matplotlib backend
+    :type on_import: callable
+    """
+
+    # Serializes the first import, the import lock is not enough because
+    # on_import must run exactly once
+    _lock = threading.RLock()
+
+    def __init__(self, name, on_import=None):
+        types.ModuleType.__init__(self, name)
+
+        self.__dict__['_lazy_module'] = None
+        self.__dict__['_lazy_on_import'] = on_import
+
+    def _load(self):
+        module = self.__dict__['_lazy_module']
+
+        if module is None:
+            with self._lock:
+                module = self.__dict__['_lazy_module']
+
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+
+                    on_import = self.__dict__['_lazy_on_import']
+                    if on_import is not None:
+                        on_import(module)
+
+                    self.__dict__['_lazy_module'] = module
+
+        return module
+
+    def isLoaded(self):
+        return self.__dict__['_lazy_module'] is not None
+
+    def __getattr__(self, name):
+        module = self._load()
+
+        try:
+            return getattr(module, name)
+
+        except AttributeError:
+            # Submodule that has not been imported yet
+            try:
+                return importlib.import_module('%s.%s' % (self.__name__, name))
+            except ImportError:
+                raise AttributeError("'module' object has no attribute '%s'" % name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        if self.isLoaded():
+            return repr(self._load())
+        else:
+            return "<lazy module '%s' (not loaded)>" % self.__name__
+
+def lazy_import(name, on_import=None):
+    """
+    Get a module that is imported when first used. If the module has already
+    been imported, it is returned directly.
+
+    :param name: Full module name (e.g. 'matplotlib.backends.backend_tkagg')
+    :type name: str
+    :param on_import: Function called with the module after it is imported
+    :type on_import: callable
+    :returns: module or LazyModule
+    """
+    module = sys.modules.get(name)
+
+    if module is not None and on_import is None:
+        return module
+
+    return LazyModule(name, on_import)
@@ -0,0 +1,445 @@
+import logging
+import collections
+import threading
+import Queue
+import json
+import gzip
+import time
+import os
+import glob
+import sys
+import traceback
+
+import Tkinter as Tk
+
+"""
+Logging handlers for the GUI
+"""
+
+class ConsoleHandler(logging.Handler):
+    """
+    Logging handler that directs log output to a Tkinter Text widget.
+    
+    Records can be logged from any thread. They are formatted and appended to a
+    queue without taking the handler lock, and written to the widget in
+    batches by a timer running in the Tk thread. The widget keeps at most
+    `max_lines` lines, older lines are discarded.
+    
+    If records arrive faster than the widget is updated and the queue holds
+    `max_queue` lines, new records are dropped and counted. A notice with the
+    number of dropped records is written to the console with the next batch.
+    
+    :param console: Text widget
+    :type console: Tk.Text
+    :param max_lines: Maximum number of lines kept in the widget
+    :type max_lines: int
+    :param max_queue: Maximum number of records waiting to be written
+    :type max_queue: int
+    :param interval: Time between updates of the widget (milliseconds)
+    :type interval: int
+    """
+    
+    MAX_LINES = 5000
+    MAX_QUEUE = 10000
+    FLUSH_INTERVAL = 100
+    
+    def __init__(self, console, **kwargs):
+        logging.Handler.__init__(self)
+        
+        self.console = console
+        self.max_lines = kwargs.get('max_lines', self.MAX_LINES)
+        self.max_queue = kwargs.get('max_queue', self.MAX_QUEUE)
+        self.interval = kwargs.get('interval', self.FLUSH_INTERVAL)
+        
+        # deque.append and popleft are atomic, no lock is needed
+        self.queue = collections.deque()
+        
+        self.dropped = 0
+        self._dropLock = threading.Lock()
+        self._reported = 0
+        self._lines = 0
+        
+        self.console.after(self.interval, self._poll)
+        
+    def createLock(self):
+        # emit only appends to the queue
+        self.lock = None
+        
+    def emit(self, record):
+        if len(self.queue) >= self.max_queue:
+            # Only the overflow path is locked
+            with self._dropLock:
+                self.dropped += 1
+            return
+        
+        try:
+            self.queue.append(self.format(record))
+            
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            self.handleError(record)
+            
+    def getDropped(self):
+        """
+        Get the number of records that were dropped because the queue was full
+        
+        :returns: int
+        """
+        return self.dropped
+    
+    def _poll(self):
+        try:
+            self._writeBatch()
+            self.console.after(self.interval, self._poll)
+            
+        except Tk.TclError:
+            # Widget has been destroyed
+            pass
+        
+    def _writeBatch(self):
+        # Write all queued records to the widget. Must be called from the Tk
+        # thread. Not done in flush, logging.shutdown flushes all handlers at
+        # exit, after the widget is gone.
+        lines = []
+        
+        try:
+            # Only take what is queued now, records keep arriving
+            for i in range(len(self.queue)):
+                lines.append(self.queue.popleft())
+        except IndexError:
+            pass
+        
+        dropped = self.dropped - self._reported
+        if dropped > 0:
+            lines.append('*** %d log records dropped ***' % dropped)
+            self._reported += dropped
+            
+        if len(lines) == 0:
+            return
+        
+        # Lines that would be discarded right away are never inserted
+        lines = lines[-self.max_lines:]
+        text = '\n'.join(lines) + '\n'
+        
+        # Disabling states so no user can write in it
+        self.console.configure(state=Tk.NORMAL)
+        self.console.insert(Tk.END, text)
+        
+        self._lines += text.count('\n')
+        if self._lines > self.max_lines:
+            excess = self._lines - self.max_lines
+            self.console.delete('1.0', '%d.0' % (excess + 1))
+            self._lines = self.max_lines
+            
+        self.console.configure(state=Tk.DISABLED)
+        self.console.see(Tk.END)
+
+class JsonFileHandler(logging.Handler):
+    """
+    Logging handler that writes records to rotating files as JSON lines::
+    
+        {"t": 1444263000.25, "level": "INFO", "name": "a_Main", "thread": "MainThread", "msg": "..."}
+        
+    Records are queued by `emit` and written by a background thread, so
+    logging never waits on the disk. If the queue is full, records are dropped
+    and a record with the number of dropped records is written later. Failed
+    writes and rotations are counted (:func:`getErrors`) and reported on
+    stderr at most once every `ERROR_INTERVAL` seconds. The file is reopened
+    with the next batch.
+    
+    When the active file reaches `max_bytes`, it is renamed with a timestamp
+    (e.g. `labtronyx.20151008-114500-000.jsonl`) and, if `compress` is set,
+    compressed into independent gzip blocks of about `block_size` bytes. An
+    index of the first timestamp and file offset of each block is saved next
+    to it (`.idx`), so :class:`common.logreader.LogReader` can jump to a time
+    range without decompressing the whole file. Only the newest `backup_count`
+    rotated files are kept.
+    
+    :param filename: Active log file
+    :type filename: str
+    :param max_bytes: File size that triggers a rotation
+    :type max_bytes: int
+    :param backup_count: Number of rotated files to keep
+    :type backup_count: int
+    :param compress: Compress rotated files
+    :type compress: bool
+    :param max_queue: Maximum number of records waiting to be written
+    :type max_queue: int
+    """
+    
+    MAX_BYTES = 16 * 1048576 # 16 MB
+    BACKUP_COUNT = 50
+    BLOCK_SIZE = 262144 # 256 kB
+    MAX_QUEUE = 10000
+    ERROR_INTERVAL = 60.0 # Minimum time between error reports (s)
+    
+    def __init__(self, filename, **kwargs):
+        logging.Handler.__init__(self)
+        
+        self.filename = os.path.abspath(filename)
+        self.max_bytes = kwargs.get('max_bytes', self.MAX_BYTES)
+        self.backup_count = kwargs.get('backup_count', self.BACKUP_COUNT)
+        self.compress = kwargs.get('compress', True)
+        self.block_size = kwargs.get('block_size', self.BLOCK_SIZE)
+        
+        self.queue = Queue.Queue(kwargs.get('max_queue', self.MAX_QUEUE))
+        
+        self.dropped = 0
+        self._dropLock = threading.Lock()
+        self._reported = 0
+        
+        # Failed writes or rotations, and the records lost in them
+        self.errors = 0
+        self.lost = 0
+        self._lastError = None
+        self._errorsReported = 0
+        
+        dirname = os.path.dirname(self.filename)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        
+        self._open()
+        
+        self._writer = threading.Thread(target=self._run, name='JsonLogWriter')
+        self._writer.daemon = True
+        self._writer.start()
+        
+    def createLock(self):
+        # emit only appends to the queue
+        self.lock = None
+        
+    def emit(self, record):
+        try:
+            entry = {'t': record.created,
+                     'level': record.levelname,
+                     'name': record.name,
+                     'thread': record.threadName,
+                     'msg': record.getMessage()}
+            
+            if record.exc_info:
+                # Tracebacks must be formatted before the frames go away
+                formatter = self.formatter or logging.Formatter()
+                entry['exc'] = formatter.formatException(record.exc_info)
+                
+            self.queue.put_nowait(entry)
+            
+        except Queue.Full:
+            with self._dropLock:
+                self.dropped += 1
+            
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            self.handleError(record)
+            
+    def getDropped(self):
+        """
+        Get the number of records that were dropped because the queue was full
+        
+        :returns: int
+        """
+        return self.dropped
+    
+    def getErrors(self):
+        """
+        Get the number of failed writes or rotations and the number of records
+        that could not be written
+        
+        :returns: tuple (errors, lost records)
+        """
+        return (self.errors, self.lost)
+    
+    def close(self):
+        """
+        Write all queued records and stop the writer thread
+        """
+        if self._writer.is_alive():
+            self.queue.put(None)
+            self._writer.join()
+            
+        logging.Handler.close(self)
+        
+    #===========================================================================
+    # Writer Thread
+    #===========================================================================
+    
+    def _open(self):
+        self._stream = open(self.filename, 'ab')
+        self._stream.seek(0, os.SEEK_END)
+        self._size = self._stream.tell()
+        
+    def _run(self):
+        running = True
+        
+        while running:
+            batch = [self.queue.get()]
+            
+            # Write everything that is waiting in one go
+            try:
+                while len(batch) < 1000:
+                    batch.append(self.queue.get_nowait())
+            except Queue.Empty:
+                pass
+            
+            if None in batch:
+                running = False
+                batch = [entry for entry in batch if entry is not None]
+                
+            dropped = self.dropped - self._reported
+            if dropped > 0:
+                self._reported += dropped
+                batch.append({'t': time.time(), 'level': 'WARNING', 
+                              'name': __name__, 'thread': 'JsonLogWriter',
+                              'msg': '%d log records dropped' % dropped})
+                
+            written = False
+            try:
+                if self._stream.closed:
+                    # A failed rotation leaves the stream closed
+                    self._open()
+                    
+                data = ''.join([json.dumps(entry, separators=(',', ':')) + '\n'
+                                for entry in batch])
+                self._stream.write(data)
+                self._stream.flush()
+                self._size += len(data)
+                written = True
+                
+                if self._size >= self.max_bytes:
+                    self._rotate()
+                    
+            except Exception:
+                # Never let a disk problem kill the writer
+                self.errors += 1
+                if not written:
+                    self.lost += len(batch)
+                self._reportError()
+                
+        if not self._stream.closed:
+            self._stream.close()
+        
+    def _reportError(self):
+        # Called from the writer thread while handling an exception. Logging
+        # the error could loop back into this handler, so it goes to stderr.
+        now = time.time()
+        if self._lastError is not None and now - self._lastError < self.ERROR_INTERVAL:
+            return
+        
+        errors = self.errors - self._errorsReported
+        self._lastError = now
+        self._errorsReported = self.errors
+        
+        try:
+            sys.stderr.write('JsonFileHandler: %d error(s) writing %s, %d record(s) lost so far\n'
+                             % (errors, self.filename, self.lost))
+            traceback.print_exc(file=sys.stderr)
+        except Exception:
+            pass
+        
+    def _rotate(self):
+        self._stream.close()
+        
+        base, ext = os.path.splitext(self.filename)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        
+        # The sequence number keeps names unique and in order
+        count = 0
+        target = '%s.%s-%03d%s' % (base, stamp, count, ext)
+        while os.path.exists(target) or os.path.exists(target + '.gz'):
+            count += 1
+            target = '%s.%s-%03d%s' % (base, stamp, count, ext)
+            
+        if self.compress:
+            try:
+                compressLog(self.filename, target + '.gz', self.block_size)
+            except:
+                # Do not leave a partial archive behind, the next rotation retries
+                for path in [target + '.gz', target + '.gz.idx']:
+                    if os.path.exists(path):
+                        os.remove(path)
+                raise
+            os.remove(self.filename)
+        else:
+            os.rename(self.filename, target)
+            
+        # Remove the oldest files
+        rotated = sorted(getRotatedLogs(self.filename))
+        for old in rotated[:max(0, len(rotated) - self.backup_count)]:
+            for path in [old, old + '.idx']:
+                if os.path.exists(path):
+                    os.remove(path)
+            
+        self._open()
+        
+def getRotatedLogs(filename):
+    """
+    Get the rotated files of a JsonFileHandler log, oldest first
+    
+    :param filename: Active log file
+    :type filename: str
+    :returns: list of paths
+    """
+    base, ext = os.path.splitext(filename)
+    
+    files = glob.glob('%s.*%s' % (base, ext)) + glob.glob('%s.*%s.gz' % (base, ext))
+    
+    # Timestamps in the names sort chronologically
+    return sorted(files)
+        
+def compressLog(source, target, block_size=JsonFileHandler.BLOCK_SIZE):
+    """
+    Compress a JSON lines log into a series of independent gzip members and
+    write a block index to `target + '.idx'`. Each member can be decompressed
+    on its own after seeking to its offset.
+    
+    :param source: Uncompressed log file
+    :type source: str
+    :param target: Compressed log file
+    :type target: str
+    """
+    blocks = []
+    first = last = None
+    
+    with open(source, 'rb') as f_in, open(target, 'wb') as f_out:
+        lines = []
+        size = 0
+        
+        for line in f_in:
+            lines.append(line)
+            size += len(line)
+            
+            if size >= block_size:
+                blocks.append(_writeBlock(f_out, lines))
+                lines, size = [], 0
+                
+        if len(lines) > 0:
+            blocks.append(_writeBlock(f_out, lines))
+            
+    blocks = [block for block in blocks if block[0] is not None]
+    if len(blocks) > 0:
+        first = blocks[0][0]
+        last = blocks[-1][2]
+        
+    index = {'version': 1,
+             'first': first,
+             'last': last,
+             'blocks': [[t_first, offset] for t_first, offset, t_last in blocks]}
+    
+    with open(target + '.idx', 'wb') as f:
+        json.dump(index, f)
+        
+def _timestamp(line):
+    try:
+        return json.loads(line).get('t')
+    except ValueError:
+        return None
+        
+def _writeBlock(f_out, lines):
+    offset = f_out.tell()
+    
+    member = gzip.GzipFile(fileobj=f_out, mode='wb')
+    member.write(''.join(lines))
+    member.close() # Does not close f_out
+    
+    return (_timestamp(lines[0]), offset, _timestamp(lines[-1]))
@@ -0,0 +1,206 @@
+import os
+import json
+import gzip
+import bisect
+import logging
+
+from loghandlers import getRotatedLogs, _timestamp
+
+"""
+Log Reader
+----------
+Reads the JSON lines logs written by :class:`common.loghandlers.JsonFileHandler`
+and jumps to a time range using the block indexes of the rotated files, so
+only the blocks that overlap the range are decompressed.
+"""
+
+class LogReader(object):
+    """
+    Time range queries over a JsonFileHandler log and its rotated files
+    
+    :param filename: Active log file
+    :type filename: str
+    """
+    
+    # Offset index spacing for uncompressed files
+    BLOCK_SIZE = 262144
+    
+    def __init__(self, filename):
+        self.filename = os.path.abspath(filename)
+        
+        # path -> (mtime, size, index)
+        self._indexes = {}
+        
+    def getFiles(self):
+        """
+        Get all files of the log, oldest first
+        
+        :returns: list of paths
+        """
+        files = getRotatedLogs(self.filename)
+        
+        if os.path.exists(self.filename):
+            files.append(self.filename)
+            
+        return files
+    
+    def getRange(self):
+        """
+        Get the time range covered by the log
+        
+        :returns: tuple (first, last) timestamps or (None, None) if empty
+        """
+        first = last = None
+        
+        for path in self.getFiles():
+            index = self.getIndex(path)
+            
+            if index['first'] is not None:
+                if first is None:
+                    first = index['first']
+                last = index['last']
+                
+        return (first, last)
+        
+    def getIndex(self, path):
+        """
+        Get the block index of a log file. Compressed files use the index saved
+        during rotation, other files are indexed on first use and the index is
+        extended when the file grows.
+        
+        :returns: dict with keys 'first', 'last' and 'blocks', a list of 
+                  [first timestamp, offset]
+        """
+        stat = os.stat(path)
+        cached = self._indexes.get(path)
+        
+        if cached is not None and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+            return cached[2]
+        
+        if path.endswith('.gz'):
+            try:
+                with open(path + '.idx', 'rb') as f:
+                    index = json.load(f)
+                    
+            except (IOError, ValueError):
+                # No index, the whole file is one block
+                index = self._scan(path, 0, {'first': None, 'last': None, 'blocks': []})
+                index['blocks'] = index['blocks'][:1]
+        
+        else:
+            if cached is not None and stat.st_size > cached[1]:
+                # Only index what was appended
+                index = self._scan(path, cached[1], cached[2])
+            else:
+                index = self._scan(path, 0, {'first': None, 'last': None, 'blocks': []})
+                
+        self._indexes[path] = (stat.st_mtime, stat.st_size, index)
+        
+        return index
+    
+    def _scan(self, path, start, index):
+        """
+        Index an uncompressed file starting at an offset
+        """
+        blocks = list(index['blocks'])
+        first, last = index['first'], index['last']
+        
+        f = self._open(path)
+        try:
+            f.seek(start)
+            offset = start
+            next_block = blocks[-1][1] + self.BLOCK_SIZE if len(blocks) > 0 else 0
+            
+            for line in iter(f.readline, ''):
+                t = _timestamp(line)
+                
+                if t is not None:
+                    if offset >= next_block:
+                        blocks.append([t, offset])
+                        next_block = offset + self.BLOCK_SIZE
+                        
+                    if first is None:
+                        first = t
+                    last = t
+                    
+                offset += len(line)
+        finally:
+            f.close()
+                
+        return {'first': first, 'last': last, 'blocks': blocks}
+    
+    def _open(self, path):
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rb')
+        else:
+            return open(path, 'rb')
+        
+    def read(self, start=None, end=None, level=None, limit=None):
+        """
+        Iterate over the log entries in a time range, oldest first
+        
+        :param start: First timestamp (seconds since the epoch) or None
+        :type start: float
+        :param end: Last timestamp or None
+        :type end: float
+        :param level: Minimum level name (e.g. 'WARNING') or None
+        :type level: str
+        :param limit: Maximum number of entries or None
+        :type limit: int
+        :returns: Iterator of dict
+        """
+        min_level = logging.getLevelName(level) if level is not None else None
+        count = 0
+        
+        for path in self.getFiles():
+            index = self.getIndex(path)
+            
+            # Skip files outside of the range
+            if index['first'] is None:
+                continue
+            if start is not None and index['last'] < start:
+                continue
+            if end is not None and index['first'] > end:
+                break
+            
+            # Start from the last block that begins before the range
+            blocks = index['blocks']
+            if start is not None and len(blocks) > 0:
+                pos = bisect.bisect_right([block[0] for block in blocks], start) - 1
+                offset = blocks[max(0, pos)][1]
+            else:
+                offset = 0
+                
+            for entry in self._readFrom(path, offset):
+                t = entry.get('t', 0)
+                
+                if start is not None and t < start:
+                    continue
+                if end is not None and t > end:
+                    return
+                if min_level is not None and logging.getLevelName(entry.get('level')) < min_level:
+                    continue
+                
+                yield entry
+                
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+                
+    def _readFrom(self, path, offset):
+        with open(path, 'rb') as raw:
+            raw.seek(offset)
+            
+            if path.endswith('.gz'):
+                # Decompression continues through the following members
+                f = gzip.GzipFile(fileobj=raw, mode='rb')
+            else:
+                f = raw
+                
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Partially written line
+                    pass
+
@@ -0,0 +1,116 @@
+import threading
+import contextlib
+import json
+import time
+import os
+
+"""
+Startup Profiler
+----------------
+Records how long each phase of application startup takes, including phases
+that run in parallel on other threads, and keeps a history of launches so that
+regressions in startup time can be tracked.
+"""
+
+class StartupProfiler(object):
+    """
+    Collects the start and duration of named phases relative to the start
+    time. Safe to use from multiple threads.
+
+    Example::
+
+        profiler = StartupProfiler()
+
+        with profiler.phase('discovery'):
+            ...
+
+        profiler.mark('first_frame')
+        print profiler.report()
+
+    :param t_start: Start time, e.g. taken at the top of the entry script so
+                    module imports are included. Defaults to now.
+    :type t_start: float
+    """
+
+    def __init__(self, t_start=None):
+        self.t_start = t_start if t_start is not None else time.time()
+
+        self._lock = threading.Lock()
+        self.phases = [] # (name, start offset, duration, thread name)
+        self.marks = [] # (name, offset)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Context manager that times a phase. The phase is recorded even if it
+        raises.
+        """
+        t_start = time.time()
+        try:
+            yield
+        finally:
+            self.addPhase(name, t_start, time.time())
+
+    def addPhase(self, name, t_start, t_end):
+        """
+        Record a phase that was timed without the profiler, e.g. before it was
+        created
+
+        :param t_start: Start time
+        :type t_start: float
+        :param t_end: End time
+        :type t_end: float
+        """
+        with self._lock:
+            self.phases.append((name, t_start - self.t_start, t_end - t_start,
+                                threading.current_thread().name))
+
+    def mark(self, name):
+        """
+        Record a point in time, e.g. 'first_frame'
+        """
+        with self._lock:
+            self.marks.append((name, time.time() - self.t_start))
+
+    def getMark(self, name):
+        for mark_name, offset in self.marks:
+            if mark_name == name:
+                return offset
+
+    def report(self):
+        """
+        Format a timing report
+
+        :returns: str
+        """
+        with self._lock:
+            lines = ['Startup timing (seconds):']
+
+            for name, start, duration, thread in sorted(self.phases, key=lambda p: p[1]):
+                lines.append('  %-20s start %7.3f  duration %7.3f  [%s]' % (name, start, duration, thread))
+
+            for name, offset in sorted(self.marks, key=lambda m: m[1]):
+                lines.append('  %-20s at    %7.3f' % (name, offset))
+
+            return '\n'.join(lines)
+
+    def save(self, filename, **extra):
+        """
+        Append the timings of this launch to a JSON lines history file
+
+        :param filename: History file
+        :type filename: str
+        """
+        with self._lock:
+            entry = {'start': self.t_start,
+                     'phases': dict((name, {'start': start, 'duration': duration, 'thread': thread})
+                                    for name, start, duration, thread in self.phases),
+                     'marks': dict(self.marks)}
+        entry.update(extra)
+
+        dirname = os.path.dirname(filename)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        with open(filename, 'ab') as f:
+            f.write(json.dumps(entry, separators=(',', ':')) + '\n')
@@ -13,4 +13,6 @@ from jsonrpc import *
 from server import *
 from client import *
 from errors import *
+from recorder import *
+from discovery import *
         
\ No newline at end of file
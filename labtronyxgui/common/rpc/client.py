@@ -3,6 +3,8 @@ import socket
 import select
 import logging
 import errno
+import time
+import types
 
 from jsonrpc import *
 from errors import *
@@ -27,6 +29,8 @@ class RpcClient(object):
     :type address: str - IPv4
     :param port: Port of remote RpcServer
     :type port: int
+    :param recorder: Record all transactions to a session file
+    :type recorder: RpcRecorder
     """
     DEBUG_RPC_CLIENT = False
     
@@ -38,6 +42,7 @@ class RpcClient(object):
         self.address = self._resolveAddress(address)
         self.port = port
         self.logger = kwargs.get('logger', logging)
+        self.recorder = kwargs.get('recorder', None)
         self.timeout = self.RPC_TIMEOUT
         self.nextID = 1
         
@@ -68,12 +73,22 @@ class RpcClient(object):
             return socket.gethostbyname(address)
         
     def _connect(self):
+        try:
+            self.socket = self._openSocket()
+            
+        except:
+            self.socket = None
+            raise
+        
+    def _openSocket(self):
         # Open a TCP socket
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.address, self.port))
-            self.socket.setblocking(0)
-            self.socket.settimeout(self.timeout)
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.connect((self.address, self.port))
+            sock.setblocking(0)
+            sock.settimeout(self.timeout)
+            
+            return sock
         
         except socket.error as e:
             if e.errno in [errno.ECONNREFUSED, errno.ECONNRESET, errno.ETIMEDOUT]:
@@ -81,10 +96,6 @@ class RpcClient(object):
             
             else:
                 raise
-            
-        except:
-            self.socket = None
-            raise
         
     def _disconnect(self):
         if self.socket is not None:
@@ -125,17 +136,37 @@ class RpcClient(object):
             self.note_socket.close()
             
             self._rpcCall('rpc_unregister', address)
-            
-            del self.note_socket
         except:
             pass
         
+        self.note_socket = None
+        
         return True
     
     def _registerCallback(self, event, method):
         self._callbacks[event] = method
+        
+    def _getNotificationSocket(self):
+        """
+        Get the UDP socket notifications are received on, for use with select
+        
+        :returns: socket or None if notifications are not enabled
+        """
+        return self.note_socket
     
-    def _checkNotifications(self):
+    def _readNotifications(self):
+        """
+        Receive and decode all pending notifications without calling their
+        callbacks. Allows notifications to be decoded in one thread and handled
+        in another.
+        
+        :returns: list of (callback, request) tuples
+        """
+        notifications = []
+        
+        if self.note_socket is None:
+            return notifications
+        
         try:
             while True:
                 data = self.note_socket.recv(self.RPC_MAX_PACKET_SIZE)
@@ -149,12 +180,17 @@ class RpcClient(object):
                     method = self._callbacks.get(method, None)
                     
                     if method is not None:
-                        # Return from notification is discarded
-                        req.call(method)
-                    
+                        notifications.append((method, req))
                 
         except socket.error:
             pass
+        
+        return notifications
+    
+    def _checkNotifications(self):
+        for method, req in self._readNotifications():
+            # Return from notification is discarded
+            req.call(method)
     
     def _send(self, data_out):
         for attempt in range(2):
@@ -182,8 +218,19 @@ class RpcClient(object):
             
             # Continue reading from the socket until all data is received
             while self.socket in select.select([self.socket], [], [], 0.0)[0]:
-                data += self.socket.recv(self.RPC_MAX_PACKET_SIZE)
-            
+                try:
+                    seg = self.socket.recv(self.RPC_MAX_PACKET_SIZE)
+                except socket.error:
+                    # The server may close the connection after refusing it
+                    if data:
+                        break
+                    raise
+
+                if seg == '':
+                    # Connection closed
+                    break
+                data += seg
+
             return data
             
     def _setTimeout(self, new_to=None):
@@ -210,8 +257,25 @@ class RpcClient(object):
     def _handleException(self, exception_object):
         raise NotImplementedError
     
+    def _getException(self, recv_error):
+        """
+        Build the RpcError exception for an error received from the server
+        """
+        err_obj = JsonRpc_to_RpcErrors.get(type(recv_error), RpcError)
+        
+        if err_obj is RpcServerBusy:
+            retry_after = (recv_error.data or {}).get('retry_after')
+            return RpcServerBusy(recv_error.message, retry_after)
+        
+        else:
+            return err_obj(recv_error.message)
+    
     def __getattr__(self, name):
-        return lambda *args, **kwargs: self._rpcCall(name, *args, **kwargs)
+        def method(client, *args, **kwargs):
+            return client._rpcCall(name, *args, **kwargs)
+        
+        # Bound to the client, so callers can tell which client a method uses
+        return types.MethodType(method, self)
     
     def _rpcCall(self, remote_method, *args, **kwargs):
         """
@@ -240,12 +304,17 @@ class RpcClient(object):
             try:
                 # Lock against concurrent access
                 with self.rpc_lock:
+                    t_start = time.time()
                     self._send(out_str)
                     
                     # Wait for return data or timeout
                     data = self._recv()
                 
                 if data:
+                    if self.recorder is not None:
+                        self.recorder.record('%s:%s' % (self.address, self.port),
+                                             out_str, data, t_start, time.time())
+                    
                     packet = JsonRpcPacket(data)
                     errors = packet.getErrors()
                     responses = packet.getResponses()
@@ -259,7 +328,7 @@ class RpcClient(object):
                             # Create a subclass hook for exception handling
                             self._handleException(err_obj)
                         except NotImplementedError:
-                            raise err_obj(recv_error.message)
+                            raise self._getException(recv_error)
                     
                     elif len(responses) == 1:
                         resp = responses[0]
@@ -279,6 +348,68 @@ class RpcClient(object):
                 self.logger.exception("Invalid RPC Packet")
                     
         raise RpcTimeout("The operation timed out")
-    
+
+    def stream(self, remote_method, *args, **kwargs):
+        """
+        Calls a function on the remote host and returns an iterator over the
+        streamed result. If the remote function returns a generator, each item
+        it yields is received as a separate chunk, so neither side has to hold
+        the complete result in memory. Other results are received as a single
+        chunk.
+
+        The stream is read on a separate connection that is closed when the
+        iterator is exhausted or closed, so other calls can be made while the
+        stream is consumed.
+
+        Exceptions:
+            - Same as :func:`_rpcCall`, raised when the chunk is reached
+        """
+        nextID = int(self.nextID)
+        self.nextID += 1
+        packet = JsonRpcPacket()
+        packet.addStreamRequest(nextID, remote_method, *args, **kwargs)
+
+        out_str = packet.export()
+
+        sock = self._openSocket()
+        try:
+            sock.sendall(out_str)
+
+            buf = ''
+            while True:
+                # Frames are terminated by a newline
+                while '\n' not in buf:
+                    ready_to_read, _, _ = select.select([sock], [], [], self.timeout)
+                    if sock not in ready_to_read:
+                        raise RpcTimeout("The operation timed out")
+
+                    data = sock.recv(self.RPC_MAX_PACKET_SIZE)
+                    if data == '':
+                        raise RpcServerUnresponsive("Connection closed during stream")
+                    buf += data
+
+                frame, buf = buf.split('\n', 1)
+
+                packet = JsonRpcPacket(frame)
+                errors = packet.getErrors()
+                responses = packet.getResponses()
+
+                if len(errors) > 0:
+                    raise self._getException(errors[0])
+
+                elif len(responses) == 1:
+                    resp = responses[0]
+
+                    if resp.getStream() == 'end':
+                        return
+                    
+                    yield resp.getResult()
+
+                else:
+                    raise RpcInvalidPacket("An incorrectly formatted packet was recieved")
+
+        finally:
+            sock.close()
+
     def __str__(self):
         return '<RPC Instance of %s:%s>' % (self.address, self.port)
\ No newline at end of file
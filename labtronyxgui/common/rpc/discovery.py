@@ -0,0 +1,369 @@
+import threading
+import socket
+import select
+import struct
+import logging
+import json
+import time
+
+"""
+Host Discovery
+--------------
+Finds RpcServer instances on the local network without knowing their address.
+
+A server that has discovery enabled runs a :class:`DiscoveryResponder`, which
+listens for queries on a well known UDP port, both as multicast and broadcast,
+and answers each query with an announcement containing its hostname and RPC
+port. :class:`HostDiscovery` sends one query to every target at once and
+collects the announcements that arrive before the timeout, so a probe takes
+the same time for one or for hundreds of servers. Results are cached with a
+time-to-live so callers can ask for the known hosts as often as they like.
+
+Messages are JSON objects::
+
+    {"type": "query", "id": 12}
+    {"type": "announce", "id": 12, "hostname": "lab-pc-1", "port": 6780, ...}
+"""
+
+DISCOVERY_PORT = 6779
+DISCOVERY_GROUP = '239.255.67.79'
+
+MAX_PACKET_SIZE = 8192
+
+class DiscoveryResponder(threading.Thread):
+    """
+    Answers discovery queries for an RpcServer. See :func:`RpcServer.enableDiscovery`.
+
+    :param port: RPC port of the server
+    :type port: int
+    :param name: Server name
+    :type name: str
+    :param discovery_port: UDP port to listen for queries on
+    :type discovery_port: int
+    :param group: Multicast group to join, None to only answer broadcast and
+                  unicast queries
+    :type group: str
+    :param logger: Logger instance if you wish to override the internal instance
+    :type logger: Logging.logger
+    """
+
+    def __init__(self, port, name='RPCServer', **kwargs):
+        threading.Thread.__init__(self, name='DiscoveryResponder')
+        self.daemon = True
+
+        self.port = port
+        self.logger = kwargs.get('logger', logging)
+        self.discovery_port = kwargs.get('discovery_port', DISCOVERY_PORT)
+        self.group = kwargs.get('group', DISCOVERY_GROUP)
+
+        self.info = {'type': 'announce',
+                     'hostname': socket.gethostname(),
+                     'port': port,
+                     'name': name}
+
+        # Several servers on one machine may answer on the same port
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            try:
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            except socket.error:
+                pass
+        self.socket.bind(('', self.discovery_port))
+
+        if self.group is not None:
+            try:
+                mreq = struct.pack('4sl', socket.inet_aton(self.group), socket.INADDR_ANY)
+                self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+            except socket.error:
+                # No multicast route, broadcast and unicast still work
+                self.logger.warning('Unable to join discovery group %s', self.group)
+
+        self.e_alive = threading.Event()
+        self.e_alive.set()
+
+    def run(self):
+        while self.e_alive.is_set():
+            try:
+                ready, _, _ = select.select([self.socket], [], [], 0.5)
+                if self.socket not in ready:
+                    continue
+
+                data, address = self.socket.recvfrom(MAX_PACKET_SIZE)
+
+                try:
+                    query = json.loads(data)
+                except ValueError:
+                    continue
+
+                if not isinstance(query, dict) or query.get('type') != 'query':
+                    continue
+
+                announce = dict(self.info)
+                announce['id'] = query.get('id')
+
+                self.socket.sendto(json.dumps(announce), address)
+
+            except socket.error:
+                if self.e_alive.is_set():
+                    self.logger.exception('Error in discovery responder')
+                    time.sleep(0.5)
+
+        self.socket.close()
+
+    def stop(self):
+        self.e_alive.clear()
+
+class HostDiscovery(object):
+    """
+    Finds RpcServers on the network and caches the results. Probes can be run
+    on demand with :func:`probe` or periodically in a background thread with
+    :func:`start`.
+
+    :param targets: Addresses to send queries to. Defaults to the discovery
+                    multicast group and the broadcast address. Explicit
+                    addresses and subnets in CIDR notation (e.g.
+                    '10.0.1.0/24') can be added to reach networks that do not
+                    forward multicast or broadcast.
+    :type targets: list
+    :param ttl: Time in seconds a discovered host is kept without answering
+                again
+    :type ttl: float
+    :param timeout: Time in seconds to wait for answers to a probe
+    :type timeout: float
+    :param discovery_port: UDP port servers listen for queries on
+    :type discovery_port: int
+    :param logger: Logger instance if you wish to override the internal instance
+    :type logger: Logging.logger
+    """
+
+    DEFAULT_TTL = 60.0
+    DEFAULT_TIMEOUT = 1.0
+
+    # Largest subnet expanded into single addresses
+    MAX_SUBNET_HOSTS = 4096
+
+    def __init__(self, targets=None, **kwargs):
+        self.logger = kwargs.get('logger', logging)
+        self.ttl = kwargs.get('ttl', self.DEFAULT_TTL)
+        self.timeout = kwargs.get('timeout', self.DEFAULT_TIMEOUT)
+        self.discovery_port = kwargs.get('discovery_port', DISCOVERY_PORT)
+
+        if targets is None:
+            targets = [DISCOVERY_GROUP, '<broadcast>']
+        self.targets = targets
+
+        # (hostname, port) -> (announcement, expiry time)
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.nextID = 1
+
+        self.lastProbe = None
+
+        self._thread = None
+        self.e_alive = threading.Event()
+        self.e_request = threading.Event()
+
+    @classmethod
+    def expandTargets(cls, targets):
+        """
+        Expand subnets in CIDR notation into single host addresses
+
+        :param targets: Addresses, hostnames and subnets
+        :type targets: list
+        :returns: list of addresses
+        """
+        expanded = []
+
+        for target in targets:
+            if '/' not in target:
+                expanded.append(target)
+                continue
+
+            network, prefix = target.split('/')
+            prefix = int(prefix)
+            if prefix < 0 or prefix > 32:
+                raise ValueError('Invalid subnet: %s' % target)
+
+            size = 1 << (32 - prefix)
+            if size > cls.MAX_SUBNET_HOSTS:
+                raise ValueError('Subnet too large: %s' % target)
+
+            base = struct.unpack('!L', socket.inet_aton(network))[0] & ~(size - 1) & 0xFFFFFFFF
+
+            if size <= 2:
+                hosts = range(size)
+            else:
+                # Skip the network and broadcast addresses
+                hosts = range(1, size - 1)
+
+            for offset in hosts:
+                expanded.append(socket.inet_ntoa(struct.pack('!L', base + offset)))
+
+        return expanded
+
+    def probe(self, targets=None, timeout=None):
+        """
+        Send a query to every target and collect the answers until the timeout.
+        Blocks for the timeout.
+
+        :param targets: Override the targets given to the constructor
+        :type targets: list
+        :param timeout: Override the probe timeout
+        :type timeout: float
+        :returns: dict - (hostname, port) -> announcement of the hosts that answered
+        """
+        targets = self.expandTargets(targets if targets is not None else self.targets)
+        timeout = timeout if timeout is not None else self.timeout
+
+        with self._lock:
+            queryID = self.nextID
+            self.nextID += 1
+
+        query = json.dumps({'type': 'query', 'id': queryID})
+
+        found = {}
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+            sock.setblocking(0)
+
+            # Send all queries first, answers are collected together
+            for target in targets:
+                try:
+                    sock.sendto(query, (target, self.discovery_port))
+                except socket.error as e:
+                    self.logger.debug('Unable to send discovery query to %s: %s', target, e)
+
+            deadline = time.time() + timeout
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+
+                ready, _, _ = select.select([sock], [], [], remaining)
+                if sock not in ready:
+                    continue
+
+                try:
+                    data, (address, _) = sock.recvfrom(MAX_PACKET_SIZE)
+                    announce = json.loads(data)
+                except (socket.error, ValueError):
+                    continue
+
+                if (not isinstance(announce, dict) or announce.get('type') != 'announce' or
+                        announce.get('id') != queryID):
+                    continue
+
+                # A host that answers on several interfaces is only listed once
+                announce['address'] = address
+                found[(announce.get('hostname'), announce.get('port'))] = announce
+
+        finally:
+            sock.close()
+
+        self.update(found)
+
+        return found
+
+    def update(self, found):
+        """
+        Add announcements to the cache and renew the hosts that answered
+        """
+        expires = time.time() + self.ttl
+
+        with self._lock:
+            for key, announce in found.items():
+                if key not in self._cache:
+                    self.logger.info('Discovered host %s (%s:%s)', announce.get('hostname'),
+                                     announce.get('address'), announce.get('port'))
+                self._cache[key] = (announce, expires)
+
+            self.lastProbe = time.time()
+
+    def getHosts(self):
+        """
+        Get the hosts that have answered within the TTL. Does not block.
+
+        :returns: list of announcements sorted by hostname, each with
+                  'hostname', 'address' and 'port'
+        """
+        now = time.time()
+
+        with self._lock:
+            for key, (announce, expires) in self._cache.items():
+                if expires < now:
+                    del self._cache[key]
+
+            hosts = [announce for announce, expires in self._cache.values()]
+
+        return sorted(hosts, key=lambda announce: (announce.get('hostname'), announce.get('port')))
+
+    def discover(self, max_age=None):
+        """
+        Get the known hosts, probing first if the last probe is older than
+        `max_age`. Blocks while probing.
+
+        :param max_age: Maximum age of the results in seconds. Defaults to the TTL
+        :type max_age: float
+        :returns: list of announcements
+        """
+        if max_age is None:
+            max_age = self.ttl
+
+        if self.lastProbe is None or time.time() - self.lastProbe > max_age:
+            self.probe()
+
+        return self.getHosts()
+
+    #===========================================================================
+    # Background probing
+    #===========================================================================
+
+    def start(self, interval=None):
+        """
+        Probe in a background thread, once now and then every `interval`
+        seconds or when requested
+
+        :param interval: Time in seconds between probes. Defaults to half the TTL
+        :type interval: float
+        """
+        if self._thread is not None:
+            return
+
+        if interval is None:
+            interval = self.ttl / 2.0
+
+        self.e_alive.set()
+        self.e_request.set()
+
+        self._thread = threading.Thread(target=self._run, args=(interval,), name='HostDiscovery')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, interval):
+        while self.e_alive.is_set():
+            self.e_request.wait(0.5)
+
+            due = self.lastProbe is None or time.time() - self.lastProbe >= interval
+
+            if self.e_request.is_set() or due:
+                self.e_request.clear()
+
+                try:
+                    self.probe()
+                except:
+                    self.logger.exception('Exception during host discovery')
+                    self.lastProbe = time.time()
+
+    def request(self):
+        """
+        Probe as soon as possible in the background thread
+        """
+        self.e_request.set()
+
+    def stop(self):
+        self.e_alive.clear()
+        self._thread = None
@@ -28,11 +28,23 @@ class RpcInvalidPacket(RpcError):
 class RpcMethodNotFound(RpcError):
     pass
 
+class RpcServerBusy(RpcError):
+    """
+    Raised when the server refuses a connection or request because it is
+    overloaded. `retry_after` is the number of seconds the server suggests
+    waiting before trying again.
+    """
+    def __init__(self, message=None, retry_after=None):
+        RpcError.__init__(self, message)
+        
+        self.retry_after = retry_after
+
 JsonRpc_to_RpcErrors = {JsonRpc_ParseError: RpcInvalidPacket,
                       JsonRpc_InvalidRequest: RpcInvalidPacket,
                       JsonRpc_MethodNotFound: RpcMethodNotFound,
                       JsonRpc_InvalidParams: RpcServerException,
                       JsonRpc_InternalError: RpcError,
-                      JsonRpc_ServerException: RpcServerException}
+                      JsonRpc_ServerException: RpcServerException,
+                      JsonRpc_ServerBusy: RpcServerBusy}
     
 
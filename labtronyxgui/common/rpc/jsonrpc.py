@@ -28,13 +28,22 @@ class JsonRpc_Error(RuntimeError):
             error = rpc_dict.get('error', {})
             self.code = error.get('code', None)
             self.message = error.get('message', None)
+            self.data = error.get('data', None)
+            
+        else:
+            self.data = rpc_dict.get('data', self.data)
         
     def __str__(self):
         return repr(str(self.message))
         
     def export(self):
+        error = {'code': self.code, 'message': self.message}
+        
+        if self.data is not None:
+            error['data'] = self.data
+            
         return {'id': self.id,
-                'error': {'code': self.code, 'message': self.message}}
+                'error': error}
 
 class JsonRpc_ParseError(JsonRpc_Error):
     code = -32700
@@ -60,12 +69,17 @@ class JsonRpc_ServerException(JsonRpc_Error):
     code = -32000
     message = 'An unhandled server exception occurred'
 
+class JsonRpc_ServerBusy(JsonRpc_Error):
+    code = -32001
+    message = 'The server is busy, retry the request later'
+
 JsonRpcErrors = {  -32700: JsonRpc_ParseError,
                    -32600: JsonRpc_InvalidRequest,
                    -32601: JsonRpc_MethodNotFound,
                    -32602: JsonRpc_InvalidParams,
                    -32603: JsonRpc_InternalError,
-                   -32000: JsonRpc_ServerException  } 
+                   -32000: JsonRpc_ServerException,
+                   -32001: JsonRpc_ServerBusy  } 
                  # -32000 to -32099 are reserved server-errors
                  
 #===============================================================================
@@ -78,12 +92,16 @@ class JsonRpc_Request(object):
         self.method = rpc_dict.get('method', '')
         self.params = rpc_dict.get('params', [])
         self.kwargs = rpc_dict.get('kwargs', {})
+        self.stream = rpc_dict.get('stream', False)
         
     def getID(self):
         return self.id
     
     def getMethod(self):
         return self.method
+    
+    def isStream(self):
+        return self.stream is True
         
     def export(self):
         # Slight modification of the JSON RPC 2.0 specification to allow 
@@ -98,6 +116,10 @@ class JsonRpc_Request(object):
         elif len(self.params) == 0:
             out['params'] = self.kwargs
             
+        # Extension to request a streamed result
+        if self.stream:
+            out['stream'] = True
+            
         return out
         
     def call(self, target):
@@ -118,16 +140,28 @@ class JsonRpc_Response(object):
 
         self.id = rpc_dict.get('id', None)
         self.result = rpc_dict.get('result', None)
+        self.stream = rpc_dict.get('stream', None)
         
     def getID(self):
         return self.id
         
     def getResult(self):
         return self.result
+    
+    def getStream(self):
+        """
+        Get the stream state of a streamed result frame
+        
+        :returns: 'chunk', 'end' or None if the response is not streamed
+        """
+        return self.stream
         
     def export(self):
         ret = {'id': self.id,
                'result': self.result}
+        
+        if self.stream is not None:
+            ret['stream'] = self.stream
             
         return ret
      
@@ -200,6 +234,17 @@ class JsonRpcPacket(object):
                                              params=args,
                                              kwargs=kwargs))
         
+    def addStreamRequest(self, id, method, *args, **kwargs):
+        """
+        Add a request for a streamed result. The server answers with a series
+        of newline terminated response frames, see :func:`addStreamResponse`
+        """
+        self.requests.append(JsonRpc_Request(id=id,
+                                             method=method,
+                                             params=args,
+                                             kwargs=kwargs,
+                                             stream=True))
+        
     def clearRequests(self):
         self.requests = []
     
@@ -210,6 +255,15 @@ class JsonRpcPacket(object):
         self.responses.append(JsonRpc_Response(id=id,
                                                result=result))
         
+    def addStreamResponse(self, id, result, stream='chunk'):
+        """
+        Add a streamed result frame. A stream is a series of 'chunk' frames
+        terminated by a single 'end' frame.
+        """
+        self.responses.append(JsonRpc_Response(id=id,
+                                               result=result,
+                                               stream=stream))
+        
     def clearResponses(self):
         self.responses = []
     
@@ -229,6 +283,11 @@ class JsonRpcPacket(object):
         if id is not None:
             self.errors.append(JsonRpc_MethodNotFound(id=id))
     
+    def addError_ServerBusy(self, id, retry_after=None):
+        # Sent even without an id when a connection is refused
+        self.errors.append(JsonRpc_ServerBusy(id=id,
+                                              data={'retry_after': retry_after}))
+    
     def getErrors(self):
         return self.errors
     
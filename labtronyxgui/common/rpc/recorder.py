@@ -0,0 +1,256 @@
+import threading
+import logging
+import json
+import gzip
+import time
+import collections
+
+from jsonrpc import *
+from errors import *
+from server import RpcServer
+
+"""
+RPC Session Record and Replay
+
+Captures RPC traffic between an RpcClient and a remote server to a session file
+and serves the recorded responses back from an RpcReplayServer. Session files
+contain one compact JSON object per line. The first line is a header, every
+other line is a single transaction:
+
+    {"t": 1.25, "dt": 0.004, "host": "10.0.0.2:6780",
+     "req": {<JSON-RPC request>}, "resp": {<JSON-RPC response or error>}}
+
+`t` is the time the request was sent, relative to the start of the recording,
+and `dt` is the round-trip time of the request. Filenames that end in `.gz`
+are transparently compressed.
+"""
+
+RPC_SESSION_FORMAT = 'labtronyx-rpc-session'
+RPC_SESSION_VERSION = 1
+
+def _openSession(filename, mode):
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode)
+    else:
+        return open(filename, mode)
+
+class RpcRecorder(object):
+    """
+    Records RPC transactions to a session file. A single recorder may be shared
+    by several RpcClient instances.
+
+    Example::
+
+        recorder = RpcRecorder('session.jsonl.gz')
+        client = RpcClient('localhost', 6780, recorder=recorder)
+        ...
+        recorder.close()
+
+    :param filename: Session file to create
+    :type filename: str
+    :param logger: Logger instance if you wish to override the internal instance
+    :type logger: Logging.logger
+    """
+
+    def __init__(self, filename, **kwargs):
+        self.filename = filename
+        self.logger = kwargs.get('logger', logging)
+
+        self.lock = threading.Lock()
+        self.startTime = time.time()
+        self.count = 0
+
+        self._file = _openSession(self.filename, 'wb')
+        self._write({'format': RPC_SESSION_FORMAT,
+                     'version': RPC_SESSION_VERSION,
+                     'start': self.startTime})
+
+    def _write(self, obj):
+        self._file.write(json.dumps(obj, separators=(',', ':')) + '\n')
+
+    def record(self, host, data_out, data_in, t_start, t_end):
+        """
+        Record a single transaction using the encoded JSON-RPC packets that
+        were sent and received.
+
+        :param host: Remote host identifier (address:port)
+        :type host: str
+        :param data_out: Encoded request packet
+        :type data_out: str
+        :param data_in: Encoded response packet
+        :type data_in: str
+        :param t_start: Time the request was sent
+        :type t_start: float
+        :param t_end: Time the response was received
+        :type t_end: float
+        """
+        try:
+            entry = {'t': round(t_start - self.startTime, 6),
+                     'dt': round(t_end - t_start, 6),
+                     'host': host,
+                     'req': json.loads(data_out),
+                     'resp': json.loads(data_in)}
+
+        except ValueError:
+            self.logger.warning('Unable to record malformed RPC transaction')
+            return
+
+        with self.lock:
+            if self._file is not None:
+                self._write(entry)
+                self.count += 1
+
+    def close(self):
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+def readSession(filename):
+    """
+    Read a session file created by :class:`RpcRecorder`.
+
+    :param filename: Session file
+    :type filename: str
+    :returns: list of transaction dicts in recorded order
+    :raises: RpcInvalidPacket if the file is not a session file
+    """
+    entries = []
+
+    with _openSession(filename, 'rb') as f:
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            header = {}
+
+        if header.get('format') != RPC_SESSION_FORMAT:
+            raise RpcInvalidPacket('%s is not an RPC session file' % filename)
+
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+
+    return entries
+
+def _requestKey(method, params, kwargs):
+    """
+    Build a hashable key for a request from its method and arguments
+    """
+    if type(params) == dict and len(kwargs) == 0:
+        # Only keyword parameters
+        params, kwargs = [], params
+
+    return (method, json.dumps([list(params), kwargs], sort_keys=True))
+
+class RpcReplayServer(RpcServer):
+    """
+    RPC Server that answers requests from a recorded session instead of a live
+    object. Requests are matched on method name and parameters. Recorded
+    responses are served in order, the last response for a request is repeated
+    once the recording is exhausted so that polling loops continue to work.
+    Calls of a recorded method with parameters that were never recorded fail
+    with an invalid parameters error naming the call.
+
+    Methods that are not present in the recording are dispatched normally, so
+    objects can still be registered with :func:`registerObject`.
+
+    Replay follows the timeline of the recording. The first replayed request
+    is aligned with its recorded time `t`, after that no response is sent
+    before its recorded time `t + dt` or sooner than `dt` after the request
+    arrived. The server runs one call at a time, so calls that overlapped in
+    the recording can be delayed by each other.
+
+    Recorded errors are sent back unchanged, so clients see the same
+    exception type and message as in the recording.
+
+    :param session: Session file created by :class:`RpcRecorder`
+    :type session: str
+    :param speed: Timing scale factor. 1.0 replays with the original timing,
+                  2.0 twice as fast, 0 answers immediately
+    :type speed: float
+    """
+
+    def __init__(self, session, **kwargs):
+        self.speed = float(kwargs.pop('speed', 1.0))
+
+        self._replay_lock = threading.Lock()
+        self._replay_start = None
+        self._replay_exact = collections.defaultdict(collections.deque)
+        self._replay_methods = set()
+
+        for entry in readSession(session):
+            req = entry.get('req', {})
+            if type(req) == list or type(entry.get('resp')) == list:
+                # Batch transactions are not replayed
+                continue
+
+            method = req.get('method', '')
+            key = _requestKey(method, req.get('params', []), req.get('kwargs', {}))
+
+            self._replay_exact[key].append(entry)
+            self._replay_methods.add(method)
+
+        RpcServer.__init__(self, **kwargs)
+
+    def _nextEntry(self, method, args, kwargs):
+        key = _requestKey(method, args, kwargs)
+
+        with self._replay_lock:
+            queue = self._replay_exact.get(key)
+
+            if queue is None:
+                return None
+            elif len(queue) > 1:
+                return queue.popleft()
+            else:
+                return queue[0]
+
+    def findMethod(self, method):
+        if method not in self._replay_methods:
+            return RpcServer.findMethod(self, method)
+
+        # Called before the request waits for the scheduler
+        arrival = time.time()
+
+        def replay(*args, **kwargs):
+            entry = self._nextEntry(method, args, kwargs)
+
+            if entry is None:
+                raise JsonRpc_InvalidParams(error={
+                    'code': JsonRpc_InvalidParams.code,
+                    'message': 'No recorded response for %s with params %s' % (
+                        method, _requestKey(method, args, kwargs)[1])})
+
+            if self.speed > 0:
+                self._wait(entry, arrival)
+
+            resp = entry.get('resp', {})
+            if 'error' in resp:
+                raise self._getException(resp['error'])
+
+            return resp.get('result')
+
+        return replay
+
+    def _wait(self, entry, arrival):
+        t = entry.get('t', 0.0) / self.speed
+        dt = entry.get('dt', 0.0) / self.speed
+
+        with self._replay_lock:
+            if self._replay_start is None:
+                self._replay_start = arrival - t
+
+            due = max(self._replay_start + t + dt, arrival + dt)
+
+        delay = due - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _getException(self, error):
+        """
+        Build an exception that the server sends back as the recorded error
+        """
+        err_obj = JsonRpcErrors.get(error.get('code'), JsonRpc_Error)
+
+        return err_obj(error=error)
@@ -0,0 +1,336 @@
+import threading
+import logging
+import collections
+import contextlib
+import fnmatch
+import time
+
+from errors import *
+
+"""
+RPC Request Scheduler
+
+Serializes execution of RPC requests like a lock, but grants the lock by
+priority class instead of arrival order. Within a priority class, waiting
+connections are served round-robin so that one connection issuing requests in
+a tight loop cannot starve the others.
+
+The scheduler is not preemptive: a control request that arrives while a bulk
+request is executing waits for that request to finish, but is always the next
+request to run.
+"""
+
+RPC_PRIORITY_CONTROL = 0
+RPC_PRIORITY_INTERACTIVE = 1
+RPC_PRIORITY_BULK = 2
+
+RpcPriorities = {'control': RPC_PRIORITY_CONTROL,
+                 'interactive': RPC_PRIORITY_INTERACTIVE,
+                 'bulk': RPC_PRIORITY_BULK}
+
+class RpcScheduler(object):
+    """
+    Priority and fairness aware replacement for a plain execution lock.
+
+    Methods are classified by matching their name against a list of
+    shell-style patterns. The first matching rule wins, methods that do not
+    match any rule are `interactive`.
+
+    :param rate_limit: Default maximum request rate per connection in requests
+                       per second, None to disable. Must be positive. Control
+                       requests are never rate limited.
+    :type rate_limit: float
+    :param max_pending: Maximum number of requests waiting for execution.
+                        Requests beyond this limit are refused with
+                        RpcServerBusy. Control requests are never refused.
+    :type max_pending: int
+    :param retry_after: Retry hint in seconds sent with refused requests
+    :type retry_after: float
+    :param logger: Logger instance if you wish to override the internal instance
+    :type logger: Logging.logger
+    """
+
+    DEFAULT_RULES = [('rpc_*', RPC_PRIORITY_CONTROL),
+                     ('power*', RPC_PRIORITY_CONTROL),
+                     ('set*', RPC_PRIORITY_CONTROL),
+                     ('stop*', RPC_PRIORITY_CONTROL),
+                     ('abort*', RPC_PRIORITY_CONTROL),
+                     ('reset*', RPC_PRIORITY_CONTROL),
+                     ('trigger*', RPC_PRIORITY_CONTROL),
+                     ('getWaveform*', RPC_PRIORITY_BULK),
+                     ('getCollector*', RPC_PRIORITY_BULK),
+                     ('getMeasurement*', RPC_PRIORITY_BULK),
+                     ('getLog*', RPC_PRIORITY_BULK)]
+
+    def __init__(self, **kwargs):
+        self.logger = kwargs.get('logger', logging)
+        self.rate_limit = self._checkRate(kwargs.get('rate_limit', None))
+        self.max_pending = kwargs.get('max_pending', None)
+        self.retry_after = kwargs.get('retry_after', 1.0)
+
+        self.rules = list(self.DEFAULT_RULES)
+        self._priority_cache = {}
+
+        self._lock = threading.Lock()
+        self._busy = False
+        self._pending = 0
+        self._closed = False
+
+        # Priority -> OrderedDict(client -> deque of waiting tickets)
+        self._waiting = [collections.OrderedDict() for p in RpcPriorities]
+
+        # Rate limiting: client -> [rate, tokens, last update]
+        self._buckets = {}
+
+        # Statistics
+        self.stats_requests = [0] * len(RpcPriorities)
+        self.stats_wait = [0.0] * len(RpcPriorities)
+        self.stats_throttled = 0
+        self.stats_rejected = 0
+
+    #===========================================================================
+    # Classification
+    #===========================================================================
+
+    def registerPriority(self, pattern, priority):
+        """
+        Assign a priority class to all methods matching a pattern. Rules added
+        later take precedence over existing rules.
+
+        :param pattern: Shell-style method name pattern (e.g. 'getWaveform*')
+        :type pattern: str
+        :param priority: 'control', 'interactive' or 'bulk'
+        :type priority: str
+        """
+        priority = RpcPriorities.get(priority, priority)
+        if priority not in RpcPriorities.values():
+            raise ValueError('Invalid priority class: %s' % priority)
+
+        with self._lock:
+            self.rules.insert(0, (pattern, priority))
+            self._priority_cache = {}
+
+    def getPriority(self, method):
+        """
+        Get the priority class of a method
+
+        :returns: int
+        """
+        try:
+            return self._priority_cache[method]
+        except KeyError:
+            pass
+
+        priority = RPC_PRIORITY_INTERACTIVE
+        for pattern, rule_priority in self.rules:
+            if fnmatch.fnmatchcase(method, pattern):
+                priority = rule_priority
+                break
+
+        self._priority_cache[method] = priority
+        return priority
+
+    #===========================================================================
+    # Rate Limiting
+    #===========================================================================
+
+    def setRateLimit(self, client, rate):
+        """
+        Override the request rate limit for a single connection
+
+        :param client: Connection identifier
+        :param rate: Maximum requests per second, None to disable
+        :type rate: float
+        :raises: ValueError if the rate is not positive
+        """
+        rate = self._checkRate(rate)
+
+        with self._lock:
+            if rate is None:
+                self._buckets[client] = None
+            else:
+                self._buckets[client] = [float(rate), float(rate), time.time()]
+
+    @staticmethod
+    def _checkRate(rate):
+        if rate is not None and rate <= 0:
+            raise ValueError('Rate limit must be positive, use None to disable it')
+
+        return rate
+
+    def _throttle(self, client):
+        """
+        Token bucket rate limiter. Returns the time in seconds the caller must
+        wait before the request may be queued.
+        """
+        with self._lock:
+            if client not in self._buckets:
+                if self.rate_limit is None:
+                    self._buckets[client] = None
+                else:
+                    rate = float(self.rate_limit)
+                    self._buckets[client] = [rate, rate, time.time()]
+
+            bucket = self._buckets[client]
+            if bucket is None:
+                return 0.0
+
+            rate, tokens, last = bucket
+            now = time.time()
+            # Allow bursts of up to one second worth of requests
+            tokens = min(max(rate, 1.0), tokens + (now - last) * rate)
+            tokens -= 1.0
+
+            bucket[1], bucket[2] = tokens, now
+
+            if tokens < 0:
+                self.stats_throttled += 1
+                return -tokens / rate
+            else:
+                return 0.0
+
+    #===========================================================================
+    # Scheduling
+    #===========================================================================
+
+    def acquire(self, client, method):
+        """
+        Block until the request is allowed to execute
+
+        :param client: Connection identifier used for fairness and rate limits
+        :param method: Method name used for classification
+        :type method: str
+        :returns: Priority class of the request
+        :raises: RpcServerBusy if the request queue is full
+        """
+        priority = self.getPriority(method)
+
+        if priority != RPC_PRIORITY_CONTROL:
+            delay = self._throttle(client)
+            if delay > 0:
+                time.sleep(delay)
+
+        t_start = time.time()
+
+        with self._lock:
+            if self._closed:
+                raise RpcServerBusy('Server is shutting down')
+
+            if not self._busy:
+                self._busy = True
+                self.stats_requests[priority] += 1
+                return priority
+
+            if (self.max_pending is not None and priority != RPC_PRIORITY_CONTROL
+                    and self._pending >= self.max_pending):
+                self.stats_rejected += 1
+                raise RpcServerBusy('Request queue is full', self.retry_after)
+
+            # Only admitted requests are counted
+            self.stats_requests[priority] += 1
+
+            ticket = threading.Event()
+            ticket.cancelled = False
+            self._waiting[priority].setdefault(client, collections.deque()).append(ticket)
+            self._pending += 1
+
+        # Ownership is handed over by release()
+        ticket.wait()
+
+        if ticket.cancelled:
+            raise RpcServerBusy('Server is shutting down')
+
+        with self._lock:
+            self.stats_wait[priority] += time.time() - t_start
+
+        return priority
+
+    def release(self):
+        """
+        Release execution to the next waiting request
+        """
+        with self._lock:
+            for waiting in self._waiting:
+                if len(waiting) > 0:
+                    # Round-robin: take the first client and move it to the back
+                    client, tickets = waiting.popitem(last=False)
+                    ticket = tickets.popleft()
+                    if len(tickets) > 0:
+                        waiting[client] = tickets
+                    self._pending -= 1
+
+                    ticket.set()
+                    return
+
+            self._busy = False
+
+    @contextlib.contextmanager
+    def request(self, client, method):
+        """
+        Context manager that holds execution for the duration of the block::
+
+            with scheduler.request(connection, 'getMeasurement'):
+                ...
+        """
+        self.acquire(client, method)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def cancel(self):
+        """
+        Refuse all waiting and future requests. The request that is currently
+        executing is not affected.
+
+        :returns: int - Number of waiting requests that were cancelled
+        """
+        with self._lock:
+            self._closed = True
+            cancelled = 0
+
+            for waiting in self._waiting:
+                for tickets in waiting.values():
+                    for ticket in tickets:
+                        ticket.cancelled = True
+                        ticket.set()
+                        cancelled += 1
+
+                waiting.clear()
+
+            self._pending = 0
+
+            return cancelled
+
+    def removeClient(self, client):
+        """
+        Forget rate limit state for a connection that has closed
+        """
+        with self._lock:
+            self._buckets.pop(client, None)
+
+    def getPending(self):
+        """
+        Get the number of requests waiting for execution
+
+        :returns: int
+        """
+        return self._pending
+
+    def getStatistics(self):
+        """
+        Get scheduler statistics per priority class
+
+        :returns: dict
+        """
+        with self._lock:
+            stats = {'throttled': self.stats_throttled,
+                     'rejected': self.stats_rejected,
+                     'pending': self._pending}
+
+            for name, priority in RpcPriorities.items():
+                count = self.stats_requests[priority]
+                stats[name] = {'requests': count,
+                               'wait_total': self.stats_wait[priority]}
+
+            return stats
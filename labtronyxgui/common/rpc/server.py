@@ -5,10 +5,13 @@ import select
 import logging
 import inspect
 import errno
+import time
 from datetime import datetime
 
 from jsonrpc import *
 from errors import *
+from scheduler import *
+from discovery import DiscoveryResponder
 
 class RpcServer(object):
     """
@@ -23,21 +26,45 @@ class RpcServer(object):
     :type name: str
     :param type: Server type - 'TCP' or 'UDP'
     :type type: str
+    :param rate_limit: Maximum request rate per connection in requests per
+                       second, must be positive (default: unlimited)
+    :type rate_limit: float
+    :param max_connections: Maximum number of open connections. Additional
+                            connections are refused with a server busy error
+    :type max_connections: int
+    :param max_pending: Maximum number of requests waiting for execution.
+                        Additional requests are refused with a server busy
+                        error
+    :type max_pending: int
+    :param retry_after: Retry hint in seconds sent with server busy errors
+    :type retry_after: float
     
     .. note::
 
         Method calls to functions that begin with an underscore are considered 
         protected and will not be invoked
+        
+    .. note::
+    
+        Requests are executed one at a time in order of priority class. See
+        :func:`registerPriority` to change the class of a method.
     """
     DEBUG_RPC_SERVER = False
     
     _identity = 'JSON-RPC/2.0'
     type = "TCP"
     
+    RPC_MAX_CONNECTIONS = 32
+    RPC_MAX_PENDING = 128
+    RPC_RETRY_AFTER = 1.0 # seconds
+    RPC_GRACE_PERIOD = 5.0 # seconds
+    
     def __init__(self, **kwargs):
         self.logger = kwargs.get('logger', logging)
         self.port = kwargs.get('port', 0)
         self.name = kwargs.get('name', 'RPCServer')
+        self.max_connections = kwargs.get('max_connections', self.RPC_MAX_CONNECTIONS)
+        self.retry_after = kwargs.get('retry_after', self.RPC_RETRY_AFTER)
             
         # RPC State Variables
         self.rpc_objects = []
@@ -48,10 +75,21 @@ class RpcServer(object):
         # Registered Clients
         self.connections_reg = {}
         
-        self.rpc_lock = threading.Lock()
+        # Overload counters
+        self.stats_connections_accepted = 0
+        self.stats_connections_rejected = 0
+        self.stats_shutdown = {}
+        
+        self.scheduler = RpcScheduler(rate_limit=kwargs.get('rate_limit', None),
+                                      max_pending=kwargs.get('max_pending', self.RPC_MAX_PENDING),
+                                      retry_after=self.retry_after,
+                                      logger=self.logger)
         self.rpc_locker = None # Connection that holds the lock
         self.rpc_startTime = datetime.now()
         
+        # Answers host discovery queries, see enableDiscovery
+        self.discovery = None
+        
         # Attempt to bind sockets
         try:
             if self.type == "TCP":
@@ -102,6 +140,58 @@ class RpcServer(object):
         except:
             pass
         
+    def registerPriority(self, pattern, priority):
+        """
+        Assign a priority class to all methods matching a pattern. Requests
+        with a higher priority class are executed before waiting requests of a
+        lower class.
+        
+        :param pattern: Shell-style method name pattern (e.g. 'getWaveform*')
+        :type pattern: str
+        :param priority: 'control', 'interactive' or 'bulk'
+        :type priority: str
+        """
+        self.scheduler.registerPriority(pattern, priority)
+        
+    def setRateLimit(self, connection, rate):
+        """
+        Override the request rate limit for a single connection
+        
+        :param connection: Connection thread
+        :type connection: RpcConnection
+        :param rate: Maximum requests per second, None to disable
+        :type rate: float
+        :raises: ValueError if the rate is not positive
+        """
+        self.scheduler.setRateLimit(connection, rate)
+        
+    def enableDiscovery(self, **kwargs):
+        """
+        Answer host discovery queries so clients on the network can find this
+        server. Keyword arguments are passed to 
+        :class:`common.rpc.discovery.DiscoveryResponder`.
+        
+        :returns: True if successful, False otherwise
+        """
+        if self.discovery is not None:
+            return True
+        
+        kwargs.setdefault('logger', self.logger)
+        
+        try:
+            self.discovery = DiscoveryResponder(self.port, self.name, **kwargs)
+            self.discovery.start()
+            return True
+        
+        except socket.error:
+            self.logger.exception('[%s] Unable to enable host discovery', self.name)
+            return False
+        
+    def disableDiscovery(self):
+        if self.discovery is not None:
+            self.discovery.stop()
+            self.discovery = None
+        
     #===========================================================================
     # Connection Management and Notifications
     #===========================================================================
@@ -208,17 +298,101 @@ class RpcServer(object):
         """
         return self.__rpc_thread.is_alive()
             
-    def rpc_stop(self):
+    def shutdown(self, grace_period=None):
+        """
+        Stop the server gracefully. New connections are no longer accepted and
+        registered clients are sent an `event_server_shutdown` notification.
+        Connections keep reading and processing requests until their client
+        is idle, so requests that were sent but not read yet are answered.
+        Connections that are still busy when the grace period expires are
+        stopped after their current request, requests still waiting for
+        execution are refused with a server busy error.
+        
+        Blocks until the server has stopped or the grace period has expired.
+        
+        :param grace_period: Time in seconds to wait for in-flight requests
+        :type grace_period: float
+        :returns: dict - Shutdown timing metrics
         """
-        Close the server srv_socket and stop the RpcServer thread
+        if grace_period is None:
+            grace_period = self.RPC_GRACE_PERIOD
+            
+        current = threading.current_thread()
+        t_start = time.time()
+        deadline = t_start + grace_period
+        
+        self.logger.info('[%s] RPC Server shutting down, grace period %.1fs', 
+                         self.name, grace_period)
+        
+        # Stop accepting new connections
+        self.__rpc_thread.stop()
+        self.disableDiscovery()
+        
+        self.notifyClients('event_server_shutdown', grace_period)
+        
+        # Connections stop once their client is idle
+        connections = [conn for conn in self._connections if conn is not current]
+        pending = self.scheduler.getPending()
+        
+        for conn in connections:
+            conn.drain(deadline)
+            
+        for conn in connections:
+            conn.join(max(0.0, deadline - time.time()))
+            
+        t_drained = time.time()
+            
+        # Refuse anything that is still waiting for execution
+        cancelled = self.scheduler.cancel()
+        
+        # The rest stop after the request they are processing completes
+        abandoned = [conn for conn in connections if conn.is_alive()]
+        
+        for conn in abandoned:
+            conn.stop()
+        
+        if self.__rpc_thread is not current:
+            self.__rpc_thread.join(max(0.0, deadline - time.time()) + 1.0)
+        
+        self.stats_shutdown = {'grace_period': grace_period,
+                               'connections': len(connections),
+                               'requests_pending': pending,
+                               'requests_cancelled': cancelled,
+                               'connections_abandoned': len(abandoned),
+                               'drain_time': t_drained - t_start,
+                               'shutdown_time': time.time() - t_start}
+        
+        self.logger.info('[%s] RPC Server stopped in %.3fs (%i connections, '
+                         '%i requests cancelled, %i connections abandoned)',
+                         self.name, self.stats_shutdown['shutdown_time'],
+                         len(connections), cancelled, len(abandoned))
+        
+        return self.stats_shutdown
+    
+    def rpc_stop(self, grace_period=None):
+        """
+        Stop the RpcServer gracefully. See :func:`shutdown`.
         
         .. note::
         
-            This operation may take a small amount of time for the srv_socket to
-            register the stop request.
+            The shutdown runs in a separate thread so that the requesting
+            connection can receive a response and be drained like any other.
+            
+        :param grace_period: Time in seconds to wait for in-flight requests
+        :type grace_period: float
         """
-        self.__rpc_thread.stop()
-        self.__rpc_thread.join()
+        shutdown_thread = threading.Thread(target=self.shutdown, 
+                                           args=(grace_period,),
+                                           name='%s-shutdown' % self.name)
+        shutdown_thread.start()
+        
+    def rpc_getShutdownStatistics(self):
+        """
+        Get timing metrics of the last shutdown
+        
+        :returns: dict
+        """
+        return self.stats_shutdown
 
     def rpc_uptime(self):
         """
@@ -264,6 +438,23 @@ class RpcServer(object):
         """
         return len(self._connections)
     
+    def rpc_getSchedulerStatistics(self):
+        """
+        Get request counts and total wait time per priority class, along with
+        the connection and request overload counters
+        
+        :returns: dict
+        """
+        stats = self.scheduler.getStatistics()
+        
+        stats.update({'connections': len(self._connections),
+                      'max_connections': self.max_connections,
+                      'connections_accepted': self.stats_connections_accepted,
+                      'connections_rejected': self.stats_connections_rejected,
+                      'max_pending': self.scheduler.max_pending})
+        
+        return stats
+    
 class RpcServerThread(threading.Thread):
     
     DEBUG_RPC_SERVER = False
@@ -298,11 +489,22 @@ class RpcServerThread(threading.Thread):
                 for srv_socket in ready_to_read:
                     # Spawn a new thread to service the connection
                     connection, address = srv_socket.accept()
+                    # Accepted sockets do not inherit non-blocking mode on all platforms
+                    connection.setblocking(0)
                     
+                    max_conn = self.server.max_connections
+                    if max_conn is not None and len(self.server._connections) >= max_conn:
+                        self.refuse(connection, address)
+                        continue
+
                     # Spawn a new thread to service the connection
                     connThread = RpcConnection(server=self.server,
                                                conn_socket=connection,
                                                logger=self.logger)
+                    
+                    # Register before starting so the limit is always accurate
+                    self.server._connections.append(connThread)
+                    self.server.stats_connections_accepted += 1
                         
                     connThread.start()
 
@@ -314,16 +516,32 @@ class RpcServerThread(threading.Thread):
         if self.DEBUG_RPC_SERVER:
             self.logger.debug('[%s] RPC Server stopped', self.name)
         
+    def refuse(self, connection, address):
+        """
+        Send a server busy error to a connection that exceeds the connection
+        limit and close it
+        """
+        self.server.stats_connections_rejected += 1
+        self.logger.warning('[%s] Connection limit reached, refusing %s', 
+                            self.name, address[0])
+        
+        packet = JsonRpcPacket()
+        packet.addError_ServerBusy(None, self.server.retry_after)
+        
+        try:
+            connection.send(packet.export())
+        except socket.error:
+            pass
+        
+        connection.close()
+        
     def stop(self, timeout=None):
+        """
+        Stop accepting connections. Open connections are drained by
+        :func:`RpcServer.shutdown`
+        """
         if self.DEBUG_RPC_SERVER:
             self.logger.debug('[%s] RPC Server asked to stop', self.name)
-        
-        for conn in self.server._connections:
-            try:
-                conn.stop()
-                #conn.join()
-            except:
-                pass
             
         self.e_alive.clear()
     
@@ -363,106 +581,227 @@ class RpcConnection(threading.Thread):
         self.e_alive = threading.Event()
         self.notification_queue = Queue.Queue()
         
+        # Set by drain, the connection stops when idle or at this time
+        self.drain_deadline = None
+        
         # Give the thread a meaningful name
         self.name = '%s-%s' % (self.server.getName(), self.address)
     
     def run(self):
         self.e_alive.set()
-        self.server._connections.append(self)
 
         if self.DEBUG_RPC_CONNECTION:
             self.logger.debug("New RPC Connection: %s", self.address)
         
-        while(self.e_alive.isSet()):
-            # Maintain the connection as long as it is open
-            try:
-                ready_to_read,_,_ = select.select([self.conn_socket],[],[], 0.1)
-                # TODO: Read until all data is in the buffer
+        try:
+            while(self.e_alive.isSet()):
+                # Maintain the connection as long as it is open
+                try:
+                    if self.drain_deadline is not None and time.time() >= self.drain_deadline:
+                        self.e_alive.clear()
+                        break
+                    
+                    ready_to_read,_,_ = select.select([self.conn_socket],[],[], 0.1)
+                    # TODO: Read until all data is in the buffer
                 
-                if self.conn_socket in ready_to_read:
+                    if self.conn_socket in ready_to_read:
                     
-                    data = self.conn_socket.recv(self.RPC_MAX_PACKET_SIZE)
+                        data = self.conn_socket.recv(self.RPC_MAX_PACKET_SIZE)
                     
-                    # Check if connection has closed
-                    if data == '':
-                        self.e_alive.clear()
-                        break
+                        # Check if connection has closed
+                        if data == '':
+                            self.e_alive.clear()
+                            break
                     
-                    seg = None
-                    # Receive the full packet
-                    try:
-                        while seg != "":
-                            seg = self.conn_socket.recv(self.RPC_MAX_PACKET_SIZE)
-                            data += seg
-                    except socket.error as e:
-                        if e.errno == errno.EWOULDBLOCK:
-                            # No more data to process
-                            pass
-                        else:
-                            pass
+                        seg = None
+                        # Receive the full packet
+                        try:
+                            while seg != "":
+                                seg = self.conn_socket.recv(self.RPC_MAX_PACKET_SIZE)
+                                data += seg
+                        except socket.error as e:
+                            if e.errno == errno.EWOULDBLOCK:
+                                # No more data to process
+                                pass
+                            else:
+                                pass
                     
-                    if data:
-                        # Process the incoming data as a JSON RPC packet
-                        in_packet = JsonRpcPacket(data)
-                        errors = in_packet.getErrors()
-                        requests = in_packet.getRequests()
+                        if data:
+                            # Process the incoming data as a JSON RPC packet
+                            in_packet = JsonRpcPacket(data)
+                            errors = in_packet.getErrors()
+                            requests = in_packet.getRequests()
                         
-                        out_packet = JsonRpcPacket()
+                            out_packet = JsonRpcPacket()
                         
-                        if len(errors) == 0:
-                            # Only process requests if no errors were found during parsing
-                            for req in requests:
-                                # Process Requests in order
-                                id = req.getID()
-                                try:
-                                    result = self.processRequest(req)
+                            if len(errors) == 0:
+                                # Only process requests if no errors were found during parsing
+                                for req in requests:
+                                    # Process Requests in order
+                                    id = req.getID()
+                                
+                                    if req.isStream():
+                                        # The client reads streams frame by frame, errors
+                                        # that occur before the first chunk need a frame
+                                        # of their own
+                                        err_packet = JsonRpcPacket()
+                                    else:
+                                        err_packet = out_packet
+                                
+                                    try:
+                                        result = self.processRequest(req)
+                                    
+                                        if req.isStream():
+                                            # Streamed results are sent as they are produced
+                                            self.sendStream(req, result)
                                     
-                                    # Check if the request was a notification
-                                    if id is not None:
-                                        out_packet.addResponse(id, result)
+                                        # Check if the request was a notification
+                                        elif id is not None:
+                                            out_packet.addResponse(id, result)
                                 
-                                # Catch exceptions during method execution
-                                # DO NOT ALLOW ANY EXCEPTIONS TO PASS THIS LEVEL   
-                                except RpcMethodNotFound:
-                                    out_packet.addError_MethodNotFound(id)
+                                    # Catch exceptions during method execution
+                                    # DO NOT ALLOW ANY EXCEPTIONS TO PASS THIS LEVEL   
+                                    except RpcMethodNotFound:
+                                        err_packet.addError_MethodNotFound(id)
                                     
-                                except TypeError:
-                                    # Raised when arguments mismatch, but also other cases
-                                    # Not a perfect solution, but whatever.
-                                    out_packet.addError_InvalidParams(id)
-                                    self.logger.exception("RPC Server Type Error")
+                                    except RpcServerBusy as e:
+                                        err_packet.addError_ServerBusy(id, e.retry_after)
                                     
-                                except Exception as e:
-                                    # Catch-all for everything else
-                                    out_packet.addError_ServerException(id, e.__class__.__name__)
-                                    self.logger.exception("RPC Server Exception")
+                                    except JsonRpc_Error as e:
+                                        # Methods may raise a specific JSON RPC error
+                                        e.id = id
+                                        err_packet.errors.append(e)
+                                    
+                                    except TypeError:
+                                        # Raised when arguments mismatch, but also other cases
+                                        # Not a perfect solution, but whatever.
+                                        err_packet.addError_InvalidParams(id)
+                                        self.logger.exception("RPC Server Type Error")
+                                    
+                                    except Exception as e:
+                                        # Catch-all for everything else
+                                        err_packet.addError_ServerException(id, e.__class__.__name__)
+                                        self.logger.exception("RPC Server Exception")
+                                
+                                    if err_packet is not out_packet:
+                                        frame = err_packet.export()
+                                        if frame:
+                                            self.send(frame + '\n')
                         
-                        # Encode the outputs of the RPC requests
-                        out_str = out_packet.export()
-                        self.conn_socket.send(out_str)
+                            # Encode the outputs of the RPC requests
+                            out_str = out_packet.export()
+                            if out_str:
+                                self.send(out_str)
                         
-                        if self.DEBUG_RPC_CONNECTION:
-                            self.logger.debug("RPC Send %i bytes" % len(out_str))
+                            if self.DEBUG_RPC_CONNECTION:
+                                self.logger.debug("RPC Send %i bytes" % len(out_str))
+                    
+                    elif self.drain_deadline is not None:
+                        # All requests from the client have been processed
+                        self.e_alive.clear()
+                        break
                         
-            except socket.error as e:
-                # Socket closed poorly from client
-                if e.errno == errno.ECONNABORTED:
-                    self.logger.error('[%s] Client socket closed before data could be sent', self.name)
-                    self.stop()
-                else:
-                    self.logger.error('[%s] Socket closed with error: %s', self.name, e.errno)
-                    self.stop()
+                except socket.error as e:
+                    # Socket closed poorly from client
+                    if e.errno == errno.ECONNABORTED:
+                        self.logger.error('[%s] Client socket closed before data could be sent', self.name)
+                        self.stop()
+                    else:
+                        self.logger.error('[%s] Socket closed with error: %s', self.name, e.errno)
+                        self.stop()
     
-            except:
-                # Log an exception, close the connection
-                self.logger.exception('[%s] Unhandled Exception', self.name)
-                self.stop()
+                except:
+                    # Log an exception, close the connection
+                    self.logger.exception('[%s] Unhandled Exception', self.name)
+                    self.stop()
+            
+        finally:
+            # Tell the client the connection has ended
+            try:
+                self.conn_socket.close()
+            except socket.error:
+                pass
             
-        self.server._connections.remove(self)
+            self.server.scheduler.removeClient(self)
+            self.server._connections.remove(self)
             
     def stop(self, timeout=None):
         self.e_alive.clear()
         
+    def drain(self, deadline):
+        """
+        Stop once the client has no more requests waiting to be read, or at
+        the deadline. Requests the client sent before the server shut down
+        are still answered.
+        
+        :param deadline: Time to stop at, from `time.time()`
+        :type deadline: float
+        """
+        self.drain_deadline = deadline
+        
+    def send(self, data):
+        """
+        Send all data to the client. The connection socket is non-blocking, so
+        wait for the socket to become writable whenever the send buffer is full
+        """
+        while data:
+            try:
+                sent = self.conn_socket.send(data)
+                data = data[sent:]
+                
+            except socket.error as e:
+                if e.errno in [errno.EWOULDBLOCK, errno.EAGAIN]:
+                    select.select([], [self.conn_socket], [], 1.0)
+                else:
+                    raise
+                
+    def sendStream(self, req, result):
+        """
+        Send a streamed result as a series of newline terminated response
+        frames, one for each item yielded by the generator returned from the
+        method. Results that are not generators are sent as a single chunk.
+        
+        The execution lock is only held while each chunk is produced, so
+        higher priority requests from other connections can run between
+        chunks.
+        """
+        id = req.getID()
+        method = req.getMethod()
+        
+        if inspect.isgenerator(result):
+            chunks = result
+        else:
+            chunks = iter([result])
+        
+        while True:
+            frame = JsonRpcPacket()
+            
+            try:
+                with self.server.scheduler.request(self, method):
+                    chunk = next(chunks)
+                    
+                frame.addStreamResponse(id, chunk)
+                    
+            except StopIteration:
+                frame.addStreamResponse(id, None, 'end')
+                
+            except RpcServerBusy as e:
+                frame.addError_ServerBusy(id, e.retry_after)
+                
+            except JsonRpc_Error as e:
+                e.id = id
+                frame.errors.append(e)
+                
+            except Exception as e:
+                # Terminate the stream with an error frame
+                frame.addError_ServerException(id, e.__class__.__name__)
+                self.logger.exception("RPC Server Exception during stream")
+            
+            self.send(frame.export() + '\n')
+            
+            if len(frame.getResponses()) == 0 or frame.getResponses()[0].getStream() == 'end':
+                break
+            
     def processRequest(self, req):
         id = req.getID()
         method = req.getMethod()
@@ -473,13 +812,20 @@ class RpcConnection(threading.Thread):
         try:
             test_method = self.server.findMethod(method)
             
-            with self.server.rpc_lock:
+            with self.server.scheduler.request(self, method):
                 self.server.rpc_locker = self.conn_socket
                 
-                ret = req.call(test_method)
+                try:
+                    ret = req.call(test_method)
+                    
+                    if inspect.isgenerator(ret) and not req.isStream():
+                        # Streaming not requested, collect the entire result
+                        ret = list(ret)
+                    
+                    return ret
                 
-                self.server.rpc_locker = None
-                return ret
+                finally:
+                    self.server.rpc_locker = None
             
         # Bubble all exceptions up to the calling function
         except RpcMethodNotFound:
@@ -0,0 +1,243 @@
+import threading
+import collections
+import logging
+import time
+
+"""
+Sample Hub
+----------
+Lets several widgets show the same instrument value without reading it from
+the instrument more than once. Widgets subscribe to a method with the interval
+they need, the hub reads each method once at the fastest interval requested by
+an active subscription and hands every reading to all subscribers::
+
+    hub = SampleHub(instrument)
+    hub.start()
+
+    lcd = vw_entry.vw_LCD(master, get_cb=hub.subscribe('getMeasurement', 1.0),
+                          update_interval=1000)
+
+    plot = vw_plots.vw_Plot(master)
+    plot.addPlot('Measurement', hub.subscribe('getMeasurement', 0.1, depth=100))
+
+Readings are taken in the hub thread. Subscriptions only store them, widgets
+collect them from the Tk thread.
+"""
+
+class Subscription(object):
+    """
+    A subscriber's view of one sampled method. Calling the subscription returns
+    the newest value, so it can be used wherever a get callback is expected.
+
+    :param hub: Sample hub
+    :type hub: SampleHub
+    :param method: Method name
+    :type method: str
+    :param interval: Minimum time in seconds between samples for this
+                     subscriber
+    :type interval: float
+    :param depth: Number of samples to keep
+    :type depth: int
+    """
+
+    def __init__(self, hub, method, interval, depth=1, active=True):
+        self.hub = hub
+        self.method = method
+        self.interval = float(interval)
+        self.active = active
+
+        self.samples = collections.deque(maxlen=max(1, depth))
+        self.lastTime = None
+        self.error = None
+
+        self._lock = threading.Lock()
+
+    def _put(self, timestamp, value, error=None):
+        # Called from the hub thread
+        with self._lock:
+            if error is not None:
+                self.error = error
+                return
+
+            # Slower subscribers only get every n-th sample
+            if self.lastTime is not None and timestamp - self.lastTime < self.interval * 0.95:
+                return
+
+            self.lastTime = timestamp
+            self.error = None
+            self.samples.append((timestamp, value))
+
+    def get(self):
+        """
+        Get the newest value. Does not block.
+
+        :returns: Newest value or None if no sample has been taken yet
+        :raises: Exception raised by the last read, if it failed
+        """
+        with self._lock:
+            if self.error is not None:
+                raise self.error
+
+            if len(self.samples) > 0:
+                return self.samples[-1][1]
+
+    def __call__(self):
+        return self.get()
+
+    def getSamples(self, since=None):
+        """
+        Get the stored samples
+
+        :param since: Only return samples taken after this time
+        :type since: float
+        :returns: list of (timestamp, value) tuples, oldest first
+        """
+        with self._lock:
+            return [sample for sample in self.samples
+                    if since is None or sample[0] > since]
+
+    def pause(self):
+        """
+        Stop sampling for this subscriber. The hub slows down or stops reading
+        the method if no other subscriber needs it.
+        """
+        self.active = False
+
+    def resume(self):
+        self.active = True
+        self.hub.wakeup()
+
+    def cancel(self):
+        self.hub.unsubscribe(self)
+
+class SampleHub(threading.Thread):
+    """
+    Reads methods of an object on behalf of all subscribers. Each method is
+    read once per interval of its fastest active subscription.
+
+    :param obj: Instrument or other object to read
+    :type obj: object
+    :param logger: Logger instance if you wish to override the internal instance
+    :type logger: Logging.logger
+    """
+
+    def __init__(self, obj, logger=logging):
+        threading.Thread.__init__(self, name='SampleHub')
+        self.daemon = True
+
+        self.obj = obj
+        self.logger = logger
+
+        # Method name -> list of subscriptions
+        self.subscriptions = {}
+        # Method name -> time of the last read
+        self.lastRead = {}
+        # Method name -> number of reads
+        self.reads = {}
+
+        self._lock = threading.Lock()
+
+        self.e_alive = threading.Event()
+        self.e_alive.set()
+        self.e_wakeup = threading.Event()
+
+    def subscribe(self, method, interval, depth=1, active=True):
+        """
+        Subscribe to a method of the object
+
+        :param method: Method name (e.g. 'getMeasurement')
+        :type method: str
+        :param interval: Time in seconds between samples
+        :type interval: float
+        :param depth: Number of samples kept by the subscription
+        :type depth: int
+        :param active: Start sampling immediately
+        :type active: bool
+        :returns: Subscription
+        """
+        sub = Subscription(self, method, interval, depth, active)
+
+        with self._lock:
+            self.subscriptions.setdefault(method, []).append(sub)
+
+        self.wakeup()
+
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self.subscriptions.get(sub.method, [])
+            if sub in subs:
+                subs.remove(sub)
+            if len(subs) == 0:
+                self.subscriptions.pop(sub.method, None)
+
+    def getInterval(self, method):
+        """
+        Get the interval a method is read at
+
+        :returns: float or None if no active subscription needs the method
+        """
+        with self._lock:
+            intervals = [sub.interval for sub in self.subscriptions.get(method, []) if sub.active]
+
+        if len(intervals) > 0:
+            return min(intervals)
+
+    def getStatistics(self):
+        """
+        :returns: dict - Method name -> number of reads from the object
+        """
+        with self._lock:
+            return dict(self.reads)
+
+    def wakeup(self):
+        self.e_wakeup.set()
+
+    def run(self):
+        while self.e_alive.is_set():
+            now = time.time()
+            next_due = now + 0.5
+
+            with self._lock:
+                methods = self.subscriptions.keys()
+
+            for method in methods:
+                interval = self.getInterval(method)
+                if interval is None:
+                    continue
+
+                due = self.lastRead.get(method, 0.0) + interval
+
+                if due <= now:
+                    self.sample(method)
+                    due = self.lastRead[method] + interval
+
+                next_due = min(next_due, due)
+
+            self.e_wakeup.wait(max(0.0, next_due - time.time()))
+            self.e_wakeup.clear()
+
+    def sample(self, method):
+        """
+        Read a method once and pass the value to all of its subscribers
+        """
+        timestamp = time.time()
+        self.lastRead[method] = timestamp
+
+        value, error = None, None
+        try:
+            value = getattr(self.obj, method)()
+        except Exception as e:
+            error = e
+
+        with self._lock:
+            self.reads[method] = self.reads.get(method, 0) + 1
+            subs = [sub for sub in self.subscriptions.get(method, []) if sub.active]
+
+        for sub in subs:
+            sub._put(timestamp, value, error)
+
+    def stop(self):
+        self.e_alive.clear()
+        self.wakeup()
@@ -1,39 +1,649 @@
 import Tkinter as Tk
 
+import threading
+import logging
+import Queue
+import time
+import collections
+
 __all__ = ["vw_entry", "vw_info", "vw_plots", "vw_state"]
 
+class Future(object):
+    """
+    Result of a call submitted to an :class:`UpdateScheduler`. The call runs
+    in a worker thread, done callbacks run in the Tk thread on the next tick
+    after the call returns.
+
+    Python 2 has no `concurrent.futures`, this has the parts of its interface
+    the widgets need.
+    """
+
+    def __init__(self, fn, args=(), kwargs=None):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs or {}
+
+        self.t_start = time.time()
+        self.t_done = None
+
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+        self._dispatched = False
+        self._done = threading.Event()
+
+    def run(self):
+        """
+        Run the call. Called from a worker thread.
+        """
+        try:
+            self._result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            self._exception = e
+
+        self.t_done = time.time()
+        self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Get the return value of the call, waiting for it if necessary
+
+        :raises: Exception raised by the call
+        :raises: RuntimeError if the call has not returned within the timeout
+        """
+        if self.exception(timeout) is not None:
+            raise self._exception
+
+        return self._result
+
+    def exception(self, timeout=None):
+        """
+        Get the exception raised by the call, waiting for it if necessary
+
+        :returns: Exception or None if the call returned normally
+        :raises: RuntimeError if the call has not returned within the timeout
+        """
+        if not self._done.wait(timeout):
+            raise RuntimeError('Call has not returned')
+
+        return self._exception
+
+    def add_done_callback(self, fn):
+        """
+        Call `fn` with the future in the Tk thread once the call has returned.
+        Must be called from the Tk thread.
+        """
+        if self._dispatched:
+            fn(self)
+        else:
+            self._callbacks.append(fn)
+
+    def _dispatch(self, logger=logging):
+        # Called from the Tk thread
+        self._dispatched = True
+
+        callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception:
+                logger.exception('Exception in future callback')
+
+class UpdateScheduler(object):
+    """
+    Updates all self-updating widgets of a Tk root from a single timer.
+
+    Every tick, the widgets that are due are collected into one batch. The
+    getters of the batch (:func:`vw_Base.fetch`) run together on a small pool
+    of worker threads, so a slow instrument does not block the Tk thread and
+    widgets of different instruments are read in parallel. On the next tick,
+    all results that have arrived are applied to the widgets in one pass on
+    the Tk thread (:func:`vw_Base.apply`).
+
+    Fetches of widgets that read from the same instrument
+    (:func:`vw_Base.getOwner`) run one at a time, the others wait without
+    holding a worker. When all workers are busy, for example because several
+    instruments do not respond, more workers are started, up to
+    `max_workers`. Workers above `workers` exit once no calls are queued.
+
+    A widget that is due again while its previous fetch has not returned is
+    skipped, counted as an overrun and shown as stale. A widget whose fetch
+    takes longer than `PENDING_DELAY` is shown as pending. Ticks that run more
+    than one tick interval late, because the Tk thread was busy, are counted
+    as late.
+
+    Other calls can be run on the workers with :func:`submit`.
+
+    The scheduler uses Tk timers, so it must only be used from the Tk thread
+    it was created in. Only the calls themselves run in the workers.
+
+    Use :func:`getScheduler` to get the scheduler of a widget.
+
+    :param root: Tk root
+    :type root: Tk.Tk
+    :param tick: Time between ticks in milliseconds
+    :type tick: int
+    :param workers: Number of worker threads
+    :type workers: int
+    :param max_workers: Maximum number of worker threads
+    :type max_workers: int
+    :param logger: Logger instance if you wish to override the internal instance
+    :type logger: Logging.logger
+    """
+
+    TICK = 50 # ms
+    WORKERS = 4
+    MAX_WORKERS = 16
+
+    # Fetches that take longer are shown as pending
+    PENDING_DELAY = 0.25 # s
+
+    def __init__(self, root, tick=TICK, workers=WORKERS,
+                 max_workers=MAX_WORKERS, logger=logging):
+        self.root = root
+        self.tick_interval = tick
+        self.logger = logger
+
+        self.thread = threading.current_thread()
+
+        # Widget -> [interval (s), next due time]
+        self.widgets = {}
+        # Widgets to update once in the next batch
+        self.requests = set()
+        # Widget -> Future of the fetch in progress
+        self.pending = {}
+        # Futures that have not been dispatched yet
+        self.running = set()
+        # id(owner) -> jobs waiting for the fetch of the owner in progress
+        self.owners = {}
+
+        self.batches = []
+        self.tick_job = None
+        self.tick_due = None
+
+        self.stats = {'ticks': 0,
+                      'late_ticks': 0,
+                      'batches': 0,
+                      'fetches': 0,
+                      'submits': 0,
+                      'overruns': 0,
+                      'last_batch_time': 0.0,
+                      'max_batch_time': 0.0}
+
+        # (future, batch, owner) to the workers
+        self.jobs = Queue.Queue()
+        # Finished futures from the workers
+        self.results = Queue.Queue()
+
+        # Guards the worker counts and owners, used by the workers
+        self._lock = threading.Lock()
+        self.max_workers = max(workers, max_workers)
+        self.workers = 0
+        self.idle_workers = 0
+
+        with self._lock:
+            for i in range(workers):
+                self._startWorker(extra=False)
+
+    @classmethod
+    def getScheduler(cls, widget):
+        """
+        Get the scheduler for the Tk root of a widget, creating it on first use
+
+        :returns: UpdateScheduler
+        """
+        root = widget._root()
+
+        scheduler = getattr(root, '_vw_scheduler', None)
+        if scheduler is None:
+            scheduler = cls(root)
+            root._vw_scheduler = scheduler
+
+        return scheduler
+
+    def register(self, widget, interval):
+        """
+        Update a widget periodically
+
+        :param interval: Update interval in milliseconds
+        :type interval: int
+        """
+        self.widgets[widget] = [interval / 1000.0, time.time()]
+        self._start()
+
+    def unregister(self, widget):
+        self.widgets.pop(widget, None)
+        self.requests.discard(widget)
+
+    def request(self, widget):
+        """
+        Update a widget once, in the next batch
+        """
+        self.requests.add(widget)
+        self._start()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Run `fn(*args, **kwargs)` in a worker thread. Must be called from the
+        Tk thread.
+
+        :returns: Future
+        """
+        self._checkThread()
+
+        future = Future(fn, args, kwargs)
+        self._put(future)
+        self.stats['submits'] += 1
+
+        return future
+
+    def fetch(self, widget):
+        """
+        Start a fetch of a widget now, outside of the batches. If a fetch of
+        the widget is already in progress, no new one is started.
+
+        :returns: Future of the fetch
+        """
+        self._checkThread()
+
+        future = self.pending.get(widget)
+
+        if future is None:
+            future = self._fetch(widget)
+            self.stats['fetches'] += 1
+
+        return future
+
+    def getStatistics(self):
+        """
+        :returns: dict - ticks, late ticks, batches, fetches, submits,
+                  overruns, batch times in seconds and number of workers
+        """
+        stats = dict(self.stats)
+        stats['widgets'] = len(self.widgets)
+        stats['workers'] = self.workers
+
+        return stats
+
+    def _checkThread(self):
+        assert threading.current_thread() is self.thread, \
+            'UpdateScheduler must be used from the Tk thread'
+
+    def _start(self):
+        if self.tick_job is None:
+            self.tick_due = time.time() + self.tick_interval / 1000.0
+            self.tick_job = self.root.after(self.tick_interval, self.tick)
+
+    def _put(self, future, batch=None, owner=None):
+        self.running.add(future)
+
+        with self._lock:
+            if owner is None:
+                self._queue((future, batch, None))
+
+            elif owner in self.owners:
+                # Runs when the fetch in progress for the owner returns
+                self.owners[owner].append((future, batch, owner))
+
+            else:
+                self.owners[owner] = collections.deque()
+                self._queue((future, batch, owner))
+
+        self._start()
+
+    def _queue(self, job):
+        # Called with the lock held
+        self.jobs.put(job)
+
+        if self.jobs.qsize() > self.idle_workers and self.workers < self.max_workers:
+            self._startWorker(extra=True)
+
+    def _startWorker(self, extra):
+        # Called with the lock held
+        self.workers += 1
+
+        worker = threading.Thread(target=self._worker, args=(extra,),
+                                  name='UpdateWorker')
+        worker.daemon = True
+        worker.start()
+
+    def _fetch(self, widget, batch=None):
+        future = Future(widget.fetch)
+        future.add_done_callback(lambda future: self._fetchDone(widget, future))
+
+        # Keyed by id, owners are not necessarily hashable. The owner is kept
+        # alive by the widget while its jobs exist.
+        owner = widget.getOwner()
+        if owner is not None:
+            owner = id(owner)
+
+        self.pending[widget] = future
+        self._put(future, batch, owner)
+
+        return future
+
+    def _fetchDone(self, widget, future):
+        self.pending.pop(widget, None)
+
+        if not self._exists(widget):
+            self.unregister(widget)
+            return
+
+        try:
+            error = future.exception()
+
+            if error is None:
+                widget.apply(future.result())
+                widget.setStyle(widget.STYLE_NORMAL)
+            else:
+                widget.apply_error(error)
+                widget.setStyle(widget.STYLE_STALE)
+
+        except Exception:
+            self.logger.exception('Exception during widget update')
+
+    def _worker(self, extra):
+        while True:
+            if extra:
+                # Started because all workers were busy, not needed once the
+                # queue is empty
+                try:
+                    job = self.jobs.get_nowait()
+                except Queue.Empty:
+                    with self._lock:
+                        self.workers -= 1
+                    return
+
+            else:
+                with self._lock:
+                    self.idle_workers += 1
+
+                job = self.jobs.get()
+
+                with self._lock:
+                    self.idle_workers -= 1
+
+            future, batch, owner = job
+
+            future.run()
+
+            if owner is not None:
+                with self._lock:
+                    waiting = self.owners[owner]
+
+                    if len(waiting) > 0:
+                        self._queue(waiting.popleft())
+                    else:
+                        del self.owners[owner]
+
+            self.results.put(future)
+            if batch is not None:
+                batch.done()
+
+    def tick(self):
+        """
+        Apply finished batches and start a batch of the widgets that are due.
+        Runs in the Tk thread.
+        """
+        now = time.time()
+
+        self.tick_job = None
+        self.stats['ticks'] += 1
+        if now - self.tick_due > self.tick_interval / 1000.0:
+            self.stats['late_ticks'] += 1
+
+        self._apply()
+
+        for batch in [batch for batch in self.batches if batch.isDone()]:
+            self.batches.remove(batch)
+
+            elapsed = batch.t_done - batch.t_start
+            self.stats['last_batch_time'] = elapsed
+            self.stats['max_batch_time'] = max(self.stats['max_batch_time'], elapsed)
+
+        for widget, future in self.pending.items():
+            if now - future.t_start > self.PENDING_DELAY:
+                self._setStyle(widget, vw_Base.STYLE_PENDING)
+
+        due = set(self.requests)
+        self.requests.clear()
+
+        for widget, entry in self.widgets.items():
+            interval, next_due = entry
+
+            if next_due <= now:
+                # Keep to the schedule, but do not try to catch up
+                entry[1] = max(next_due + interval, now)
+                due.add(widget)
+
+        fetch = []
+        for widget in due:
+            if not self._exists(widget):
+                self.unregister(widget)
+
+            elif widget in self.pending:
+                self.stats['overruns'] += 1
+                self._setStyle(widget, vw_Base.STYLE_STALE)
+
+            elif widget.hasFetch():
+                fetch.append(widget)
+
+            else:
+                # Widgets without a separate getter update on the Tk thread
+                try:
+                    widget.cb_update()
+                except Exception:
+                    self.logger.exception('Exception during widget update')
+
+        if len(fetch) > 0:
+            batch = UpdateBatch(fetch)
+            self.batches.append(batch)
+            self.stats['batches'] += 1
+            self.stats['fetches'] += len(fetch)
+
+            for widget in fetch:
+                self._fetch(widget, batch)
+
+        if (len(self.widgets) > 0 or len(self.requests) > 0 or
+                len(self.batches) > 0 or len(self.running) > 0):
+            self._start()
+
+    def _apply(self):
+        # Apply all results that have arrived in one pass
+        futures = []
+        try:
+            while True:
+                futures.append(self.results.get_nowait())
+        except Queue.Empty:
+            pass
+
+        for future in futures:
+            self.running.discard(future)
+            future._dispatch(self.logger)
+
+    def _setStyle(self, widget, style):
+        # Stale is only cleared by a new value
+        if widget.style == vw_Base.STYLE_STALE and style == vw_Base.STYLE_PENDING:
+            return
+
+        try:
+            widget.setStyle(style)
+        except Exception:
+            self.logger.exception('Exception while setting widget style')
+
+    def _exists(self, widget):
+        try:
+            return bool(widget.winfo_exists())
+        except Tk.TclError:
+            return False
+
+class UpdateBatch(object):
+    """
+    Widgets fetched together in one tick. Used to time how long the fetches
+    of a tick take.
+    """
+
+    def __init__(self, widgets):
+        self.remaining = len(widgets)
+        self.t_start = time.time()
+        self.t_done = None
+
+        self._lock = threading.Lock()
+
+    def done(self):
+        with self._lock:
+            self.remaining -= 1
+
+            if self.remaining == 0:
+                self.t_done = time.time()
+
+    def isDone(self):
+        with self._lock:
+            return self.remaining == 0
+
 class vw_Base(Tk.Frame):
+    """
+    Base class for view widgets.
+
+    Self-updating widgets set `update_interval` in milliseconds and call
+    :func:`_schedule_update`. Updates are run by the :class:`UpdateScheduler`
+    of the Tk root. Widgets that read from an instrument should implement
+    :func:`fetch` and :func:`apply` so the read happens off the Tk thread,
+    other widgets implement :func:`cb_update`.
+
+    While a fetch is slow the value is shown as pending, if it could not be
+    updated on time or the fetch failed it is shown as stale, until the next
+    value arrives. The style is applied to the foreground of `l_data`, widgets
+    without one can override :func:`setStyle`.
+    """
     PIXELS_PER_X = 30
     PIXELS_PER_Y = 40
-    
+
+    STYLE_NORMAL = 'normal'
+    STYLE_PENDING = 'pending'
+    STYLE_STALE = 'stale'
+
+    PENDING_COLOR = 'gray50'
+    STALE_COLOR = 'dark orange'
+
     def __init__(self, master, units_x=8, units_y=1):
         Tk.Frame.__init__(self, master, padx=2, pady=2, bd=1)
-        
+
         width = units_x * self.PIXELS_PER_X
         height = units_y * self.PIXELS_PER_Y
-        
+
         self.config(width=width, height=height)
         self.pack_propagate(0)
-        
+
         self.update_interval = None
-        
+
+        self.style = self.STYLE_NORMAL
+        self._normal_fg = None
+
     def _schedule_update(self):
-        if self.update_interval is not None:
-            self.after(self.update_interval, self.e_update)
-        else:
-            try:
-                self.after(100, self.cb_update)
-            except:
-                pass
-            
+        try:
+            scheduler = UpdateScheduler.getScheduler(self)
+
+            if self.update_interval is not None:
+                scheduler.register(self, self.update_interval)
+            else:
+                # Initial update only
+                scheduler.request(self)
+        except:
+            pass
+
     def e_update(self):
         """
         Event to handle self-updating
         """
         self.cb_update()
-        
-        if self.update_interval is not None:
-            self._schedule_update()
-            
+
+    def getOwner(self):
+        """
+        Get the object :func:`fetch` reads from, usually the instrument.
+        Fetches of widgets with the same owner run one at a time, so an
+        instrument that does not respond holds at most one worker. By default
+        the owner of a bound `get_cb`.
+
+        :returns: object or None if the fetch can run in parallel to any other
+        """
+        return getattr(getattr(self, 'get_cb', None), '__self__', None)
+
+    def hasFetch(self):
+        """
+        Check if the widget separates reading its value (:func:`fetch`) from
+        displaying it (:func:`apply`)
+        """
+        return self.__class__.fetch.im_func is not vw_Base.fetch.im_func
+
+    def fetch(self):
+        """
+        Read the value to display. Runs in a worker thread, must not access
+        any Tk objects.
+        """
+        raise NotImplementedError
+
+    def apply(self, value):
+        """
+        Display a value returned by :func:`fetch`. Runs in the Tk thread.
+        """
+        raise NotImplementedError
+
+    def apply_error(self, error):
+        """
+        Called in the Tk thread when :func:`fetch` raised an exception
+        """
+        pass
+
+    def getAsync(self):
+        """
+        Fetch the value in a worker thread and apply it when it arrives. Does
+        not block.
+
+        :returns: Future of the fetch
+        """
+        return UpdateScheduler.getScheduler(self).fetch(self)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Run a call in a worker thread. Must be called from the Tk thread. Use
+        `add_done_callback` on the returned future to handle the result in the
+        Tk thread.
+
+        :returns: Future
+        """
+        return UpdateScheduler.getScheduler(self).submit(fn, *args, **kwargs)
+
+    def setStyle(self, style):
+        """
+        Show the value as normal, pending or stale
+
+        :param style: STYLE_NORMAL, STYLE_PENDING or STYLE_STALE
+        :type style: str
+        """
+        if style == self.style:
+            return
+        self.style = style
+
+        l_data = getattr(self, 'l_data', None)
+        if l_data is None:
+            return
+
+        if self._normal_fg is None:
+            self._normal_fg = l_data.cget('fg')
+
+        if style == self.STYLE_PENDING:
+            l_data.config(fg=self.PENDING_COLOR)
+        elif style == self.STYLE_STALE:
+            l_data.config(fg=self.STALE_COLOR)
+        else:
+            l_data.config(fg=self._normal_fg)
+
     def cb_update(self):
-        raise NotImplementedError
\ No newline at end of file
+        if self.hasFetch():
+            self.getAsync()
+        else:
+            raise NotImplementedError
@@ -87,18 +87,19 @@ class vw_Text(vw_Base_Entry):
         # Also trigger the callback
         cb_set()
     
-    def cb_update(self):
-        val = self.get_cb()
-        self.val.set(val)
-        
-    def cb_get(self):
-        try:
-            val = self.get_cb()
-            
+    def fetch(self):
+        if self.get_cb is not None:
+            return self.get_cb()
+    
+    def apply(self, val):
+        if val is not None:
             self.val.set(val)
             
-        except:
-            self.l_data.config(bg='red')
+    def apply_error(self, error):
+        self.l_data.config(bg='red')
+        
+    def cb_get(self):
+        self.getAsync()
         
     def cb_set(self):
         try:
@@ -151,17 +152,16 @@ class vw_List(vw_Base_Entry):
         self.val.set(newval)
         self.cb_set()
         
-    def cb_update(self):
-        self.cb_get()
+    def fetch(self):
+        if self.get_cb is not None:
+            return self.get_cb()
+    
+    def apply(self, val):
+        if val is not None:
+            self.val.set(val)
         
     def cb_get(self):
-        try:
-            val = self.get_cb()
-            
-            self.val.set(val)
-            
-        except:
-            pass
+        self.getAsync()
         
     def cb_set(self):
         try:
@@ -174,7 +174,8 @@ class vw_LCD(vw_Base_Entry):
     
     def __init__(self, master, get_cb, **kwargs):
         """
-        :param get_cb: Callback function for get
+        :param get_cb: Callback function for get, or a subscription from a 
+                       :class:`common.sampling.SampleHub`
         :type get_gb: method
         :param units: Units
         :type units: str
@@ -210,7 +211,10 @@ class vw_LCD(vw_Base_Entry):
     def setUnits(self, units):
         self.units.set(units)
         
-    def cb_update(self):
-        data = self.get_cb()
+    def fetch(self):
+        return self.get_cb()
         
-        self.data.set(data)
\ No newline at end of file
+    def apply(self, data):
+        # Subscriptions return None until the first sample arrives
+        if data is not None:
+            self.data.set(data)
\ No newline at end of file
@@ -22,6 +22,13 @@ import Tkinter as Tk
 import time
 import threading
 
+from common.lazyimport import lazy_import
+from common.sampling import Subscription
+from common.rpc import RpcClient
+
+matplotlib = lazy_import('matplotlib', on_import=lambda mpl: mpl.use('TkAgg'))
+backend_tkagg = lazy_import('matplotlib.backends.backend_tkagg')
+
 class vw_Plot(vw_Base):
     """
     Plotting Widget using matplotlib.
@@ -58,14 +65,6 @@ class vw_Plot(vw_Base):
         self.nextID = 0
         
         try:
-            # Dependent Imports
-            #import numpy as np
-    
-            import matplotlib
-            matplotlib.use('TkAgg')
-            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-            from matplotlib.backend_bases import key_press_handler
-            
             # Initialize Data
             self.time_axis = [x/self.sample_time for x in xrange(0, self.max_samples)]
             #self.time_axis = np.arange(0.0, self.max_samples * self.sample_time, self.sample_time)
@@ -79,7 +78,7 @@ class vw_Plot(vw_Base):
             self.subplot_1 = self.fig.add_subplot(1, 1, 1)
             self.subplot_1.grid(True)
             self.fig.suptitle(self.title)
-            self.canvas = FigureCanvasTkAgg(self.fig, master=self)
+            self.canvas = backend_tkagg.FigureCanvasTkAgg(self.fig, master=self)
             self.canvas.show()
             self.canvas.get_tk_widget().grid(row=0, column=0)
     
@@ -114,12 +113,20 @@ class vw_Plot(vw_Base):
         
         :param name: Dataset name
         :type name: str
-        :param method: Data method
-        :type method: str
+        :param method: Data method, or a subscription from a 
+                       :class:`common.sampling.SampleHub`, which is only
+                       active while the plot is sampling
+        :type method: method
         """
         with self.plot_lock:
             ret = {}
             
+            if isinstance(method, Subscription):
+                ret['type'] = 'subscription'
+                
+                if not self.sampling:
+                    method.pause()
+            
             ret['method'] = method
             ret['data'] = [0.0] * self.max_samples
             ret['dataset'] = self.subplot_1.plot(self.time_axis, ret['data'])
@@ -168,6 +175,9 @@ class vw_Plot(vw_Base):
                 method = plot.get('method')
                 
                 obj.stopCollector(method)
+                
+            elif plot.get('type') == 'subscription':
+                plot.get('method').cancel()
         
     def startSampling(self):
         """
@@ -179,6 +189,9 @@ class vw_Plot(vw_Base):
                 method = plot_attr.get('method')
                 
                 obj.startCollector(method, self.sample_time, self.max_samples)
+                
+            elif plot_attr.get('type') == 'subscription':
+                plot_attr.get('method').resume()
             
         self.sampling = True
         
@@ -199,6 +212,9 @@ class vw_Plot(vw_Base):
                 
                 obj.stopCollector(method)
                 
+            elif plot_attr.get('type') == 'subscription':
+                plot_attr.get('method').pause()
+                
         if self.sample_thread is not None:
             self.sample_thread.shutdown()
             self.sample_thread = None
@@ -256,7 +272,10 @@ class vw_Plot(vw_Base):
                         if plot_attr.get('type') == 'collector':
                             obj = plot_attr.get('object')
                             method = plot_attr.get('method')
-                            new_data = obj.getCollector(method, last_time)
+                            new_data = self.getCollector(obj, method, last_time)
+                        elif plot_attr.get('type') == 'subscription':
+                            # Samples are read by the sample hub
+                            new_data = plot_attr.get('method').getSamples(last_time)
                         else:
                             method = plot_attr.get('method')
                             new_data = [(time.time(), method())]
@@ -273,6 +292,24 @@ class vw_Plot(vw_Base):
                 
                 time.sleep(self.plot_object.sample_time)
                 
+        def getCollector(self, obj, method, last_time):
+            """
+            Get the samples collected since `last_time`. Remote instruments
+            stream the samples on a separate connection, so other widgets can
+            use the instrument while a large collector buffer is received.
+            
+            :returns: list of (timestamp, sample) tuples
+            """
+            if isinstance(obj, RpcClient):
+                new_data = []
+                for chunk in obj.stream('getCollector', method, last_time):
+                    new_data.extend(chunk)
+                    
+                return new_data
+            
+            else:
+                return obj.getCollector(method, last_time)
+                
         def shutdown(self):
             self.e_alive.clear()
         
\ No newline at end of file
@@ -111,9 +111,10 @@ class vw_BinaryFields(vw_Base):
         self.update_interval = kwargs.get('update_interval', None)
         self._schedule_update()
 
-    def cb_update(self):
-        field_vals = self.cb_get()
+    def fetch(self):
+        return self.cb_get()
         
+    def apply(self, field_vals):
         for obj in self.field_objects.values():
             obj.cb_update(field_vals)
 